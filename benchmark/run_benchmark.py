@@ -0,0 +1,364 @@
+"""
+@file run_benchmark.py
+@brief 合成データで 制御点検出・calibrateCamera・undistort・動画連結 の性能を計測する
+
+合成した画像・動画は既知のカメラ行列・レンズ歪みから生成しているため、処理速度に加えて真値との誤差も出力する
+計測結果は json に書き出し、バージョン間の比較に用いる
+    $ python benchmark/run_benchmark.py -o benchmark_result.json
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmark.synthetic import (
+    CHECKER_BOARD, SYMMETRIC_CIRCLES_GRID, ASYMMETRIC_CIRCLES_GRID,
+    SyntheticBoard, SyntheticCamera, make_images, make_video)
+
+# pattern毎のボード設定 (grid_num_tuple, grid_interval [mm], circle_radius [mm])
+BOARD_DICT = {
+    CHECKER_BOARD: ((9, 6), 25, None),
+    SYMMETRIC_CIRCLES_GRID: ((7, 5), 30, 6.0),
+    ASYMMETRIC_CIRCLES_GRID: ((4, 11), 40, 6.0),
+}
+PATTERN_NAME_DICT = {
+    CHECKER_BOARD: "checker_board",
+    SYMMETRIC_CIRCLES_GRID: "symmetric_circles_grid",
+    ASYMMETRIC_CIRCLES_GRID: "asymmetric_circles_grid",
+}
+DISTANCE = 600.0    # カメラからボードまでの距離 [mm]
+# cli.py の起動時間の計測 (名前, ROOT_DIR で実行する python の引数)。いずれも cv2・numpy を import せずに終わること
+STARTUP_CASE_LIST = [
+    ("python", ["-c", "pass"]),
+    ("cli.py --help", ["cli.py", "--help"]),
+    ("cli.py calibrate --help", ["cli.py", "calibrate", "--help"]),
+    ("cli.py calc (引数の誤り)", ["cli.py", "calc"]),
+]
+HEAVY_MODULE_LIST = ["cv2", "numpy", "tqdm", "yaml"]
+
+
+def peak_rss_mb():
+    """プロセスの最大常駐メモリ [MB]"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB, macOS は byte 単位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def make_result(name, elapsed, count, unit, **kwargs):
+    result = {
+        "name": name,
+        "seconds": elapsed,
+        "count": count,
+        "throughput": count / elapsed if elapsed > 0 else None,
+        "unit": unit,
+    }
+    result.update(kwargs)
+    return result
+
+
+def corner_error(corners, truth):
+    """検出した制御点と真値の誤差 [px]（ボードの対称性で逆順に検出される場合も考慮）"""
+    corners = np.asarray(corners).reshape(-1, 2)
+    truth = np.asarray(truth).reshape(-1, 2)
+    return min(
+        np.linalg.norm(corners - truth, axis=1).mean(),
+        np.linalg.norm(corners[::-1] - truth, axis=1).mean())
+
+
+def intrinsics_error(camera_matrix, distortion, truth_matrix, truth_distortion):
+    return {
+        "fx_rel_error": abs(camera_matrix[0, 0] / truth_matrix[0, 0] - 1),
+        "fy_rel_error": abs(camera_matrix[1, 1] / truth_matrix[1, 1] - 1),
+        "cx_error_px": abs(camera_matrix[0, 2] - truth_matrix[0, 2]),
+        "cy_error_px": abs(camera_matrix[1, 2] - truth_matrix[1, 2]),
+        "distortion_abs_error": np.abs(
+            np.ravel(distortion)[:5] - np.ravel(truth_distortion)[:5]).tolist(),
+    }
+
+
+def _run_case(work_dir, func_name, kwargs):
+    """子プロセスで1つの計測を実行（ピークメモリを計測毎に分けるため）"""
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT_DIR)
+    results = globals()[func_name](**kwargs)
+    rss = peak_rss_mb()
+    for result in results:
+        result["peak_rss_mb"] = rss
+    return results
+
+
+def bench_calculator(pattern, img_dir, num_workers):
+    """CameraParamCalculator.calculate / 制御点検出 / cv2.calibrateCamera"""
+    from calc_camera_param import make_calculator
+    from utils.cfg_manager import CalculationParameters
+
+    name = PATTERN_NAME_DICT[pattern]
+    params = CalculationParameters(os.path.join("config", "calc_camera_param_{}.yaml".format(name)))
+    truth = np.load(os.path.join(img_dir, "truth.npz"))
+    img_list = [os.path.join(img_dir, "{:04d}.png".format(i)) for i in range(len(truth["corners"]))]
+    results = []
+
+    calc = make_calculator(pattern, params)
+    start = time.perf_counter()
+    camera_matrix, distortion, _, _ = calc.calculate(img_list, save_result=False)
+    elapsed = time.perf_counter() - start
+    results.append(make_result(
+                            "calculate/{}".format(name), elapsed, len(img_list), "images/s",
+                            num_workers=num_workers,
+                            accuracy=intrinsics_error(camera_matrix, distortion,
+                                                      truth["camera_matrix"], truth["distortion"])))
+
+    start = time.perf_counter()
+    detected = calc._detect_all(img_list)
+    elapsed = time.perf_counter() - start
+    errors = [corner_error(corners, truth_corners)
+              for (ret, corners, _), truth_corners in zip(detected, truth["corners"]) if ret]
+    results.append(make_result(
+                            "detection/{}".format(name), elapsed, len(img_list), "images/s",
+                            num_workers=num_workers,
+                            accuracy={
+                                "detected_ratio": len(errors) / len(img_list),
+                                "mean_corner_error_px": float(np.mean(errors)) if errors else None,
+                                "max_corner_error_px": float(np.max(errors)) if errors else None,
+                            }))
+
+    obj_coords = [calc._board_coords for ret, _, _ in detected if ret]
+    img_coords = [corners for ret, corners, _ in detected if ret]
+    img_size = detected[-1][2]
+    start = time.perf_counter()
+    rms, camera_matrix, distortion, _, _ = cv2.calibrateCamera(obj_coords, img_coords, img_size, None, None)
+    elapsed = time.perf_counter() - start
+    accuracy = intrinsics_error(camera_matrix, distortion, truth["camera_matrix"], truth["distortion"])
+    accuracy["reprojection_rms_px"] = rms
+    results.append(make_result(
+                            "calibrateCamera/{}".format(name), elapsed, len(img_coords), "views/s",
+                            accuracy=accuracy))
+    return results
+
+
+def bench_undistort(video_path, truth_path):
+    """Calibration.execute（画像1枚毎）"""
+    from calibration import Calibration
+
+    truth = np.load(truth_path)
+    calib = Calibration()
+    movie = cv2.VideoCapture(video_path)
+    frame_list = []
+    while True:
+        ret, img = movie.read()
+        if not ret:
+            break
+        frame_list.append(img)
+    movie.release()
+
+    start = time.perf_counter()
+    for img in frame_list:
+        calib.execute(img)
+    elapsed = time.perf_counter() - start
+
+    # 中央部で真値（レンズ歪みのない画像）と比較
+    error_list = []
+    for index, ideal_img in zip(truth["index"], truth["ideal"]):
+        calib.execute(frame_list[index])
+        h, w = ideal_img.shape[:2]
+        crop = (slice(h // 10, h - h // 10), slice(w // 10, w - w // 10))
+        diff = calib.calibrated_img[crop].astype(np.float64) - ideal_img[crop]
+        error_list.append(float(np.abs(diff).mean()))
+    return [make_result(
+                        "Calibration.execute", elapsed, len(frame_list), "frames/s",
+                        accuracy={"mean_abs_error_vs_ideal": float(np.mean(error_list))})]
+
+
+def bench_calibrate_movie(video_path, pipeline, num_workers):
+    """calibrate_movie（デコード・undistort・エンコード）"""
+    from calibration import Calibration, calibrate_movie
+
+    calib = Calibration()
+    frame_num = int(cv2.VideoCapture(video_path).get(cv2.CAP_PROP_FRAME_COUNT))
+    start = time.perf_counter()
+    calibrate_movie(calib, video_path, "calibrated_{}.avi".format(int(pipeline)), pipeline, num_workers)
+    elapsed = time.perf_counter() - start
+    name = "calibrate_movie/{}".format("pipeline" if pipeline else "serial")
+    return [make_result(name, elapsed, frame_num, "frames/s", num_workers=num_workers)]
+
+
+def bench_concatenater(video_path):
+    """MovieConcatenater（2動画を横に連結）"""
+    from movie_concatenater import MovieConcatenater
+
+    frame_num = int(cv2.VideoCapture(video_path).get(cv2.CAP_PROP_FRAME_COUNT))
+    start = time.perf_counter()
+    MovieConcatenater(
+                    False, True, "concatenated.avi",
+                    path_1=video_path, path_2=video_path,
+                    title_1="ORIGINAL", title_2="CALIBRATION")
+    elapsed = time.perf_counter() - start
+    return [make_result("MovieConcatenater/2", elapsed, frame_num, "frames/s")]
+
+
+def bench_startup(num_runs):
+    """
+    cli.py の起動時間（サブコマンドを実行しない場合）
+    import した重いモジュールも記録し、起動時間が悪化していないか比較できるようにする
+    """
+    results = []
+    for name, argv in STARTUP_CASE_LIST:
+        elapsed_list = []
+        for _ in range(num_runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + argv, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elapsed_list.append(time.perf_counter() - start)
+        # -X importtime の出力から、import したモジュールを調べる
+        stderr = subprocess.run(
+                                [sys.executable, "-X", "importtime"] + argv, cwd=ROOT_DIR,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True).stderr
+        imported = {line.rsplit("|", 1)[-1].strip() for line in stderr.splitlines() if line.startswith("import time:")}
+        results.append(make_result(
+                                "startup/{}".format(name), float(np.median(elapsed_list)), 1, "runs/s",
+                                min_seconds=min(elapsed_list),
+                                heavy_imports=[module for module in HEAVY_MODULE_LIST if module in imported]))
+    return results
+
+
+def prepare(work_dir, args):
+    """合成データと計測用の config を work_dir に作成"""
+    camera = SyntheticCamera(tuple(args.size))
+    config_dir = os.path.join(work_dir, "config")
+    os.makedirs(config_dir, exist_ok=True)
+    np.savez(
+            os.path.join(config_dir, "calibration_param.npz"),
+            camera_matrix=camera.camera_matrix,
+            distortion=camera.distortion)
+    with open(os.path.join(ROOT_DIR, "config", "calibration.yaml"), encoding="utf-8") as f:
+        calibration_cfg = yaml.safe_load(f)
+    calibration_cfg.setdefault("undistort", {})["save_map"] = 0
+    with open(os.path.join(config_dir, "calibration.yaml"), mode="w", encoding="utf-8") as f:
+        yaml.safe_dump(calibration_cfg, f, allow_unicode=True)
+
+    img_dir_dict = {}
+    for pattern, (grid_num_tuple, grid_interval, circle_radius) in BOARD_DICT.items():
+        name = PATTERN_NAME_DICT[pattern]
+        board = SyntheticBoard(pattern, grid_num_tuple, grid_interval, circle_radius)
+        if pattern == CHECKER_BOARD:
+            img_list, corners_list = make_images(board, camera, args.num_images, DISTANCE, seed=pattern)
+        else:
+            # circle_radius から求める円の面積の許容範囲に収まるよう、距離と傾きの変化を小さくする
+            img_list, corners_list = make_images(
+                                                board, camera, args.num_images, DISTANCE, seed=pattern,
+                                                max_tilt_deg=20.0, distance_jitter=0.05)
+        img_dir = os.path.join(work_dir, "imgs_{}".format(name))
+        os.makedirs(img_dir, exist_ok=True)
+        for i, img in enumerate(img_list):
+            cv2.imwrite(os.path.join(img_dir, "{:04d}.png".format(i)), img)
+        np.savez(
+                os.path.join(img_dir, "truth.npz"),
+                corners=np.array(corners_list),
+                camera_matrix=camera.camera_matrix,
+                distortion=camera.distortion)
+        img_dir_dict[pattern] = img_dir
+
+        # CalculationParameters の circle_radius は画像上の円の半径 [px] として使われる
+        radius_px = circle_radius * camera.camera_matrix[0, 0] / DISTANCE if circle_radius else 7.5
+        cfg = {
+            "grid_interval": grid_interval,
+            "grid_num": {"vertical": grid_num_tuple[0], "horizontal": grid_num_tuple[1]},
+            "img": {"input_dir": img_dir, "extension": "png"},
+            "output": {"file_name": "calibration_param"},
+            "circle_radius": float(radius_px),
+            "detection": {"num_workers": args.num_workers},
+            "cache": {"enable": 0},
+        }
+        with open(os.path.join(config_dir, "calc_camera_param_{}.yaml".format(name)), mode="w", encoding="utf-8") as f:
+            yaml.safe_dump(cfg, f, allow_unicode=True)
+
+    board = SyntheticBoard(CHECKER_BOARD, *BOARD_DICT[CHECKER_BOARD][:2])
+    video_path = os.path.join(work_dir, "synthetic.avi")
+    ideal_dict = make_video(video_path, board, camera, args.num_frames, DISTANCE)
+    truth_path = os.path.join(work_dir, "synthetic_truth.npz")
+    np.savez(truth_path, index=np.array(list(ideal_dict.keys())), ideal=np.array(list(ideal_dict.values())))
+    return img_dir_dict, video_path, truth_path
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+                            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="合成データによる性能計測")
+    parser.add_argument("-o", "--output", default="benchmark_result.json", help="計測結果を書き出す json のパス")
+    parser.add_argument("--size", type=int, nargs=2, default=[1280, 960], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--num-images", type=int, default=20, help="ボードの種類毎の画像枚数")
+    parser.add_argument("--num-frames", type=int, default=120, help="動画のフレーム数")
+    parser.add_argument("--num-workers", type=int, default=1, help="制御点検出のプロセス数")
+    parser.add_argument("--startup-runs", type=int, default=10, help="起動時間の計測回数（中央値を記録する）")
+    args = parser.parse_args()
+
+    results = []
+    mp_context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as work_dir:
+        print("合成データを生成しています")
+        img_dir_dict, video_path, truth_path = prepare(work_dir, args)
+        case_list = [("bench_calculator", {"pattern": pattern, "img_dir": img_dir, "num_workers": args.num_workers})
+                     for pattern, img_dir in img_dir_dict.items()]
+        case_list += [
+            ("bench_undistort", {"video_path": video_path, "truth_path": truth_path}),
+            ("bench_calibrate_movie", {"video_path": video_path, "pipeline": False, "num_workers": 1}),
+            ("bench_calibrate_movie", {"video_path": video_path, "pipeline": True, "num_workers": 2}),
+            ("bench_concatenater", {"video_path": video_path}),
+            ("bench_startup", {"num_runs": args.startup_runs}),
+        ]
+        for func_name, kwargs in case_list:
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+                case_results = executor.submit(_run_case, work_dir, func_name, kwargs).result()
+            for result in case_results:
+                throughput = result["throughput"] or 0.0
+                print("{:<40} {:10.2f} {:<9} {:8.3f}s  peak {:7.1f}MB".format(
+                    result["name"], throughput, result["unit"], result["seconds"], result["peak_rss_mb"]))
+                if result.get("heavy_imports"):
+                    print("[WARNING]起動時に import している: {}".format(result["heavy_imports"]))
+            results.extend(case_results)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, mode="w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=float)
+    print("計測結果: {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+@file synthetic.py
+@brief 既知のカメラ行列・レンズ歪みから、calibrationボードの画像・動画を生成する
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import math
+
+import cv2
+import numpy as np
+
+CHECKER_BOARD = 0
+SYMMETRIC_CIRCLES_GRID = 1
+ASYMMETRIC_CIRCLES_GRID = 2
+
+
+class SyntheticCamera(object):
+
+    @property
+    def camera_matrix(self): return self.__camera_matrix
+
+    @property
+    def distortion(self): return self.__distortion
+
+    @property
+    def size(self): return self.__size
+
+    def __init__(self, size=(1280, 960), fov_deg=60.0, distortion=(-0.25, 0.08, 0.001, -0.0005, 0.0)):
+        """
+        Constructor
+
+        @param size (tuple) (width, height)
+        @param fov_deg (float) 水平画角 [deg]
+        @param distortion (tuple) (k1, k2, p1, p2, k3)
+        """
+        width, height = size
+        focal = width / 2 / math.tan(math.radians(fov_deg) / 2)
+        self.__size = tuple(size)
+        self.__camera_matrix = np.array([
+            [focal, 0.0, (width - 1) / 2],
+            [0.0, focal, (height - 1) / 2],
+            [0.0, 0.0, 1.0]])
+        self.__distortion = np.array(distortion, dtype=np.float64).reshape(1, -1)
+        self.__make_distort_map()
+
+    def __make_distort_map(self):
+        """歪みのある画像の各画素が、歪みのない画像のどこに対応するかを表すmap"""
+        width, height = self.__size
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        pixels = np.stack([xs, ys], axis=-1).reshape(-1, 1, 2)
+        criteria = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 20, 1e-6)
+        if hasattr(cv2, "undistortPointsIter"):
+            ideal = cv2.undistortPointsIter(
+                                            pixels, self.__camera_matrix, self.__distortion,
+                                            None, self.__camera_matrix, criteria)
+        else:
+            # OpenCV 5 以降は undistortPoints が criteria を受け取る
+            ideal = cv2.undistortPoints(
+                                        pixels, self.__camera_matrix, self.__distortion,
+                                        R=None, P=self.__camera_matrix, criteria=criteria)
+        ideal = ideal.reshape(height, width, 2)
+        self.__map_x = np.ascontiguousarray(ideal[..., 0])
+        self.__map_y = np.ascontiguousarray(ideal[..., 1])
+
+    def render(self, texture, texture_to_board, rvec, tvec, background=200, distort=True):
+        """
+        @brief 平面のtextureを指定の姿勢で撮影した画像を生成
+        @param texture (numpy.ndarray) ボードのグレースケール画像
+        @param texture_to_board (numpy.ndarray) texture の画素座標 -> ボード座標 [mm] の3x3行列
+        @param distort (bool) False -> レンズ歪みのない画像（undistortの真値）を返す
+        """
+        rot, _ = cv2.Rodrigues(rvec)
+        board_to_img = self.__camera_matrix @ np.column_stack([rot[:, 0], rot[:, 1], tvec.reshape(3)])
+        homography = board_to_img @ texture_to_board
+        ideal = cv2.warpPerspective(
+                                    texture,
+                                    homography,
+                                    self.__size,
+                                    flags=cv2.INTER_LINEAR,
+                                    borderValue=background)
+        if not distort:
+            return ideal
+        return cv2.remap(ideal, self.__map_x, self.__map_y, cv2.INTER_LINEAR, borderValue=background)
+
+    def project(self, obj_points, rvec, tvec):
+        img_points, _ = cv2.projectPoints(obj_points, rvec, tvec, self.__camera_matrix, self.__distortion)
+        return img_points.astype(np.float32)
+
+
+class SyntheticBoard(object):
+
+    @property
+    def pattern(self): return self.__pattern
+
+    @property
+    def obj_points(self):
+        """cv2.find* が返す順に並べた制御点のボード座標 [mm]"""
+        return self.__obj_points
+
+    @property
+    def texture(self): return self.__texture
+
+    @property
+    def texture_to_board(self): return self.__texture_to_board
+
+    @property
+    def center(self): return self.__center
+
+    def __init__(self, pattern, grid_num_tuple, grid_interval, circle_radius=None, px_per_mm=4.0):
+        """
+        Constructor
+
+        @param pattern (int) 0: Checkerboard, 1: Symmetric Circles Grid, 2: Asymmetric Circles Grid
+        @param grid_num_tuple (tuple) CalculationParameters.grid_num_tuple と同じ (1行の点数, 行数)
+        @param grid_interval (float) grid間の距離 [mm]
+        @param circle_radius (float) 円の半径 [mm]
+        """
+        self.__pattern = pattern
+        cols, rows = grid_num_tuple
+        g = float(grid_interval)
+        if pattern == CHECKER_BOARD:
+            points = [(i * g, j * g) for j in range(rows) for i in range(cols)]
+        elif pattern == SYMMETRIC_CIRCLES_GRID:
+            points = [(i * g, j * g) for j in range(rows) for i in range(cols)]
+        else:
+            # grid_interval は同じ行で隣り合う円の中心間距離
+            points = [((2 * i + j % 2) * g / 2, j * g / 2) for j in range(rows) for i in range(cols)]
+        self.__obj_points = np.array([(x, y, 0.0) for x, y in points], dtype=np.float32)
+        self.__make_texture(g, circle_radius or g / 4, px_per_mm)
+
+    def __make_texture(self, g, radius, px_per_mm):
+        margin = 1.5 * g
+        x_max, y_max = self.__obj_points[:, 0].max(), self.__obj_points[:, 1].max()
+        width = int(round((x_max + 2 * margin) * px_per_mm))
+        height = int(round((y_max + 2 * margin) * px_per_mm))
+        texture = np.full((height, width), 255, dtype=np.uint8)
+        to_px = lambda v: int(round((v + margin) * px_per_mm * 16))
+        if self.__pattern == CHECKER_BOARD:
+            cols = int(round(x_max / g)) + 1
+            rows = int(round(y_max / g)) + 1
+            for j in range(-1, rows):
+                for i in range(-1, cols):
+                    if (i + j) % 2 == 0:
+                        cv2.rectangle(
+                                    texture,
+                                    (to_px(i * g), to_px(j * g)),
+                                    (to_px((i + 1) * g), to_px((j + 1) * g)),
+                                    0, -1, cv2.LINE_AA, shift=4)
+        else:
+            for x, y, _ in self.__obj_points:
+                cv2.circle(texture, (to_px(x), to_px(y)), int(round(radius * px_per_mm * 16)), 0, -1, cv2.LINE_AA, shift=4)
+        self.__texture = texture
+        # texture の画素中心 -> ボード座標
+        self.__texture_to_board = np.array([
+            [1 / px_per_mm, 0.0, -margin],
+            [0.0, 1 / px_per_mm, -margin],
+            [0.0, 0.0, 1.0]])
+        self.__center = np.array([x_max / 2, y_max / 2, 0.0])
+
+
+def random_pose(board, camera, rng, distance, max_tilt_deg=30.0, distance_jitter=0.15):
+    """
+    @brief ボード全体が画像内に収まる姿勢をランダムに生成
+    @param distance (float) カメラからボード中心までの距離 [mm]
+    @return rvec, tvec (numpy.ndarray)
+    """
+    width, height = camera.size
+    for _ in range(100):
+        angles = np.radians(rng.uniform(-max_tilt_deg, max_tilt_deg, 3)) * np.array([1.0, 1.0, 0.3])
+        rot, _ = cv2.Rodrigues(angles)
+        z = distance * rng.uniform(1 - distance_jitter, 1 + distance_jitter)
+        offset = rng.uniform(-0.25, 0.25, 2) * np.array([width, height]) * z / camera.camera_matrix[0, 0]
+        tvec = np.array([offset[0], offset[1], z]) - rot @ board.center
+        rvec = cv2.Rodrigues(rot)[0]
+        points = camera.project(board.obj_points, rvec, tvec).reshape(-1, 2)
+        margin = 0.05 * min(width, height)
+        if (points.min(axis=0) > margin).all() and (points.max(axis=0) < np.array([width, height]) - margin).all():
+            return rvec, tvec.reshape(3, 1)
+    raise RuntimeError("ボードが画像内に収まる姿勢を生成できませんでした")
+
+
+def make_images(board, camera, num, distance, seed=0, max_tilt_deg=30.0, distance_jitter=0.15):
+    """
+    @return img_list (list) BGR画像のリスト
+    @return corners_list (list) 各画像の制御点の真値
+    """
+    rng = np.random.default_rng(seed)
+    img_list, corners_list = [], []
+    for _ in range(num):
+        rvec, tvec = random_pose(board, camera, rng, distance, max_tilt_deg, distance_jitter)
+        gray_img = camera.render(board.texture, board.texture_to_board, rvec, tvec)
+        img_list.append(cv2.cvtColor(gray_img, cv2.COLOR_GRAY2BGR))
+        corners_list.append(camera.project(board.obj_points, rvec, tvec))
+    return img_list, corners_list
+
+
+def make_video(path, board, camera, num_frames, distance, fps=30, fourcc="MJPG", seed=0):
+    """
+    @brief ボードがゆっくり動く動画を生成
+    @return ideal_dict (dict) 先頭・中央・末尾フレームのレンズ歪みのない画像（undistortの真値）
+                              {フレーム番号: BGR画像}
+    """
+    rng = np.random.default_rng(seed)
+    start = random_pose(board, camera, rng, distance)
+    end = random_pose(board, camera, rng, distance)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, camera.size)
+    ideal_dict = {}
+    for i in range(num_frames):
+        t = i / max(1, num_frames - 1)
+        rvec = (1 - t) * start[0] + t * end[0]
+        tvec = (1 - t) * start[1] + t * end[1]
+        gray_img = camera.render(board.texture, board.texture_to_board, rvec, tvec)
+        writer.write(cv2.cvtColor(gray_img, cv2.COLOR_GRAY2BGR))
+        if i in (0, num_frames // 2, num_frames - 1):
+            ideal_img = camera.render(board.texture, board.texture_to_board, rvec, tvec, distort=False)
+            ideal_dict[i] = cv2.cvtColor(ideal_img, cv2.COLOR_GRAY2BGR)
+    writer.release()
+    return ideal_dict
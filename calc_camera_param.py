@@ -6,105 +6,495 @@
 """
 from abc import ABCMeta, abstractmethod
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import glob
+import itertools
 import math
 import os
+import re
 
 import cv2
 import numpy as np
 from tqdm import tqdm
 
-from utils.cfg_manager import CalculationParameters, GridPattern
+from utils.calib_solver import CalibrationSolver
+from utils.cfg_manager import CalculationParameters, CalibrationMatrix, GridPattern
+from utils.detection_cache import DetectionCache
+from utils import profiler
+from inout.overlay import DETECTION_TARGET_LIST, DebugOverlayWriter, is_target, output_size
 from inout.save import Saver
-from utils.path import ConfigPathMaker
+from utils.path import ConfigPathMaker, config_dir
 
 class CameraParamCalculator(metaclass=ABCMeta):
+
+    @property
+    def board_coords(self):
+        """制御点のボード座標 [mm]。detect_board が返す制御点と同じ順に並ぶ"""
+        return self._board_coords
+
     def __init__(self, params: CalculationParameters):
         """Constructor"""
         self._params = params
+        self._criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, params.subpix_max_iter, 0.001)
+        self._tracked_corners = None
+        self._img_size = None
 
-    @abstractmethod
-    def calculate(self):
+    @property
+    def img_size(self):
+        """(width, height) 直前の calculate で用いた画像の解像度"""
+        return self._img_size
+
+    def calculate(self, img_list: list, save_result: bool = True, initial_guess: tuple = None):
         """
         @brief キャリブレーションに必要なパラメータ４つ（戻り値）を算出
+        @param img_list (list) parameterを算出するのに用いる画像群
+        @param save_result (bool) 制御点を描画した画像を保存するか管理するフラグ default:True
+        @param initial_guess (tuple) (camera_matrix, distortion) 最適化の初期値（前回の算出結果など）
+        @return camera_matrix (numpy.ndarray) カメラ行列
+        @return dist (list) レンズ歪みパラメータ
+        @return rot_vecs (list) 回転ベクトル
+        @return trans_vecs (numpy.ndarray) 並進ベクトル
         """
-        pass
+        obj_coords = []     # 3d point in real world space
+        img_coords = []     # 2d point in image space
+        view_img_index = [] # view毎の img_list での番号
+        #　制御点を描画した画像を確認したい場合は save_result = True
+        # target が検出した時点で決まる場合は、検出で読み込んだ画像に描画する（元画像を読み込み直さない）
+        overlay_at_detection = save_result and self._params.draw_target in DETECTION_TARGET_LIST
+        writer = self._make_overlay_writer() if overlay_at_detection else None
+        try:
+            result_list = self._detect_all(img_list, writer)
+            for i, (ret, corners, img_size) in enumerate(result_list):
+                if ret:
+                    obj_coords.append(self._board_coords)
+                    img_coords.append(corners)
+                    view_img_index.append(i)
+
+            solver = CalibrationSolver(
+                                        initial_guess,
+                                        self._params.prune_max_iter,
+                                        self._params.prune_threshold_px,
+                                        self._params.prune_threshold_ratio,
+                                        self._params.min_views,
+                                        self._params.max_views,
+                                        self._params.tolerance_px)
+            with profiler.stage("calibrateCamera"):
+                camera_matrix, dist, rot_vecs, trans_vecs = solver.solve(
+                                                                        obj_coords, img_coords, img_size,
+                                                                        self._params.grid_num_tuple)
+        finally:
+            # 書き出しは calibrateCamera と並行して行い、ここで終了を待つ
+            if writer is not None:
+                writer.close()
+        self._img_size = img_size
+        if save_result and not overlay_at_detection:
+            with profiler.stage("overlay"):
+                self._write_outlier_overlays(img_list, result_list, view_img_index, solver)
+        return camera_matrix, dist, rot_vecs, trans_vecs
 
     @abstractmethod
     def _make_board(self):
         """実空間上でのcalibration用ボードを作成"""
         pass
 
-    def _write_point(self, corners, img, gray_img, criteria, ret, index):
-        """画像内のcalibrationボードに制御点を描画"""
-        img = cv2.drawChessboardCorners(img, self._params.grid_num_tuple, corners, ret)
-        save_dir = "./draw_corner"
-        os.makedirs(save_dir, exist_ok=True)
-        cv2.imwrite(os.path.join(save_dir, f"test_{index}.jpg"), img)
+    @abstractmethod
+    def _find_corners(self, img, gray_img):
+        """
+        @brief 1枚の画像からcalibrationボードの制御点を検出
+        @return ret (bool) 検出できたか
+        @return corners (numpy.ndarray) 制御点の画像座標
+        """
+        pass
 
-    def _make_blob_detector(self):
+    def _find_corners_unrefined(self, img, gray_img, scale=1.0):
         """
-        BLOB: Binary Large OBject
+        @brief 高精度化を行わない検出（縮小画像での探索・find_board で用いる）
+               高精度化を行う検出器は、高精度化の前までを行うよう override する
+        @param scale (float) calibration用の画像に対する img の縮小率
         """
-        blob_area = math.pi * (self._params.circle_radius)**2
-        blob_params = cv2.SimpleBlobDetector_Params()
-        blob_params.filterByArea = True
-        blob_params.minArea = 0.80 * blob_area
-        blob_params.maxArea = 1.20 * blob_area
-        self._blob_detector = cv2.SimpleBlobDetector_create(blob_params)
+        return self._find_corners(img, gray_img)
 
+    def _find_corners_coarse(self, small_img, small_gray_img, scale):
+        """
+        @brief 縮小画像からcalibrationボードの制御点を大まかに検出
+               高精度化は元解像度で _refine_corners により行うため、縮小画像では行わない
+        @param scale (float) 縮小率
+        """
+        return self._find_corners_unrefined(small_img, small_gray_img, scale)
 
-class CheckerBoard(CameraParamCalculator):
-    def __init__(self, params: CalculationParameters):
-        """Constructor"""
-        super().__init__(params)
-        self.__make_board()
+    def _refine_corners(self, img, gray_img, corners):
+        """
+        @brief 縮小画像で検出した制御点（元解像度の座標に変換済み）を元解像度で高精度化
+        @return ret (bool) 高精度化できたか
+        @return corners (numpy.ndarray) 制御点の画像座標
+        """
+        return True, corners
 
-    def __make_board(self):
-        """実空間上でのチェッカーボードの座標情報を算出"""
-        self.__checker_coords = np.zeros((np.prod(self._params.grid_num_tuple), 3), np.float32)
-        self.__checker_coords[:,:2] = np.indices(self._params.grid_num_tuple).T.reshape(-1, 2)
-        self.__checker_coords *= self._params.grid_interval
+    def _find_corners_coarse_to_fine(self, img, gray_img):
+        """
+        @brief 縮小画像でボードを探索し、元解像度で制御点を高精度化する
+               長辺が pyramid_max_side 以下の画像は元解像度でそのまま検出する
+        """
+        scale = self._params.pyramid_max_side / max(gray_img.shape)
+        if scale >= 1.0:
+            return self._find_corners(img, gray_img)
+        with profiler.stage("pyramid"):
+            small_img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            small_gray_img = cv2.resize(gray_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ret, corners = self._find_corners_coarse(small_img, small_gray_img, scale)
+        if not ret:
+            return ret, corners
+        # 画素中心を合わせて元解像度の座標に変換
+        corners = ((corners + 0.5) / scale - 0.5).astype(np.float32)
+        return self._refine_corners(img, gray_img, corners)
+
+    def _grid_spacing(self, corners):
+        """隣り合う制御点間の最短距離 [px]"""
+        grid = corners.reshape(-1, self._params.grid_num_tuple[0], 2)
+        spacing_list = []
+        if grid.shape[1] > 1:
+            spacing_list.append(np.linalg.norm(np.diff(grid, axis=1), axis=2).min())
+        if grid.shape[0] > 1:
+            spacing_list.append(np.linalg.norm(np.diff(grid, axis=0), axis=2).min())
+        return float(min(spacing_list))
+
+    def _subpix_window(self, corners):
+        """
+        @brief cornerSubPix の探索窓（半径）
+               subpix_window が 0 の場合は制御点間隔に合わせて決める（隣の制御点を含まないようにする）
+        """
+        if self._params.subpix_window:
+            return (self._params.subpix_window, self._params.subpix_window)
+        half = int(np.clip(self._grid_spacing(corners) * 0.4, 2, 30))
+        return (half, half)
 
+    def _find_corners_around(self, img, gray_img, corners, margin, find):
+        """
+        @brief corners の外接矩形を margin [px] 広げた範囲のみでボードを探す
+        @param find (function) (img, gray_img) -> (ret, corners) 範囲内での検出に用いる関数
+        @return ret (bool) 検出できたか
+        @return corners (numpy.ndarray) 制御点の画像座標（img上の座標）
+        """
+        x, y, w, h = cv2.boundingRect(corners)
+        x0, y0 = max(0, int(x - margin)), max(0, int(y - margin))
+        x1 = min(gray_img.shape[1], int(x + w + margin) + 1)
+        y1 = min(gray_img.shape[0], int(y + h + margin) + 1)
+        ret, roi_corners = find(img[y0:y1, x0:x1], gray_img[y0:y1, x0:x1])
+        if not ret:
+            return ret, roi_corners
+        return ret, roi_corners + np.array([x0, y0], dtype=np.float32)
+
+    def _find_corners_tracked(self, img, gray_img, find):
+        """
+        @brief 連続したフレームでは、前のフレームで検出したボードの周辺のみを探す
+               前のフレームで検出できなかった場合・周辺で見失った場合は画像全体を探す
+        @param find (function) (img, gray_img) -> (ret, corners) 検出に用いる関数
+        """
+        ret = False
+        if self._tracked_corners is not None:
+            x, y, w, h = cv2.boundingRect(self._tracked_corners)
+            margin = self._params.tracking_margin * max(w, h) + self._grid_spacing(self._tracked_corners)
+            ret, corners = self._find_corners_around(img, gray_img, self._tracked_corners, margin, find)
+        if not ret:
+            ret, corners = find(img, gray_img)
+        self._tracked_corners = corners.reshape(-1, 1, 2).astype(np.float32) if ret else None
+        return ret, corners
+
+    def reset_tracking(self):
+        """前のフレームで検出したボードの位置を破棄する（連続していない画像群を処理する前に呼ぶ）"""
+        self._tracked_corners = None
+
+    def find_board(self, img, scale=1.0):
+        """
+        @brief 1枚の画像からcalibrationボードを探す（高精度化は行わない）
+        @param img (numpy.ndarray) BGR画像
+        @param scale (float) calibration用の画像に対する img の縮小率
+        @return ret (bool) 検出できたか
+        @return corners (numpy.ndarray) 制御点の画像座標（img上の座標）
+        """
+        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        find = lambda img, gray_img: self._find_corners_unrefined(img, gray_img, scale)
+        if self._params.tracking:
+            return self._find_corners_tracked(img, gray_img, find)
+        return find(img, gray_img)
 
-    def calculate(self, img_list, save_result: bool = True):
+    def detect_board(self, img):
         """
-        @brief キャリブレーションに必要なパラメータ４つ（戻り値）を算出
-        @param img_list (list) parameterを算出するのに用いる画像群（チェッカーボード）
-        @param save_result (bool) 制御点を描画した画像を保存するか管理するフラグ default:True
-        @return camera_matrix (numpy.ndarray) カメラ行列
-        @return dist (list) レンズ歪みパラメータ
-        @return rot_vecs (list) 回転ベクトル
-        @return trans_vecs (numpy.ndarray) 並進ベクトル
+        @brief 1枚の画像からcalibrationボードの制御点を検出する（高精度化まで行う）
+        @param img (numpy.ndarray) BGR画像
+        @return ret (bool) 検出できたか
+        @return corners (numpy.ndarray) 制御点の画像座標
         """
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.001)
-        obj_coords = []     # 3d point in real world space
-        img_coords = []     # 2d point in image space
-        for i, img_path in enumerate(tqdm(img_list)):
+        return self._detect_board(img, cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+
+    def _detect_board(self, img, gray_img):
+        find = self._find_corners_coarse_to_fine if self._params.pyramid else self._find_corners
+        if self._params.tracking:
+            return self._find_corners_tracked(img, gray_img, find)
+        return find(img, gray_img)
+
+    def _detect(self, img_path):
+        """
+        @brief 1枚の画像に対して 読み込み -> グレースケール化 -> 制御点検出 を行う
+        @return ret (bool) 検出できたか
+        @return corners (numpy.ndarray) 制御点の画像座標
+        @return img_size (tuple) (width, height)
+        """
+        return self._detect_with_overlay(img_path, False)[0]
+
+    def _detect_with_overlay(self, img_path, with_overlay=True):
+        """
+        @brief _detect に加え、確認用の画像の target に該当する場合は読み込んだ画像を書き出す大きさに縮小して返す
+        @return result (tuple) _detect の戻り値
+        @return overlay_img (numpy.ndarray or None) 確認用の画像に描画する画像
+        """
+        with profiler.stage("imread"):
             img = cv2.imread(img_path)
             gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        profiler.add_file("imread", img_path)
+        ret, corners = self._detect_board(img, gray_img)
+        img_size = gray_img.shape[::-1]
+        overlay_img = None
+        if with_overlay and is_target(self._params.draw_target, ret):
+            size = output_size(img_size, self._params.draw_scale, self._params.draw_contact_sheet,
+                               self._params.draw_thumb_width)
+            overlay_img = img if size == img_size else cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        return (ret, corners, img_size), overlay_img
+
+    def _detect_chunk(self, img_list, with_overlay):
+        """プロセスプールの1回の呼び出しで、連続した画像の塊を検出する"""
+        return [self._detect_with_overlay(img_path, with_overlay) for img_path in img_list]
+
+    def _detector_settings(self):
+        """検出結果に影響する設定。検出キャッシュのkeyに用いる"""
+        return {
+            "board": type(self).__name__,
+            "grid_num": list(self._params.grid_num_tuple),
+            "grid_interval": self._params.grid_interval,
+            "criteria": list(self._criteria),
+            "subpix_window": self._params.subpix_window,
+            "pyramid": self._params.pyramid,
+            "pyramid_max_side": self._params.pyramid_max_side if self._params.pyramid else None,
+            "tracking": self._params.tracking,
+        }
+
+    def _detect_all(self, img_list, writer=None):
+        """
+        @brief 全画像の制御点を検出する
+               検出キャッシュが有効な場合は、キャッシュにない画像（追加・変更された画像）のみ検出する
+        @param writer (DebugOverlayWriter) 検出で読み込んだ画像から確認用の画像を書き出す。Noneなら書き出さない
+                                           （キャッシュから得た画像は書き出し時に読み込む）
+        @return (list) 各画像の _detect の戻り値。img_list の順に並ぶ
+        """
+        results = [None] * len(img_list)
+        cache = None
+        if self._params.cache_enable:
+            # 入力画像のディレクトリには書き込まない（keyは画像の内容から求めるため、複数のディレクトリで共用できる）
+            cache_path = self._params.cache_path or os.path.join(config_dir(), "detection_cache.json")
+            cache = DetectionCache(cache_path, self._detector_settings(), self._params.cache_max_entries)
+            if self._params.cache_reset:
+                cache.invalidate()
+            key_list = [cache.make_key(img_path) for img_path in img_list]
+            results = [cache.get(key) for key in key_list]
+            print("[detection cache] hit: {}, miss: {}".format(cache.hit_count, cache.miss_count))
+
+        miss_index_list = [i for i, result in enumerate(results) if result is None]
+        detected = self._run_detection([img_list[i] for i in miss_index_list], writer is not None)
+        for i, img_path in enumerate(img_list):
+            overlay_img = None
+            if results[i] is None:
+                results[i], overlay_img = next(detected)
+                if cache is not None:
+                    cache.put(key_list[i], *results[i])
+            if writer is not None:
+                ret, corners, img_size = results[i]
+                # ボードを検出した画像には、従来通り文字列を書き込まない（contact_sheet では区別のため書き込む）
+                label = "" if ret and not self._params.draw_contact_sheet else os.path.basename(img_path)
+                writer.add(i, img_path, ret, corners, label=label, img=overlay_img, img_size=img_size)
+        if cache is not None:
+            cache.save()
+        return results
+
+    def _run_detection(self, img_list, with_overlay=False):
+        """
+        @brief 画像群の制御点を検出し、img_list の順に _detect_with_overlay の戻り値を返す generator
+               num_workers が2以上の場合はプロセスプールで並列に検出する
+               結果を待つ塊 (chunk) は同時実行数の2倍までとし、受け取っていない結果がメモリに溜まらないようにする
+               tracking が有効な場合、並列時はプロセスに渡す連続した画像の塊 (chunk) 毎に追跡をやり直す
+        @param with_overlay (bool) 確認用の画像に描画する画像も返すか
+        """
+        self.reset_tracking()
+        num_workers = self._params.num_workers or os.cpu_count()
+        progress = tqdm(total=len(img_list))
+        if num_workers <= 1 or len(img_list) <= 1:
+            for img_path in img_list:
+                yield self._detect_with_overlay(img_path, with_overlay)
+                progress.update(1)
+            progress.close()
+            return
+        # 画像を返す場合は、結果を待つ画像数を抑えるため1枚ずつ渡す
+        chunksize = 1 if with_overlay else max(1, len(img_list) // (num_workers * 4))
+        chunk_iter = (img_list[i:i + chunksize] for i in range(0, len(img_list), chunksize))
+        with ProcessPoolExecutor(
+                                max_workers=num_workers,
+                                initializer=profiler.init_worker,
+                                initargs=(profiler.worker_state(),)) as executor:
+            pending = deque()
+            while True:
+                for chunk in itertools.islice(chunk_iter, 2 * num_workers - len(pending)):
+                    pending.append(executor.submit(self._detect_chunk, chunk, with_overlay))
+                if not pending:
+                    break
+                for result in pending.popleft().result():
+                    progress.update(1)
+                    yield result
+        progress.close()
+
+    def _make_overlay_writer(self):
+        return DebugOverlayWriter(
+                                "./draw_corner",
+                                self._params.grid_num_tuple,
+                                self._params.draw_target,
+                                self._params.draw_every,
+                                self._params.draw_scale,
+                                self._params.draw_contact_sheet,
+                                self._params.draw_thumb_width,
+                                self._params.draw_num_workers,
+                                self._params.draw_max_pending)
+
+    def _write_outlier_overlays(self, img_list, result_list, view_img_index, solver):
+        """
+        @brief 制御点・再投影誤差を描画した確認用の画像を ./draw_corner にバックグラウンドで書き出す
+               target = outliers の場合のみ（該当するかは解いた後に決まるため、元画像を読み込み直す）
+        @param result_list (list) 各画像の検出結果 (ret, corners, img_size)
+        @param view_img_index (list) solver に渡したview毎の img_list での番号
+        @param solver (CalibrationSolver) 解いた後のsolver
+        """
+        error_dict = {view_img_index[v]: e for v, e in zip(solver.view_index, solver.view_errors)}
+        outlier_set = {view_img_index[v] for v in solver.outlier_index}
+        with self._make_overlay_writer() as writer:
+            for i, (img_path, (ret, corners, _)) in enumerate(zip(img_list, result_list)):
+                label = os.path.basename(img_path)
+                if i in error_dict:
+                    label += "  RMS: {:.3f}px".format(error_dict[i])
+                if i in outlier_set:
+                    label += "  OUTLIER"
+                writer.add(i, img_path, ret, corners, i in outlier_set, label)
 
-            ret, corners = cv2.findChessboardCorners(gray_img, self._params.grid_num_tuple)
-            if ret:
-                obj_coords.append(self.__checker_coords)
-                #  cornersより高い精度での座標の算出
-                sophiscated_corners = cv2.cornerSubPix(gray_img, corners, (11, 11), (-1, -1), criteria)
-                img_coords.append(sophiscated_corners)
+class CheckerBoard(CameraParamCalculator):
+    def __init__(self, params: CalculationParameters):
+        """Constructor"""
+        super().__init__(params)
+        self._make_board()
 
-                #　制御点を描画した画像を確認したい場合は以下２行のコメントアウトを解除
-                if save_result:
-                    self._write_point(sophiscated_corners, img, gray_img, criteria, ret, i)
+    def _make_board(self):
+        """実空間上でのチェッカーボードの座標情報を算出"""
+        self._board_coords = np.zeros((np.prod(self._params.grid_num_tuple), 3), np.float32)
+        self._board_coords[:,:2] = np.indices(self._params.grid_num_tuple).T.reshape(-1, 2)
+        self._board_coords *= self._params.grid_interval
 
-        _, camera_matrix, dist, rot_vecs, trans_vecs = cv2.calibrateCamera(obj_coords, img_coords, gray_img.shape[::-1], None, None)
-        return camera_matrix, dist, rot_vecs, trans_vecs
+    def _find_corners(self, img, gray_img):
+        ret, corners = self._find_corners_unrefined(img, gray_img)
+        if ret:
+            ret, corners = self._refine_corners(img, gray_img, corners)
+        return ret, corners
 
+    def _find_corners_unrefined(self, img, gray_img, scale=1.0):
+        # cornerSubPix を行わない
+        with profiler.stage("findChessboardCorners"):
+            return cv2.findChessboardCorners(gray_img, self._params.grid_num_tuple)
 
-class SymmetricCirclesGrid(CameraParamCalculator):
+    def _refine_corners(self, img, gray_img, corners):
+        #  cornersより高い精度での座標の算出
+        with profiler.stage("cornerSubPix"):
+            corners = cv2.cornerSubPix(gray_img, corners, self._subpix_window(corners), (-1, -1), self._criteria)
+        return True, corners
+
+
+class CirclesGrid(CameraParamCalculator):
+    """SymmetricCirclesGrid, AsymmetricCirclesGrid 共通の処理"""
+    GRID_FLAG = None
 
     def __init__(self, params: CalculationParameters):
         """Constructor"""
         super().__init__(params)
         self._make_blob_detector()
+
+    def __getstate__(self):
+        """cv2.SimpleBlobDetector は pickle できないため、プロセス間で渡す際は除外する"""
+        state = self.__dict__.copy()
+        state["_blob_detector"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_blob_detector()
+
+    def _create_blob_detector(self, scale=1.0):
+        """
+        BLOB: Binary Large OBject
+        @param scale (float) 画像の縮小率。面積の閾値を scale**2 倍する
+        """
+        blob_area = math.pi * (self._params.circle_radius)**2 * scale**2
+        blob_params = cv2.SimpleBlobDetector_Params()
+        blob_params.filterByArea = True
+        blob_params.minArea = self._params.blob_area_ratio[0] * blob_area
+        blob_params.maxArea = self._params.blob_area_ratio[1] * blob_area
+        return cv2.SimpleBlobDetector_create(blob_params)
+
+    def _make_blob_detector(self):
+        self._blob_detector = self._create_blob_detector()
+
+    def _grid_flags(self):
+        flags = self.GRID_FLAG
+        if self._params.clustering:
+            flags |= cv2.CALIB_CB_CLUSTERING
+        return flags
+
+    def _detector_settings(self):
+        settings = super()._detector_settings()
+        settings["circle_radius"] = self._params.circle_radius
+        settings["clustering"] = self._params.clustering
+        settings["blob_area_ratio"] = list(self._params.blob_area_ratio)
+        return settings
+
+    def _find_circles(self, img, gray_img, blob_detector):
+        """設定した blob_detector で1度だけ円を検出し、その結果からgridを探す"""
+        with profiler.stage("findCirclesGrid"):
+            return cv2.findCirclesGrid(
+                                    gray_img,
+                                    self._params.grid_num_tuple,
+                                    flags=self._grid_flags(),
+                                    blobDetector=blob_detector)
+
+    def _find_corners(self, img, gray_img):
+        return self._find_circles(img, gray_img, self._blob_detector)
+
+    def _find_corners_unrefined(self, img, gray_img, scale=1.0):
+        # 円の検出は高精度化を行わないため、縮小率に合わせた blob_detector で検出するのみ
+        blob_detector = self._blob_detector if scale == 1.0 else self._create_blob_detector(scale)
+        return self._find_circles(img, gray_img, blob_detector)
+
+    def _refine_corners(self, img, gray_img, corners):
+        """
+        @brief 縮小画像で見つけたボードの周辺のみを元解像度で再検出する
+               ROI内で検出できなかった場合は画像全体で検出する
+        """
+        ret, roi_corners = self._find_corners_around(
+                                                    img, gray_img, corners,
+                                                    self._grid_spacing(corners), self._find_corners)
+        if not ret:
+            return self._find_corners(img, gray_img)
+        return ret, roi_corners
+
+
+class SymmetricCirclesGrid(CirclesGrid):
+    GRID_FLAG = cv2.CALIB_CB_SYMMETRIC_GRID
+
+    def __init__(self, params: CalculationParameters):
+        """Constructor"""
+        super().__init__(params)
         self._make_board()
 
     def _make_board(self):
@@ -138,51 +528,27 @@ class SymmetricCirclesGrid(CameraParamCalculator):
             ↑
             vertical_index
         """
-        self.__checker_coords = np.zeros((np.prod(self._params.grid_num_tuple), 3), np.float32)
+        self._board_coords = np.zeros((np.prod(self._params.grid_num_tuple), 3), np.float32)
         horizontal_index = 0
         vertical_index = 0
         for i in range(np.prod(self._params.grid_num_tuple)):
             if (i % self._params.vertical_grid_num == 0) and (i != 0):
                 horizontal_index += 1
                 vertical_index = self._params.vertical_grid_num * 2 - 1
-            self.__checker_coords[i][:2] = (
+            self._board_coords[i][:2] = (
                 self._params.grid_interval * horizontal_index,
                 self._params.grid_interval * vertical_index
                 )
             # 垂直方向に隣り合う i は vertical_index を -2 する必要あり
             vertical_index -= 2
 
-    def calculate(self, img_list: list, save_result: bool = True):
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.001)
-        obj_coords = []     # 3d point in real world space
-        img_coords = []     # 2d point in image space
-        for i, img_path in enumerate(tqdm(img_list)):
-            img = cv2.imread(img_path)
-            gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            key_points = self._blob_detector.detect(gray_img)
-
-            img_with_keypoints = cv2.drawKeypoints(img, key_points, np.array([]), (0,255,0), cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
-            img_with_keypoints_gray = cv2.cvtColor(img_with_keypoints, cv2.COLOR_BGR2GRAY)
-            ret, corners = cv2.findCirclesGrid(img_with_keypoints, self._params.grid_num_tuple, None, flags = cv2.CALIB_CB_SYMMETRIC_GRID)
 
-            if ret:
-                obj_coords.append(self.__checker_coords)
-                img_coords.append(corners)
+class AsymmetricCirclesGrid(CirclesGrid):
+    GRID_FLAG = cv2.CALIB_CB_ASYMMETRIC_GRID
 
-                #　制御点を描画した画像を確認したい場合は以下２行のコメントアウトを解除
-                if save_result:
-                    self._write_point(corners, img, img_with_keypoints_gray, criteria, ret, i)
-
-        _, camera_matrix, dist, rot_vecs, trans_vecs = cv2.calibrateCamera(obj_coords, img_coords, gray_img.shape[::-1], None, None)
-        return camera_matrix, dist, rot_vecs, trans_vecs
-
-
-class AsymmetricCirclesGrid(CameraParamCalculator):
-    
     def __init__(self, params: CalculationParameters):
         """Constructor"""
         super().__init__(params)
-        self._make_blob_detector()
         self._make_board()
 
     def _make_board(self):
@@ -216,7 +582,7 @@ class AsymmetricCirclesGrid(CameraParamCalculator):
             ↑
             vertical_index
         """
-        self.__checker_coords = np.zeros((np.prod(self._params.grid_num_tuple), 3), np.float32)
+        self._board_coords = np.zeros((np.prod(self._params.grid_num_tuple), 3), np.float32)
         horizontal_index = 0
         vertical_index = self._params.vertical_grid_num * 2 - 1
         for i in range(np.prod(self._params.grid_num_tuple)):
@@ -226,58 +592,62 @@ class AsymmetricCirclesGrid(CameraParamCalculator):
                     vertical_index = self._params.vertical_grid_num * 2 - 1
                 else:
                     vertical_index = self._params.vertical_grid_num * 2 - 2
-            self.__checker_coords[i][:2] = (
+            self._board_coords[i][:2] = (
                 self._params.grid_interval/2 * horizontal_index,
                 self._params.grid_interval/2 * vertical_index
                 )
             # 垂直方向に隣り合う i は vertical_index を +2 する必要あり
             vertical_index -= 2
 
-    def calculate(self, img_list: list, save_result: bool = True):
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.001)
-        obj_coords = []     # 3d point in real world space
-        img_coords = []     # 2d point in image space
-        for i, img_path in enumerate(tqdm(img_list)):
-            img = cv2.imread(img_path)
-            gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            key_points = self._blob_detector.detect(gray_img)
 
-            img_with_keypoints = cv2.drawKeypoints(img, key_points, np.array([]), (0,255,0), cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
-            img_with_keypoints_gray = cv2.cvtColor(img_with_keypoints, cv2.COLOR_BGR2GRAY)
-            ret, corners = cv2.findCirclesGrid(img_with_keypoints, self._params.grid_num_tuple, None, flags = cv2.CALIB_CB_ASYMMETRIC_GRID)
-            if ret:
-                obj_coords.append(self.__checker_coords)
-                img_coords.append(corners)
-
-                #　制御点を描画した画像を確認したい場合は以下２行のコメントアウトを解除
-                if save_result:
-                    self._write_point(corners, img, img_with_keypoints_gray, criteria, ret, i)
+def make_calculator(pattern, params: CalculationParameters):
+    """
+    @param pattern (int) GridPattern 0: Checkerboard, 1: Symmetric Circles Grid, 2: Asymmetric Circles Grid
+    @return (CameraParamCalculator)
+    """
+    if pattern == GridPattern.CHECKER_BOARD:
+        return CheckerBoard(params)
+    elif pattern == GridPattern.SYMMETRIC_CIRCLES_GRID:
+        return SymmetricCirclesGrid(params)
+    elif pattern == GridPattern.ASYMMETRIC_CIRCLES_GRID:
+        return AsymmetricCirclesGrid(params)
+    raise Exception("Calibration Pattern は 0,1,2 のうちから選択してください")
+
+
+def main(pattern):
+    """
+    メイン関数
+    @param pattern (int) GridPattern
+    """
+    params = CalculationParameters(CalculationParameters.get_yaml_path())
+    calc = make_calculator(pattern, params)
 
-        _, camera_matrix, dist, rot_vecs, trans_vecs = cv2.calibrateCamera(obj_coords, img_coords, gray_img.shape[::-1], None, None)
-        return camera_matrix, dist, rot_vecs, trans_vecs
+    img_list = glob.glob(os.path.join(params.img_dir, f"*.{params.img_extention}"))
+    if params.tracking:
+        # movie2img で切り出した連番の画像をフレーム順に並べる (1, 2, ..., 10, 11, ...)
+        img_list.sort(key=lambda path: [
+            int(s) if s.isdigit() else s for s in re.split(r"(\d+)", os.path.basename(path))])
+    cpm = ConfigPathMaker(params.file_name, ext="npz")
+    initial_guess = None
+    if params.incremental and os.path.isfile(cpm.path):
+        # 前回の算出結果を初期値とする
+        prev = CalibrationMatrix(cpm.path)
+        initial_guess = (prev.camera_matrix, prev.distortion)
+    camera_matrix, distortion, _, _  = calc.calculate(img_list, save_result=params.draw_enable, initial_guess=initial_guess)
+    save = Saver(cpm.path, camera_matrix=camera_matrix, distortion=distortion, image_size=calc.img_size)
+    with profiler.stage("save_npz"):
+        save.save_npz()
+    profiler.add_file("save_npz", cpm.path, written=True)
 
 
 if __name__ == "__main__":
-    params = CalculationParameters(CalculationParameters.get_yaml_path())
     parser = argparse.ArgumentParser()
     parser.add_argument("-p", "--pattern", type=int,
                         help="Write calibration pattern, \
                             0: Checkerboard,\
                             1: Symmetric Circles Grid,\
                             2: Asymmetric Circles Grid")
+    profiler.add_arguments(parser)
     args = parser.parse_args()
-
-    if args.pattern == GridPattern.CHECKER_BOARD:
-        calc = CheckerBoard(params)
-    elif args.pattern == GridPattern.SYMMETRIC_CIRCLES_GRID:
-        calc = SymmetricCirclesGrid(params)
-    elif args.pattern == GridPattern.ASYMMETRIC_CIRCLES_GRID:
-        calc = AsymmetricCirclesGrid(params)
-    else:
-        raise Exception("Calibration Pattern は 0,1,2 のうちから選択してください")
-
-    img_list = glob.glob(os.path.join(params.img_dir, f"*.{params.img_extention}"))
-    camera_matrix, distortion, _, _  = calc.calculate(img_list, save_result=True)
-    cpm = ConfigPathMaker(params.file_name, ext="npz")
-    save = Saver(cpm.path, camera_matrix=camera_matrix, distortion=distortion)
-    save.save_npz()
+    with profiler.session(args.profile, args.cprofile):
+        main(args.pattern)
@@ -4,37 +4,85 @@
 
 @author Shunsuke Hishida / created 2021/06/04
 """
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
+import shutil
 
 import cv2
-from tqdm import tqdm
 
+from utils import ffmpeg
+from utils.camera_registry import CameraRegistry
 from utils.cfg_manager import CalibrationParameters, CalibrationMatrix
 from utils.path import CalibedPathMaker
 from utils.file_manager import FilePathGetter
+from utils.manifest import JobManifest, make_digest
+from utils.mosaic import MosaicCanvas, MosaicEngine, open_writer
+from utils.pipeline import FramePipeline
+from utils import profiler
+from utils.scheduler import Job, JobScheduler
+from utils.segment import SegmentCheckpoint, plan_segments, probe_keyframe_list
+from utils.undistort_map import INTERPOLATION_DICT, UndistortMapCache
 from movie_cutter import setOutputFormat
 
+MOVIE_EXT_LIST = [".avi", ".mp4", ".wmv"]
+IMG_EXT_LIST = [".jpg", ".JPG", ".png"]
+
 class Calibration(object):
 
     @property
     def calibrated_img(self): return self.__calibrated_img
 
-    def __init__(self):
-        """Constructor"""
-        self.__calib_param = CalibrationMatrix(CalibrationMatrix.get_npz_path())
+    def __init__(self, interpolation="linear", save_map=False, new_camera_matrix=None, registry=None, map_cache_mb=0):
+        """
+        Constructor
+
+        @param interpolation (str) remap時の補間方法 nearest / linear / cubic / lanczos4
+        @param save_map (bool) remapテーブルを calibration_param.npz と同じディレクトリに保存するか
+        @param new_camera_matrix (numpy.ndarray) undistort後のカメラ行列。Noneなら元のカメラ行列
+        @param registry (CameraRegistry) カメラ毎のparam。Noneなら config/calibration_param.npz のみ用いる
+        @param map_cache_mb (int) メモリに保持するremapテーブルの合計の上限 [MB]。0なら上限なし
+        """
+        if interpolation not in INTERPOLATION_DICT:
+            print("[calibration.py][ERROR]interpolation は {} のうちから選択してください".format(
+                list(INTERPOLATION_DICT.keys())))
+            raise Exception
+        self.__interpolation = INTERPOLATION_DICT[interpolation]
+        self.__new_camera_matrix = new_camera_matrix
+        self.__registry = registry if registry is not None else CameraRegistry()
+        save_dir = os.path.dirname(CalibrationMatrix.get_npz_path()) if save_map else None
+        self.__map_cache = UndistortMapCache(save_dir, map_cache_mb * 1024 * 1024)
+
+    def resolve_camera(self, file_path):
+        """
+        @brief ファイルに対応するカメラID（CameraRegistry.resolve）
+        """
+        return self.__registry.resolve(file_path)
 
-    def execute(self, img):
+    def execute(self, img, camera_id=""):
         """
         @brief キャリブレーションを実行する
         @param img (numpy.ndarray) calibrationする画像
+        @param camera_id (str) resolve_camera で求めたカメラID
         """
-        h, w, _ = img.shape
-        dst = cv2.undistort(
-                            img,
-                            self.__calib_param.camera_matrix,
-                            self.__calib_param.distortion,
-                            None)
-        self.__calibrated_img = dst
+        self.__calibrated_img = self.undistort(img, camera_id)
+
+    def undistort(self, img, camera_id=""):
+        """
+        @brief キャリブレーションした画像を返す（複数スレッドから同時に呼び出し可能）
+               カメラ・解像度毎にremapテーブルを一度だけ生成し、以降はremapのみ行う
+        @param img (numpy.ndarray) calibrationする画像
+        @param camera_id (str) resolve_camera で求めたカメラID
+        @return (numpy.ndarray) calibrationした画像
+        """
+        h, w = img.shape[:2]
+        calib_param = self.__registry.get(camera_id, (w, h))
+        undistort_map = self.__map_cache.get(
+                                            (w, h),
+                                            calib_param.camera_matrix,
+                                            calib_param.distortion,
+                                            self.__new_camera_matrix)
+        return undistort_map.remap(img, self.__interpolation)
 
 def set_format(movie, img, save_path):
     fourcc = int(movie.get(cv2.CAP_PROP_FOURCC))
@@ -43,83 +91,407 @@ def set_format(movie, img, save_path):
     new_movie = cv2.VideoWriter(save_path, fourcc, fps, (width, height))
     return new_movie
 
-def concatatenate_movie(movie1_path, movie2_path, save_path, left_title, right_title, color=(255,0,0)):
+def side_by_side(img1, img2, left_title, right_title, color=(255,0,0)):
+    """
+    @brief 2枚の画像を左右に並べ、それぞれにタイトルを描画する
+    @return (numpy.ndarray) 連結した画像
+    """
+    img = cv2.hconcat([img1, img2])
+    width = img1.shape[1]
+    # 連結後の画像の左右それぞれの領域に描画（タイトルが隣の画像にはみ出さないようにする）
+    cv2.putText(img[:, :width], left_title, (10, 30),
+       cv2.FONT_HERSHEY_PLAIN, 1.5,
+       color, 2, cv2.LINE_AA)
+    cv2.putText(img[:, width:], right_title, (10, 30),
+       cv2.FONT_HERSHEY_PLAIN, 1.5,
+       color, 2, cv2.LINE_AA)
+    return img
+
+def concatatenate_movie(movie1_path, movie2_path, save_path, left_title, right_title, color=(255,0,0), preview=None):
     """
     @param left_title (str) concatenateした際の左側動画タイトル
     @param right_title (str) concatenateした際の右側動画タイトル
+    @param preview (PreviewParameters) 確認用に縮小して書き出す設定
     """
-    movie1 = cv2.VideoCapture(movie1_path)
-    movie2 = cv2.VideoCapture(movie2_path)
-    format_flag = False
-    while True:
-        ret1, img1 = movie1.read()
-        ret2, img2 = movie2.read()
-        ret = ret1 and ret2
-        if ret:
-            cv2.putText(img1, left_title, (10, 30),
-               cv2.FONT_HERSHEY_PLAIN, 1.5,
-               color, 2, cv2.LINE_AA)
-            cv2.putText(img2, right_title, (10, 30),
-               cv2.FONT_HERSHEY_PLAIN, 1.5,
-               color, 2, cv2.LINE_AA)
-            img = cv2.hconcat([img1, img2])
-            if not format_flag:
-                concatanated_movie = set_format(movie1, img, save_path)
-                format_flag = True
-            concatanated_movie.write(img)
-        else:
-            break
-    concatanated_movie.release()
-    movie1.release()
-    movie2.release()
-
-def calibrate_movie(calib, path, save_path):
+    MosaicEngine(
+                [movie1_path, movie2_path],
+                (1, 2),
+                save_path,
+                [left_title, right_title],
+                color=color,
+                preview=preview).run()
+
+def calibrate_movie(calib, path, save_path, pipeline=False, num_workers=2, queue_size=16,
+                    concat_path=None, left_title="", right_title="", camera_id="", preview=None, frame_range=None):
     """
     動画データをキャリブレーション
+    @param pipeline (bool) True -> デコード・calibration・エンコードをスレッドで並行に実行
+    @param num_workers (int) pipeline時にcalibrationを行うスレッド数
+    @param queue_size (int) pipeline時のstage間のqueueの上限
+    @param concat_path (str) 指定した場合、元動画とcalibration後の動画を並べた動画も同じデコードで生成する
+    @param left_title (str) concatenateした際の左側動画タイトル
+    @param right_title (str) concatenateした際の右側動画タイトル
+    @param camera_id (str) Calibration.resolve_camera で求めたカメラID
+    @param preview (PreviewParameters) 並べた動画を確認用に縮小して書き出す設定
+    @param frame_range (tuple) (開始フレーム, 終了フレーム) この範囲のみcalibrationする。Noneなら全フレーム
     """
     movie = cv2.VideoCapture(path)
     new_movie = setOutputFormat(movie, save_path)
-    while True:
-        ret, img = movie.read()
-        if ret:
-            calib.execute(img)
-            calibrated_img = calib.calibrated_img
+    concatenated_movie = []     # 1フレーム目の解像度が分かってから生成する
+    preview = preview if preview is not None and preview.enable else None
+    preview_canvas = []
+    max_frames = None
+    if frame_range is not None:
+        movie.set(cv2.CAP_PROP_POS_FRAMES, frame_range[0])
+        max_frames = frame_range[1] - frame_range[0]
+    # preview の間引きが区間の境目でずれないよう、元動画でのフレーム番号で数える
+    frame_count = [frame_range[0] if frame_range is not None else 0]
+
+    def process(img):
+        with profiler.stage("undistort"):
+            calibrated_img = calib.undistort(img, camera_id)
+        if concat_path is None:
+            return calibrated_img, None
+        if preview is not None:
+            # 縮小して並べるのは書き出すフレームのみのため write で行う
+            return calibrated_img, (img, calibrated_img)
+        with profiler.stage("overlay"):
+            return calibrated_img, side_by_side(img, calibrated_img, left_title, right_title)
+
+    def write(result):
+        calibrated_img, concatenated_img = result
+        with profiler.stage("encode"):
             new_movie.write(calibrated_img)
-        else:
-            break
+        if concatenated_img is None:
+            return
+        if preview is not None:
+            frame_count[0] += 1
+            if (frame_count[0] - 1) % preview.frame_step:
+                return
+            if not preview_canvas:
+                height, width = calibrated_img.shape[:2]
+                tile_size = preview.tile_size((width, height), (1, 2))
+                preview_canvas.append(MosaicCanvas((1, 2), tile_size, [left_title, right_title]))
+                concatenated_movie.append(open_writer(concat_path, movie, (tile_size[0] * 2, tile_size[1]), preview))
+            with profiler.stage("overlay"):
+                concatenated_img = preview_canvas[0].compose(concatenated_img)
+        if not concatenated_movie:
+            concatenated_movie.append(set_format(movie, concatenated_img, concat_path))
+        with profiler.stage("encode"):
+            concatenated_movie[0].write(concatenated_img)
+
+    if pipeline:
+        frame_pipeline = FramePipeline(process, num_workers, queue_size)
+        frame_pipeline.run(movie, write, max_frames)
+        frame_pipeline.report()
+    else:
+        frame_num = 0
+        while max_frames is None or frame_num < max_frames:
+            with profiler.stage("decode"):
+                ret, img = movie.read()
+            if ret:
+                write(process(img))
+                frame_num += 1
+            else:
+                break
     movie.release()
     new_movie.release()
+    for writer in concatenated_movie:
+        writer.release()
+    if frame_range is None:
+        profiler.add_file("decode", path)
+    profiler.add_file("encode", save_path, written=True)
+    if concat_path is not None:
+        profiler.add_file("encode", concat_path, written=True)
+
+def make_output_paths(config, file_path):
+    """
+    @brief calibrate_file() で生成するファイルのパス
+    @return save_path (str) calibrationしたファイルのパス
+    @return concat_path (str) calib前後を並べた動画のパス。生成しない場合はNone
+    """
+    sub_dir = ""
+    if config.recursive:
+        sub_dir = os.path.relpath(os.path.dirname(file_path), config.input_dir)
+        sub_dir = "" if sub_dir == os.curdir else sub_dir
+    cpm = CalibedPathMaker(file_path, initial="calibrated", sub_dir=sub_dir)
+    concat_path = None
+    if cpm.extention in MOVIE_EXT_LIST and config.movie_mode:
+        concat_path = CalibedPathMaker(file_path, initial="concatenated", sub_dir=sub_dir).path
+    return cpm.path, concat_path
+
+def make_param_digest(config, registry):
+    """
+    @brief calibration結果に影響するパラメータのhash
+           カメラ毎のnpzは読み込まず、パス・サイズ・更新時刻で変更を検知する
+    @param registry (CameraRegistry)
+    """
+    return make_digest(
+                        registry.describe(),
+                        config.interpolation,
+                        config.movie_mode,
+                        config.left_title,
+                        config.right_title,
+                        [config.preview.enable, config.preview.width, config.preview.height, config.preview.frame_step,
+                         config.preview.codec, config.preview.bitrate, config.preview.fourcc])
+
+def use_segments(config, file_path):
+    """動画を区間に分けて calibration するか（segment.enable かつ min_duration_sec 以上の動画）"""
+    if not config.segment_enable:
+        return False
+    movie = cv2.VideoCapture(file_path)
+    fps = movie.get(cv2.CAP_PROP_FPS)
+    frame_num = movie.get(cv2.CAP_PROP_FRAME_COUNT)
+    movie.release()
+    return fps > 0 and frame_num / fps >= config.segment_min_sec
+
+def join_segments(segment_list, dst):
+    """
+    @brief 区間毎の動画を連結する
+           ffmpeg があれば再エンコードせずに連結し、なければ OpenCV でデコードし直して書き出す
+    """
+    if ffmpeg.is_available():
+        with profiler.stage("join"):
+            ffmpeg.concat(segment_list, dst)
+        profiler.add_file("join", dst, written=True)
+        return
+    print("[calibration.py][WARNING]ffmpeg がないため、区間の動画をデコードし直して連結します")
+    writer = None
+    for segment in segment_list:
+        movie = cv2.VideoCapture(segment)
+        while True:
+            with profiler.stage("join"):
+                ret, img = movie.read()
+                if not ret:
+                    break
+                if writer is None:
+                    writer = set_format(movie, img, dst)
+                writer.write(img)
+        movie.release()
+    if writer is not None:
+        writer.release()
+    profiler.add_file("join", dst, written=True)
+
+def calibrate_movie_segmented(config, file_path, save_path, concat_path=None, camera_id=""):
+    """
+    @brief 動画を keyframe 区切りの区間に分け、区間毎に別プロセスで calibration・エンコードしてから連結する
+           処理済みの区間は記録し、中断後の再実行では未処理の区間のみ処理する
+    @param config (CalibrationParameters)
+    @param concat_path (str) 指定した場合、元動画と並べた動画も区間毎に生成して連結する
+    """
+    movie = cv2.VideoCapture(file_path)
+    fps = movie.get(cv2.CAP_PROP_FPS)
+    frame_num = int(movie.get(cv2.CAP_PROP_FRAME_COUNT))
+    movie.release()
+    segment_list = plan_segments(frame_num, fps, config.segment_sec, probe_keyframe_list(file_path))
+    print("{} 区間に分けて calibration".format(len(segment_list)))
+    profiler.add_file("decode", file_path)
+
+    segment_dir = save_path + ".segments"
+    os.makedirs(segment_dir, exist_ok=True)
+    ext = os.path.splitext(save_path)[1]
+    output_list = []
+    for index in range(len(segment_list)):
+        calibrated = os.path.join(segment_dir, "calibrated_{:05d}{}".format(index, ext))
+        concatenated = os.path.join(segment_dir, "concatenated_{:05d}{}".format(index, ext)) if concat_path else None
+        output_list.append((calibrated, concatenated))
+    checkpoint = SegmentCheckpoint(
+                                    os.path.join(segment_dir, "checkpoint.json"),
+                                    file_path,
+                                    make_digest(make_param_digest(config, CameraRegistry.from_config(config)), camera_id,
+                                                concat_path is not None),
+                                    segment_list)
+
+    pending = [index for index in range(len(segment_list))
+               if not checkpoint.is_done(index, [path for path in output_list[index] if path is not None])]
+    if len(pending) < len(segment_list):
+        print("処理済みの区間: {} / {}".format(len(segment_list) - len(pending), len(segment_list)))
+    error_list = []
+    with ProcessPoolExecutor(
+                            max_workers=config.segment_workers or os.cpu_count(),
+                            initializer=_init_worker,
+                            initargs=(config, profiler.worker_state())) as executor:
+        future_dict = {
+                        executor.submit(
+                                        _calibrate_segment_in_worker,
+                                        file_path,
+                                        segment_list[index],
+                                        output_list[index][0],
+                                        output_list[index][1],
+                                        camera_id): index
+                        for index in pending}
+        for future in as_completed(future_dict):
+            index = future_dict[future]
+            try:
+                future.result()
+            except Exception as e:
+                # 他の区間は続けて処理し、次回はこの区間から再開する
+                error_list.append(e)
+                continue
+            checkpoint.mark_done(index)
+    if error_list:
+        print("[calibration.py][ERROR]{} 区間の calibration に失敗しました".format(len(error_list)))
+        raise error_list[0]
+
+    join_segments([calibrated for calibrated, _ in output_list], save_path)
+    if concat_path is not None:
+        join_segments([concatenated for _, concatenated in output_list], concat_path)
+    shutil.rmtree(segment_dir)
+
+def calibrate_file(calib, config, file_path):
+    """
+    @brief 1ファイル（動画 or 画像）をcalibrationし after/ に保存する
+    @param calib (Calibration)
+    @param config (CalibrationParameters)
+    """
+    save_path, concat_path = make_output_paths(config, file_path)
+    camera_id = calib.resolve_camera(file_path)
+    if camera_id:
+        print("カメラ: {}".format(camera_id))
+    ext = os.path.splitext(file_path)[1]
+    if ext in MOVIE_EXT_LIST and use_segments(config, file_path):
+        # 長い動画は区間に分けて別プロセスで calibration し、連結する
+        calibrate_movie_segmented(config, file_path, save_path, concat_path if config.fused else None, camera_id)
+        print("動画の保存完了")
+        if config.movie_mode and not config.fused:
+            print("元動画との連結開始")
+            concatatenate_movie(
+                                file_path, save_path, concat_path, config.left_title, config.right_title,
+                                preview=config.preview)
+    elif ext in MOVIE_EXT_LIST:
+        # データが動画のとき
+        calibrate_movie(
+                        calib,
+                        file_path,
+                        save_path,
+                        config.pipeline,
+                        config.pipeline_workers,
+                        config.pipeline_queue_size,
+                        # calib前後の動画のconcatenateも同じデコードで行う
+                        concat_path if config.fused else None,
+                        config.left_title,
+                        config.right_title,
+                        camera_id,
+                        config.preview)
+        print("動画の保存完了")
+        # 以下、movie_mode = Trueならばcalib前後の動画をconcatenateする
+        if config.movie_mode and not config.fused:
+            print("元動画との連結開始")
+            concatatenate_movie(
+                                file_path, save_path, concat_path, config.left_title, config.right_title,
+                                preview=config.preview)
+    elif ext in IMG_EXT_LIST:
+        # データが画像のとき
+        with profiler.stage("imread"):
+            img = cv2.imread(file_path)
+        profiler.add_file("imread", file_path)
+        with profiler.stage("undistort"):
+            calib.execute(img, camera_id)
+        calibrated_img = calib.calibrated_img
+        with profiler.stage("imwrite"):
+            cv2.imwrite(save_path, calibrated_img)
+        profiler.add_file("imwrite", save_path, written=True)
+        print("画像の保存完了")
+    else:
+        print("[calibration.py][ERROR]calibrationできないファイル")
+        raise Exception("calibrationできないファイル: {}".format(file_path))
+
+def estimate_job(file_path, config):
+    """
+    @brief ファイルの処理に必要なメモリと処理時間を見積もる
+    @return (Job)
+    """
+    ext = os.path.splitext(file_path)[1]
+    if ext in MOVIE_EXT_LIST:
+        movie = cv2.VideoCapture(file_path)
+        width = int(movie.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(movie.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_num = max(1, int(movie.get(cv2.CAP_PROP_FRAME_COUNT)))
+        movie.release()
+        frame_bytes = width * height * 3
+        # デコード・calibration後のフレーム（pipeline時はqueueに溜まる分も）+ remapテーブル
+        buffered_frames = 2 * config.pipeline_queue_size + config.pipeline_workers if config.pipeline else 2
+        if config.movie_mode:
+            buffered_frames *= 3
+        memory = frame_bytes * (buffered_frames + 4) + width * height * 6
+        if use_segments(config, file_path):
+            # 区間毎のプロセスがそれぞれ同じだけ用いる
+            memory *= config.segment_workers or os.cpu_count()
+        return Job(file_path, memory, frame_num * frame_bytes)
+    # 画像はデコード後のサイズをファイルサイズの10倍と見積もる（入力・出力・remapテーブル）
+    decoded_bytes = os.path.getsize(file_path) * 10
+    return Job(file_path, decoded_bytes * 4, decoded_bytes)
+
+# プロセスプールの各プロセスで用いる Calibration と config
+_worker_state = {}
+
+def _init_worker(config, profile_state=None):
+    profiler.init_worker(profile_state)
+    _worker_state["config"] = config
+    _worker_state["calib"] = Calibration(
+                                        config.interpolation,
+                                        config.save_map,
+                                        registry=CameraRegistry.from_config(config),
+                                        map_cache_mb=config.map_cache_mb)
+
+def _calibrate_file_in_worker(file_path):
+    calibrate_file(_worker_state["calib"], _worker_state["config"], file_path)
+
+def _calibrate_segment_in_worker(file_path, frame_range, save_path, concat_path, camera_id):
+    config = _worker_state["config"]
+    calibrate_movie(
+                    _worker_state["calib"],
+                    file_path,
+                    save_path,
+                    config.pipeline,
+                    config.pipeline_workers,
+                    config.pipeline_queue_size,
+                    concat_path,
+                    config.left_title,
+                    config.right_title,
+                    camera_id,
+                    config.preview,
+                    frame_range)
 
 def main():
     """メイン関数"""
     config = CalibrationParameters(CalibrationParameters.get_yaml_path())
-    calib = Calibration()
-    fpg = FilePathGetter(config.input_dir, config.extension)
-    file_list = fpg.file_list
-    for file_path in tqdm(file_list):
-        cpm = CalibedPathMaker(file_path, initial="calibrated")
-        save_path = cpm.path
-        ext = cpm.extention
-        # HACK: この拡張子の分岐きれいではない。良い方法ないか？？
-        if ext == ".avi" or ext == ".mp4" or ext == ".wmv":
-            # データが動画のとき
-            calibrate_movie(calib, file_path, save_path)
-            print("動画の保存完了")
-            # 以下、movie_mode = Trueならばcalib前後の動画をconcatenateする
-            if config.movie_mode:
-                print("元動画との連結開始")
-                cpm = CalibedPathMaker(file_path, initial="concatenated")
-                concatatenate_movie(file_path, save_path, cpm.path, config.left_title, config.right_title)
-        elif ext == ".jpg" or ext == ".JPG" or ext == ".png":
-            # データが画像のとき
-            img = cv2.imread(file_path)
-            calib.execute(img)
-            calibrated_img = calib.calibrated_img
-            cv2.imwrite(save_path, calibrated_img)
-            print("画像の保存完了")
-        else:
-            print("[calibration.py][ERROR]calibrationできないファイル")
-            raise Exception
+    fpg = FilePathGetter(config.input_dir, config.extension, config.recursive)
+    manifest = None
+    if config.manifest_enable:
+        manifest_path = config.manifest_path or os.path.join(os.getcwd(), "after", ".calibration_manifest.json")
+        manifest = JobManifest(manifest_path, make_param_digest(config, CameraRegistry.from_config(config)))
+
+    def output_list(file_path):
+        return [path for path in make_output_paths(config, file_path) if path is not None]
+
+    def iter_jobs():
+        """処理済みで出力が最新のファイルを除いたjobを、ディレクトリを走査しながら順に返す"""
+        for file_path in fpg:
+            if manifest is not None and manifest.is_done(file_path, output_list(file_path)):
+                continue
+            yield estimate_job(file_path, config)
+
+    def on_done(result):
+        if manifest is not None and result.succeeded:
+            manifest.mark_done(result.path, output_list(result.path))
+
+    # 1ファイルの失敗で全体を止めず、最後に失敗したファイルをまとめて表示する
+    # 走査を終えるのを待たず、見つけたファイルから処理を始める
+    scheduler = JobScheduler(
+                            config.num_workers, config.memory_budget_mb,
+                            _init_worker, (config, profiler.worker_state()))
+    try:
+        scheduler.run(iter_jobs(), _calibrate_file_in_worker, on_done)
+    finally:
+        # 中断した場合も、それまでに処理したファイルを記録する
+        if manifest is not None:
+            manifest.save()
+            print("処理済みのためスキップ: {}件".format(manifest.skip_count))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    with profiler.session(args.profile, args.cprofile):
+        main()
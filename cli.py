@@ -0,0 +1,112 @@
+"""
+@file cli.py
+@brief 各スクリプトをサブコマンドとして実行する
+       extract: movie2img.py, calc: calc_camera_param.py, calibrate: calibration.py,
+       cut: movie_cutter.py, concat: movie_concatenater.py
+
+       cv2・numpy などを import するのはサブコマンドを実行する時点のみ
+       （--help・引数の誤りでは読み込まないため、繰り返し呼び出すスクリプトからの起動が速い）
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import argparse
+import os
+import sys
+
+# サブコマンド -> (説明, 設定ファイルの cfg_manager のクラス名)
+COMMAND_DICT = {
+    "extract": ("動画からparam算出用の画像を切り出す (movie2img.py)", "Movie2ImgParameters"),
+    "calc": ("画像からparamを算出する (calc_camera_param.py)", "CalculationParameters"),
+    "calibrate": ("画像・動画をcalibrationする (calibration.py)", "CalibrationParameters"),
+    "cut": ("動画を切り出す (movie_cutter.py)", "MovieCutterParameters"),
+    "concat": ("複数の動画を並べる (movie_concatenater.py)", "MovieConcatenaterParameters"),
+}
+
+
+def run_extract(args):
+    import movie2img
+    movie2img.cut_img()
+
+def run_calc(args):
+    import calc_camera_param
+    calc_camera_param.main(args.pattern)
+
+def run_calibrate(args):
+    import calibration
+    calibration.main()
+
+def run_cut(args):
+    import movie_cutter
+    movie_cutter.main()
+
+def run_concat(args):
+    import movie_concatenater
+    movie_concatenater.main()
+
+RUN_DICT = {
+    "extract": run_extract,
+    "calc": run_calc,
+    "calibrate": run_calibrate,
+    "cut": run_cut,
+    "concat": run_concat,
+}
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Camera-Calibration")
+    parser.add_argument("--config-dir", default="",
+                        help="config ディレクトリ（yaml・calibration_param.npz）。既定: ./config")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+    for command, (description, _) in COMMAND_DICT.items():
+        subparser = subparsers.add_parser(command, help=description, description=description)
+        subparser.add_argument("-c", "--config", default="",
+                               help="設定ファイル (yaml)。既定: config ディレクトリ内の同名のyaml")
+        subparser.add_argument("-s", "--set", dest="override_list", action="append", default=[],
+                               metavar="KEY=VALUE",
+                               help="設定ファイルの値を上書きする（複数指定可） 例) -s undistort.interpolation=cubic")
+        # utils.profiler.add_arguments と同じ（--help で profiler を import しないよう個別に定義する）
+        subparser.add_argument("--profile", metavar="JSON", default="",
+                               help="stage 毎の実時間・CPU時間・回数・読み書きしたバイト数・ピークメモリを json に書き出す")
+        subparser.add_argument("--cprofile", metavar="PROF", default="", help="cProfile の結果を書き出す")
+        if command == "calc":
+            subparser.add_argument("-p", "--pattern", type=int, required=True, choices=[0, 1, 2],
+                                   help="0: Checkerboard, 1: Symmetric Circles Grid, 2: Asymmetric Circles Grid")
+    return parser
+
+
+def parse_override(override):
+    """"key=value" -> (key, value)"""
+    key, sep, value = override.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError("KEY=VALUE の形式で指定してください: {}".format(override))
+    return key.strip(), value
+
+
+def main(argv=None):
+    """メイン関数"""
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    try:
+        override_list = [parse_override(override) for override in args.override_list]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.config_dir:
+        # 子プロセス（プロセスプール）にも引き継ぐため環境変数で渡す
+        from utils.path import CONFIG_DIR_ENV
+        os.environ[CONFIG_DIR_ENV] = os.path.abspath(args.config_dir)
+
+    from inout.load import add_override
+    from utils import cfg_manager
+    from utils import profiler
+    config_class = getattr(cfg_manager, COMMAND_DICT[args.command][1])
+    if args.config:
+        config_class.set_yaml_path(os.path.abspath(args.config))
+    for key, value in override_list:
+        add_override(config_class.get_yaml_path(), key, value)
+    with profiler.session(args.profile, args.cprofile, "cli.py {}".format(args.command)):
+        RUN_DICT[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
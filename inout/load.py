@@ -4,8 +4,38 @@
 
 @author Shunsuke Hishida / created 2021/04/16
 """
+import os
+
 import yaml
 
+# yamlファイルの絶対パス -> [(keyのlist, 値), ...] 読み込んだ値を上書きする（cli.py の --set）
+_override_dict = {}
+
+def add_override(path, key, value):
+    """
+    @brief path の yaml を読み込む際に、key の値を value で上書きする
+    @param key (str) "." 区切りのkey 例) "undistort.interpolation"
+    @param value (str) yaml として解釈する 例) "1" -> 1, "[1, 2]" -> [1, 2], "cubic" -> "cubic"
+    """
+    key_list = key.split(".")
+    if not all(key_list):
+        print("[load_yaml][ERROR]keyが不正です: {}".format(key))
+        raise Exception
+    _override_dict.setdefault(os.path.abspath(path), []).append((key_list, yaml.safe_load(value)))
+
+def _apply_overrides(path, cfg_data):
+    for key_list, value in _override_dict.get(os.path.abspath(path), []):
+        node = cfg_data
+        for key in key_list[:-1]:
+            if node.get(key) is None:
+                node[key] = {}
+            node = node[key]
+            if not isinstance(node, dict):
+                print("[load_yaml][ERROR]{} は上書きできません: {}".format(".".join(key_list), path))
+                raise Exception
+        node[key_list[-1]] = value
+    return cfg_data
+
 class Loader(object):
 
     def __init__(self, path):
@@ -22,4 +52,4 @@ class Loader(object):
         except Exception as e:
             print("[load_yaml]yamlファイルのロードができませんでした")
             print(e)
-        return cfg_data
\ No newline at end of file
+        return _apply_overrides(self.__path, cfg_data)
@@ -0,0 +1,183 @@
+"""
+@file overlay.py
+@brief 制御点を描画した確認用の画像をバックグラウンドで書き出す
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import math
+import os
+
+import cv2
+import numpy as np
+
+from inout.save import AsyncImageWriter
+
+TARGET_LIST = ["all", "failures", "outliers"]
+# 検出した時点で該当するかが決まる target（検出で読み込んだ画像をそのまま描画に用いる）
+DETECTION_TARGET_LIST = ["all", "failures"]
+
+
+def is_target(target, ret, outlier=False):
+    """@return (bool) target に該当する画像か"""
+    if target == "all":
+        return ret
+    if target == "failures":
+        return not ret
+    return not ret or outlier
+
+
+def output_size(img_size, scale=1.0, contact_sheet=0, thumb_width=320):
+    """
+    @param img_size (tuple) 元画像の (width, height)
+    @return (tuple) 書き出す画像（contact_sheet の場合は1枚あたり）の (width, height)
+    """
+    width, height = img_size
+    if contact_sheet:
+        return thumb_width, max(1, round(height * thumb_width / width))
+    if scale != 1.0:
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    return width, height
+
+
+class DebugOverlayWriter(object):
+    """
+    描画・縮小・エンコード・書き出しはすべてバックグラウンドのスレッドで行う
+    読み込み済みの画像を渡さなかった場合は、元画像の読み込みもバックグラウンドで行う
+    contact_sheet が有効な場合は、縮小した画像を並べた1枚の画像にまとめて書き出す
+    """
+
+    def __init__(
+                self,
+                save_dir,
+                grid_num_tuple,
+                target="all",
+                every=1,
+                scale=1.0,
+                contact_sheet=0,
+                thumb_width=320,
+                num_workers=2,
+                max_pending=8):
+        """
+        Constructor
+
+        @param save_dir (str) 書き出し先のディレクトリ
+        @param grid_num_tuple (tuple) CalculationParameters.grid_num_tuple
+        @param target (str) all: ボードを検出した全画像（従来通り）, failures: 検出できなかった画像, outliers: 検出できなかった画像と再投影誤差の大きい画像
+        @param every (int) target に該当する画像のうち every 枚毎に書き出す
+        @param scale (float) 1枚ずつ書き出す場合の縮小率
+        @param contact_sheet (int) 0: 1枚ずつ書き出す, N: N x N 枚を並べた画像にまとめて書き出す
+        @param thumb_width (int) contact_sheet での1枚あたりの幅 [px]
+        @param num_workers (int) 描画・書き出しを行うスレッド数
+        @param max_pending (int) 書き出し待ちの画像数（contact_sheet の場合はシート数）の上限
+        """
+        if target not in TARGET_LIST:
+            print("[overlay.py][ERROR]target は {} のうちから選択してください".format(TARGET_LIST))
+            raise Exception
+        os.makedirs(save_dir, exist_ok=True)
+        self.__save_dir = save_dir
+        self.__grid_num_tuple = grid_num_tuple
+        self.__target = target
+        self.__every = max(1, every)
+        self.__scale = scale
+        self.__contact_sheet = contact_sheet
+        self.__thumb_width = thumb_width
+        self.__writer = AsyncImageWriter(num_workers, max_pending)
+        self.__target_count = 0
+        self.__sheet_count = 0
+        self.__entry_list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def output_size(self, img_size):
+        """@return (tuple) 元画像 img_size に対して書き出す画像の (width, height)"""
+        return output_size(img_size, self.__scale, self.__contact_sheet, self.__thumb_width)
+
+    def add(self, index, img_path, ret, corners, outlier=False, label="", img=None, img_size=None):
+        """
+        @brief target・every に該当する画像であれば書き出しを予約する
+        @param index (int) 画像の番号（書き出すファイル名に用いる）
+        @param img_path (str) 元画像のパス
+        @param ret (bool) ボードを検出できたか
+        @param corners (numpy.ndarray) 制御点の画像座標（元画像の座標）
+        @param outlier (bool) 再投影誤差が大きい画像か
+        @param label (str) 画像に書き込む文字列。空ならボードを検出できた画像には書き込まない
+        @param img (numpy.ndarray) 読み込み済みの元画像、もしくは output_size に縮小した画像
+                                   書き出しまで変更しないこと。Noneなら img_path から読み込む
+        @param img_size (tuple) 元画像の (width, height)。Noneなら img の大きさ
+        """
+        if not is_target(self.__target, ret, outlier):
+            return
+        self.__target_count += 1
+        if (self.__target_count - 1) % self.__every:
+            return
+        if img is not None:
+            img_size = img_size or img.shape[1::-1]
+            size = self.output_size(img_size)
+            if img.shape[1::-1] != size:
+                # 並べ終えるまで保持する画像を小さくするため、書き出す大きさに縮小してから渡す
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        entry = (index, img_path, ret, corners, label, img, img_size)
+        if not self.__contact_sheet:
+            path = os.path.join(self.__save_dir, "test_{}.jpg".format(index))
+            self.__writer.write_rendered(path, lambda: self.__render(entry))
+            return
+        self.__entry_list.append(entry)
+        if len(self.__entry_list) == self.__contact_sheet ** 2:
+            self.__flush_sheet()
+
+    def __render(self, entry):
+        """書き出す大きさの画像に制御点・文字列を描画する"""
+        _, img_path, ret, corners, label, img, img_size = entry
+        if img is None:
+            img = cv2.imread(img_path)
+            img_size = None
+        if img is None:
+            img = np.zeros((480, 640, 3), dtype=np.uint8)
+            ret, text = False, "READ ERROR  {}".format(label)
+        else:
+            text = label if ret else "NOT FOUND  {}".format(label)
+        img_size = img_size or img.shape[1::-1]
+        size = self.output_size(img_size)
+        if img.shape[1::-1] != size:
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        if ret:
+            points = corners.reshape(-1, 1, 2).astype(np.float32)
+            if size != tuple(img_size):
+                # 画素の中心を合わせて書き出す画像の座標に変換
+                ratio = np.array([size[0] / img_size[0], size[1] / img_size[1]], dtype=np.float32)
+                points = (points + 0.5) * ratio - 0.5
+            cv2.drawChessboardCorners(img, self.__grid_num_tuple, points, ret)
+        if text:
+            font_scale = max(0.4, img.shape[1] / 800)
+            cv2.putText(img, text, (5, int(25 * font_scale)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 255),
+                        max(1, int(font_scale * 2)), cv2.LINE_AA)
+        return img
+
+    def __render_sheet(self, entry_list):
+        """縮小した画像を contact_sheet x contact_sheet に並べた画像"""
+        thumb_list = [self.__render(entry) for entry in entry_list]
+        thumb_height = max(thumb.shape[0] for thumb in thumb_list)
+        rows = math.ceil(len(thumb_list) / self.__contact_sheet)
+        sheet = np.zeros((rows * thumb_height, self.__contact_sheet * self.__thumb_width, 3), dtype=np.uint8)
+        for i, thumb in enumerate(thumb_list):
+            y = (i // self.__contact_sheet) * thumb_height
+            x = (i % self.__contact_sheet) * self.__thumb_width
+            sheet[y:y + thumb.shape[0], x:x + thumb.shape[1]] = thumb
+        return sheet
+
+    def __flush_sheet(self):
+        if not self.__entry_list:
+            return
+        entry_list, self.__entry_list = self.__entry_list, []
+        self.__sheet_count += 1
+        path = os.path.join(self.__save_dir, "sheet_{}.jpg".format(self.__sheet_count))
+        self.__writer.write_rendered(path, lambda: self.__render_sheet(entry_list))
+
+    def close(self):
+        """並べ途中のシートを書き出し、書き出し待ちの画像をすべて書き出して終了する"""
+        self.__flush_sheet()
+        self.__writer.close()
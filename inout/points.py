@@ -0,0 +1,79 @@
+"""
+@file points.py
+@brief アノテーション（点の座標）ファイルの読み書きを行う
+       csv: x, y 列を持つヘッダ付きのcsv（他の列はそのまま書き出す）
+       json: {"x": .., "y": ..} のlist、もしくは [x, y] のlist
+       npy: (..., 2) の配列
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+POINTS_EXT_LIST = [".csv", ".json", ".npy"]
+
+
+def _get_ext(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in POINTS_EXT_LIST:
+        print("[points.py][ERROR]対応していない拡張子です: {} ({} のうちから選択してください)".format(path, POINTS_EXT_LIST))
+        raise Exception
+    return ext
+
+
+def load_points(path, x_key="x", y_key="y"):
+    """
+    @brief アノテーションファイルから点の座標を読み込む
+    @param x_key, y_key (str) csvの列名・jsonのkey
+    @return points (numpy.ndarray) (N, 2)
+    @return records (list or tuple) 座標以外の情報。save_points にそのまま渡す
+                                    （csv/jsonのdictのlist、npyは元のshape）
+    """
+    ext = _get_ext(path)
+    if ext == ".npy":
+        array = np.load(path)
+        return array.reshape(-1, 2).astype(np.float64), array.shape
+    if ext == ".csv":
+        with open(path, mode="r", encoding="utf-8", newline="") as f:
+            records = list(csv.DictReader(f))
+    else:
+        with open(path, mode="r", encoding="utf-8") as f:
+            records = json.load(f)
+    if records and not isinstance(records[0], dict):
+        # [x, y] のlist
+        return np.array(records, dtype=np.float64).reshape(-1, 2), None
+    points = np.array([[float(r[x_key]), float(r[y_key])] for r in records], dtype=np.float64).reshape(-1, 2)
+    return points, records
+
+
+def save_points(path, points, records=None, x_key="x", y_key="y"):
+    """
+    @brief 点の座標をアノテーションファイルに書き出す
+           records が load_points で読み込んだdictのlistであれば、座標のみ差し替えて他の列・keyは残す
+    @param points (numpy.ndarray) (N, 2)
+    @param records (list or tuple) load_points の戻り値
+    """
+    ext = _get_ext(path)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if ext == ".npy":
+        shape = records if isinstance(records, tuple) else points.shape
+        np.save(path, points.reshape(shape))
+        return
+    if isinstance(records, list):
+        records = [dict(r, **{x_key: float(x), y_key: float(y)}) for r, (x, y) in zip(records, points)]
+    elif ext == ".csv":
+        records = [{x_key: float(x), y_key: float(y)} for x, y in points]
+    else:
+        records = points.tolist()
+    if ext == ".json":
+        with open(path, mode="w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=1)
+        return
+    fieldnames = list(records[0].keys()) if records else [x_key, y_key]
+    with open(path, mode="w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(records)
@@ -4,9 +4,15 @@
 
 @author Shunsuke Hishida / created 2021/04/09
 """
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
 
+import cv2
 import numpy as np
 
+from utils import profiler
+
 class Saver(object):
     def __init__(self, path, **kwargs):
         """Constructor"""
@@ -14,8 +20,81 @@ class Saver(object):
         self.__data = kwargs
 
     def save_npz(self):
-        np.savez(
-            self.__path,
-            camera_matrix=self.__data["camera_matrix"],
-            distortion=self.__data["distortion"],
-            )
\ No newline at end of file
+        """
+        一時ファイルに書き出してから置き換える
+        （書き出し中に calibration.py などが読み込んでも、書きかけのファイルを読まないようにする）
+        """
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, mode="wb") as f:
+            data = {
+                "camera_matrix": self.__data["camera_matrix"],
+                "distortion": self.__data["distortion"],
+            }
+            if self.__data.get("image_size") is not None:
+                # paramを算出した画像の解像度（別の解像度の画像に適用する際にカメラ行列を変換する）
+                data["image_size"] = np.array(self.__data["image_size"])
+            np.savez(f, **data)
+        os.replace(tmp_path, self.__path)
+
+
+class AsyncImageWriter(object):
+    """画像のエンコード・書き出しをバックグラウンドのスレッドプールで行う"""
+
+    @property
+    def error_list(self): return self.__error_list
+
+    def __init__(self, num_workers=4, max_pending=32):
+        """
+        Constructor
+
+        @param num_workers (int) エンコード・書き出しを行うスレッド数
+        @param max_pending (int) 書き出し待ちの画像数の上限。上限に達すると write は空きが出るまで待つ
+        """
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, num_workers))
+        self.__semaphore = threading.BoundedSemaphore(max(1, max_pending))
+        self.__error_list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __write(self, path, img, params):
+        try:
+            if callable(img):
+                with profiler.stage("render"):
+                    img = img()
+            with profiler.stage("imwrite"):
+                ret = cv2.imwrite(path, img, params or [])
+            if not ret:
+                self.__error_list.append(path)
+            else:
+                profiler.add_file("imwrite", path, written=True)
+        except Exception as e:
+            print(e)
+            self.__error_list.append(path)
+        finally:
+            self.__semaphore.release()
+
+    def write(self, path, img, params=None):
+        """
+        @brief 画像の書き出しを予約する。img は書き出し完了まで変更しないこと
+        @param params (list) cv2.imwrite に渡すパラメータ
+        """
+        self.__semaphore.acquire()
+        self.__executor.submit(self.__write, path, img, params)
+
+    def write_rendered(self, path, render, params=None):
+        """
+        @brief 画像の生成から書き出しまでをバックグラウンドで行う
+        @param render (function) 引数なしで呼ばれ、書き出す画像を返す関数
+        """
+        self.__semaphore.acquire()
+        self.__executor.submit(self.__write, path, render, params)
+
+    def close(self):
+        """書き出し待ちの画像をすべて書き出して終了する"""
+        self.__executor.shutdown(wait=True)
+        if self.__error_list:
+            print("[AsyncImageWriter][ERROR]{}枚の画像を書き出せませんでした".format(len(self.__error_list)))
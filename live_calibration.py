@@ -0,0 +1,311 @@
+"""
+@file live_calibration.py
+@brief カメラ・動画の映像からボードを検出しながら、バックグラウンドでカメラ行列・レンズ歪みを求め直す
+       （movie2img.py -> calc_camera_param.py を、画像を書き出さずに連続して行う）
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import cv2
+import numpy as np
+
+from calc_camera_param import make_calculator
+from inout.save import Saver
+from utils.calib_solver import CalibrationSolver, board_features
+from utils.cfg_manager import CalculationParameters, LiveCalibrationParameters
+from utils.path import ConfigPathMaker
+
+
+class Intrinsics(object):
+    """ある時点で求めたカメラ行列・レンズ歪みの組（生成後は変更しない）"""
+
+    @property
+    def camera_matrix(self): return self.__camera_matrix
+
+    @property
+    def distortion(self): return self.__distortion
+
+    @property
+    def rms(self): return self.__rms
+
+    @property
+    def num_views(self): return self.__num_views
+
+    @property
+    def version(self): return self.__version
+
+    @property
+    def image_size(self): return self.__image_size
+
+    def __init__(self, camera_matrix, distortion, rms, num_views, version, image_size=None):
+        """
+        @param rms (float) 再投影誤差 [px]
+        @param num_views (int) 求めるのに用いたフレーム数
+        @param version (int) 何回目に求めた結果か
+        @param image_size (tuple) (width, height) 求めるのに用いたフレームの解像度
+        """
+        self.__camera_matrix = camera_matrix
+        self.__distortion = distortion
+        self.__rms = rms
+        self.__num_views = num_views
+        self.__version = version
+        self.__image_size = image_size
+
+
+class IntrinsicsPublisher(object):
+    """
+    最新の Intrinsics を保持する
+    参照の差し替えのみで更新するため、読み出し側は常に同じ回に求めたカメラ行列・レンズ歪みの組を得る
+    """
+
+    @property
+    def latest(self): return self.__latest
+
+    def __init__(self):
+        """Constructor"""
+        self.__latest = None
+        self.__lock = threading.Lock()
+
+    def publish(self, intrinsics):
+        """
+        @brief 現在より新しい結果であれば差し替える
+        @return (bool) 差し替えたか
+        """
+        with self.__lock:
+            if self.__latest is not None and intrinsics.version <= self.__latest.version:
+                return False
+            self.__latest = intrinsics
+        print("[live] #{} view数: {}, RMS: {:.4f} px, fx: {:.2f}, fy: {:.2f}, cx: {:.2f}, cy: {:.2f}".format(
+            intrinsics.version, intrinsics.num_views, intrinsics.rms,
+            intrinsics.camera_matrix[0, 0], intrinsics.camera_matrix[1, 1],
+            intrinsics.camera_matrix[0, 2], intrinsics.camera_matrix[1, 2]))
+        return True
+
+    def save(self, path):
+        """
+        @brief 最新の結果をnpzに書き出す
+        @return (bool) 書き出したか（まだ求めていない場合は書き出さない）
+        """
+        latest = self.__latest
+        if latest is None:
+            return False
+        saver = Saver(
+                    path,
+                    camera_matrix=latest.camera_matrix,
+                    distortion=latest.distortion,
+                    image_size=latest.image_size)
+        saver.save_npz()
+        return True
+
+
+class LatestFrameReader(object):
+    """
+    別スレッドでフレームを読み続け、最新のフレームのみを保持する
+    検出が映像のフレームレートに追いつかない場合に、カメラ・RTSPのバッファに古いフレームが溜まらないようにする
+    """
+
+    def __init__(self, cap):
+        """
+        @param cap (cv2.VideoCapture)
+        """
+        self.__cap = cap
+        self.__frame = None
+        self.__ended = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            ret, frame = self.__cap.read()
+            with self.__condition:
+                if not ret or self.__ended:
+                    self.__ended = True
+                    self.__condition.notify_all()
+                    return
+                self.__frame = frame
+                self.__condition.notify_all()
+
+    def read(self):
+        """
+        @brief 前回の read 以降に読んだ最新のフレームを返す（まだなければ読まれるまで待つ）
+        @return ret (bool) フレームを取得できたか（映像の終了時は False）
+        """
+        with self.__condition:
+            while self.__frame is None and not self.__ended:
+                self.__condition.wait()
+            frame, self.__frame = self.__frame, None
+        return frame is not None, frame
+
+    def release(self):
+        with self.__condition:
+            self.__ended = True
+        self.__thread.join()
+        self.__cap.release()
+
+
+class LiveCalibrator(object):
+
+    @property
+    def num_views(self): return len(self.__img_coords)
+
+    def __init__(self, calculator, calc_params, config, publisher):
+        """
+        Constructor
+
+        @param calculator (CameraParamCalculator) ボードの検出に用いる
+        @param calc_params (CalculationParameters) grid数、solverの設定
+        @param config (LiveCalibrationParameters)
+        @param publisher (IntrinsicsPublisher) 求め直した結果の公開先
+        """
+        self.__calculator = calculator
+        self.__calc_params = calc_params
+        self.__config = config
+        self.__publisher = publisher
+        self.__img_coords = []
+        self.__feature_list = []
+        self.__img_size = None
+        self.__solved_views = 0     # 最後に求め直しを開始した時点の採用フレーム数
+        self.__version = 0
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__future = None
+
+    def feed(self, img):
+        """
+        @brief 1フレームからボードを検出し、採用済みのフレームと写り方が異なれば採用する
+               採用フレームが recalib_every 枚増えた時点で、バックグラウンドで求め直す
+        @param img (numpy.ndarray) BGR画像
+        @return ret (bool) ボードを検出できたか
+        @return corners (numpy.ndarray) 制御点の画像座標
+        @return accepted (bool) 採用したか
+        """
+        ret, corners = self.__calculator.detect_board(img)
+        if not ret:
+            return ret, corners, False
+        img_size = img.shape[1::-1]
+        if self.__img_size is not None and img_size != self.__img_size:
+            print("[live][WARNING]解像度が変わったフレームは用いません")
+            return ret, corners, False
+        self.__img_size = img_size
+
+        corners = corners.reshape(-1, 1, 2).astype(np.float32)
+        feature = board_features(corners[None], self.__calc_params.grid_num_tuple, img_size)[0]
+        if self.__feature_list and \
+                np.linalg.norm(np.array(self.__feature_list) - feature, axis=1).min() < self.__config.min_distance:
+            return ret, corners, False
+        self.__img_coords.append(corners)
+        self.__feature_list.append(feature)
+
+        if self.num_views >= self.__config.min_views and \
+                self.num_views - self.__solved_views >= self.__config.recalib_every and \
+                (self.__future is None or self.__future.done()):
+            self.__submit()
+        return ret, corners, True
+
+    def __submit(self):
+        """その時点の採用フレームで求め直すjobをバックグラウンドのスレッドに投入する"""
+        self.__check_previous()
+        self.__solved_views = self.num_views
+        self.__version += 1
+        self.__future = self.__executor.submit(self.__solve, list(self.__img_coords), self.__version)
+
+    def __check_previous(self):
+        """前回の求め直しが失敗していれば表示する（future を置き換えると例外が失われるため）"""
+        if self.__future is None or not self.__future.done():
+            return
+        error = self.__future.exception()
+        if error is not None:
+            print("[live_calibration.py][ERROR]paramの求め直しに失敗しました (version {})".format(self.__version))
+            print(error)
+
+    def __solve(self, img_coords, version):
+        latest = self.__publisher.latest
+        params = self.__calc_params
+        solver = CalibrationSolver(
+                                    # 前回の結果を初期値とする
+                                    None if latest is None else (latest.camera_matrix, latest.distortion),
+                                    params.prune_max_iter,
+                                    params.prune_threshold_px,
+                                    params.prune_threshold_ratio,
+                                    self.__config.min_views,
+                                    self.__config.max_views,
+                                    params.tolerance_px)
+        obj_coords = [self.__calculator.board_coords] * len(img_coords)
+        camera_matrix, dist, _, _ = solver.solve(obj_coords, img_coords, self.__img_size, params.grid_num_tuple)
+        self.__publisher.publish(Intrinsics(camera_matrix, dist, solver.rms, len(solver.view_index), version, self.__img_size))
+
+    def finish(self):
+        """
+        @brief 実行中の求め直しの終了を待ち、最後に求め直した後に採用したフレームがあれば全フレームで求め直す
+        """
+        if self.__future is not None:
+            self.__future.result()
+        if self.num_views >= self.__config.min_views and self.num_views > self.__solved_views:
+            self.__submit()
+            self.__future.result()
+        self.__executor.shutdown()
+
+
+def draw_preview(img, corners, ret, live, publisher, grid_num_tuple):
+    """検出結果と現在のカメラ行列を描画した画像"""
+    preview = img.copy()
+    if ret:
+        cv2.drawChessboardCorners(preview, grid_num_tuple, corners, ret)
+    latest = publisher.latest
+    text = "views: {}".format(live.num_views)
+    if latest is not None:
+        text += "  RMS: {:.3f}px  fx: {:.1f}  fy: {:.1f}".format(
+            latest.rms, latest.camera_matrix[0, 0], latest.camera_matrix[1, 1])
+    cv2.putText(preview, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2, cv2.LINE_AA)
+    return preview
+
+
+def main():
+    config = LiveCalibrationParameters(LiveCalibrationParameters.get_yaml_path())
+    calc_params = CalculationParameters(CalculationParameters.get_yaml_path())
+    calculator = make_calculator(config.pattern, calc_params)
+    cap = cv2.VideoCapture(config.source)
+    if not cap.isOpened():
+        print("[live_calibration.py][ERROR]映像を開けませんでした: {}".format(config.source))
+        return
+    publisher = IntrinsicsPublisher()
+    live = LiveCalibrator(calculator, calc_params, config, publisher)
+    reader = LatestFrameReader(cap) if config.drop_frames else cap
+
+    frame_num = 0
+    try:
+        while True:
+            ret, img = reader.read()
+            if not ret:
+                break
+            frame_num += 1
+            if (frame_num - 1) % config.sample_step:
+                continue
+            ret, corners, _ = live.feed(img)
+            if config.preview:
+                cv2.imshow(
+                        "live_calibration",
+                        draw_preview(img, corners, ret, live, publisher, calc_params.grid_num_tuple))
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.release()
+        if config.preview:
+            cv2.destroyAllWindows()
+    live.finish()
+    if publisher.latest is None:
+        print("[live_calibration.py][ERROR]カメラ行列を求めるのに必要なフレーム数 ({}) を採用できませんでした".format(
+            config.min_views))
+    elif config.save:
+        # 求め直す毎には書き出さず、終了時の結果のみを書き出す
+        save_path = ConfigPathMaker(config.file_name, ext="npz").path
+        publisher.save(save_path)
+        print("[live_calibration.py]paramを保存: {}".format(save_path))
+    print("DONE")
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,77 @@
 
 @author Shunsuke Hishida / created on 2021/05/26
 """
+import argparse
+import time
+
 import cv2
 
-from utils.cfg_manager import Movie2ImgParameters
+from calc_camera_param import make_calculator
+from inout.save import AsyncImageWriter
+from utils.cfg_manager import CalculationParameters, Movie2ImgParameters
+from utils.frame_selector import FrameSelector
 from utils.path import ImgForCalibPathMaker
+from utils import profiler
 
 
-def cut_intervally(cap, start_time, end_time, output_number, ext):
+class FrameSkipper(object):
+    """
+    次に取り出すフレームまで進む方法を、seek と grab の実測コストから選ぶ
+    間隔が短い場合は grab でフレームを読み飛ばす方が、keyframeからデコードし直す seek より速い
+    """
+
+    def __init__(self, cap, position=0):
+        """
+        Constructor
+
+        @param cap (cv2.VideoCapture)
+        @param position (int) 次に read するフレーム番号
+        """
+        self.__cap = cap
+        self.__position = position
+        self.__grab_cost = None     # grab 1回あたりの時間 [sec]
+        self.__seek_cost = None     # seek 1回あたりの時間 [sec]
+
+    def read(self, frame_num):
+        """
+        @brief 指定のフレームを読み出す
+        @param frame_num (int) 読み出すフレーム番号（前回より後ろのフレームであること）
+        """
+        skip_num = frame_num - self.__position
+        with profiler.stage("decode"):
+            if skip_num > 0:
+                if self.__use_grab(skip_num):
+                    self.__grab(skip_num)
+                else:
+                    self.__seek(frame_num)
+            ret, img = self.__cap.read()
+        self.__position = frame_num + 1
+        return ret, img
+
+    def __use_grab(self, skip_num):
+        # 両方のコストが分かるまでは交互に試す
+        if self.__grab_cost is None:
+            return True
+        if self.__seek_cost is None:
+            return False
+        return skip_num * self.__grab_cost <= self.__seek_cost
+
+    def __grab(self, skip_num):
+        start = time.perf_counter()
+        for _ in range(skip_num):
+            if not self.__cap.grab():
+                break
+        cost = (time.perf_counter() - start) / skip_num
+        self.__grab_cost = cost if self.__grab_cost is None else 0.8 * self.__grab_cost + 0.2 * cost
+
+    def __seek(self, frame_num):
+        start = time.perf_counter()
+        self.__cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+        cost = time.perf_counter() - start
+        self.__seek_cost = cost if self.__seek_cost is None else 0.8 * self.__seek_cost + 0.2 * cost
+
+
+def cut_intervally(cap, start_time, end_time, output_number, ext, writer):
     """
     @brief 一定間隔に切り出す
     """
@@ -26,29 +90,75 @@ def cut_intervally(cap, start_time, end_time, output_number, ext):
     if end_frame > final_frame:
         end_frame = final_frame
     # step: 切り出すフレーム間隔
-    step = int((end_frame - start_frame) / output_number)
+    step = max(1, int((end_frame - start_frame) / output_number))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    skipper = FrameSkipper(cap, start_frame)
     for index, frame_num in enumerate(range(start_frame, end_frame, step), start=1):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-        ret, img = cap.read()   # img: (numpy.ndarray)
+        ret, img = skipper.read(frame_num)   # img: (numpy.ndarray)
         if ret:
             path_maker = ImgForCalibPathMaker(index, ext)
             save_path = path_maker.path
-            cv2.imwrite(save_path, img)
+            writer.write(save_path, img)
         else:
             break
     cap.release()
 
-def cut_all(cap, ext):
+def cut_selectively(cap, start_time, end_time, output_number, ext, writer, config):
+    """
+    @brief calibrationに有効なフレームを選んで切り出す
+           sample_step 毎にフレームを評価し、ボード全体が写ったフレームの中から
+           鮮明で、かつボードの位置・大きさ・傾きがばらつくように output_number 枚を選ぶ
+    """
+    if not start_time < end_time:
+        print("[ERROR]切り出し開始時間と切り出し終了時間の大小関係")
+        raise Exception
+    final_frame = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    start_frame = start_time * fps
+    end_frame = min(end_time * fps, final_frame)
+
+    calc_params = CalculationParameters(CalculationParameters.get_yaml_path())
+    selector = FrameSelector(
+                            make_calculator(config.select_pattern, calc_params),
+                            calc_params.grid_num_tuple,
+                            config.select_detect_max_side,
+                            config.select_min_sharpness_ratio)
+    # 1回目: 候補フレームの評価
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    skipper = FrameSkipper(cap, start_frame)
+    for frame_num in range(start_frame, end_frame, config.select_step):
+        ret, img = skipper.read(frame_num)
+        if not ret:
+            break
+        with profiler.stage("select"):
+            selector.evaluate(frame_num, img)
+    frame_num_list = selector.select(output_number)
+    print("評価したフレームのうちボードを検出: {}枚, 選択: {}枚".format(selector.candidate_num, len(frame_num_list)))
+
+    # 2回目: 選んだフレームのみ読み出して書き出す
+    if frame_num_list:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num_list[0])
+        skipper = FrameSkipper(cap, frame_num_list[0])
+    for index, frame_num in enumerate(frame_num_list, start=1):
+        ret, img = skipper.read(frame_num)
+        if not ret:
+            break
+        path_maker = ImgForCalibPathMaker(index, ext)
+        writer.write(path_maker.path, img)
+    cap.release()
+
+def cut_all(cap, ext, writer):
     """
     @brief 全フレーム切り出す
     """
     index = 1
     while True:
-        ret, img = cap.read()
+        with profiler.stage("decode"):
+            ret, img = cap.read()
         if ret:
             path_maker = ImgForCalibPathMaker(index, ext)
             save_path = path_maker.path
-            cv2.imwrite(save_path, img)
+            writer.write(save_path, img)
             index += 1
         else:
             break
@@ -63,6 +173,7 @@ def cut_img():
     cap = cv2.VideoCapture(config.input_path)
     if not cap.isOpened():
         return
+    profiler.add_file("decode", config.input_path)
     """
     FIXME: 本当は総フレーム数を取得して、endtime(フレーム番号)が総フレーム数より
     大きい場合は、end_time = fps * 総フレーム数に書き換える処理を入れたいが、なぜか
@@ -70,17 +181,34 @@ def cut_img():
     よって現状はこの処理を省いている
     """
     # os.makedirs(output_dir, exist_ok=True)
-    if config.cut_flag:
-        cut_all(cap, config.extension)
-    else:
-        cut_intervally(
-                    cap,
-                    config.start_time,
-                    config.end_time,
-                    config.output_number,
-                    config.extension
-                    )
+    # 画像のエンコード・書き出しはデコードと別のスレッドで行う
+    with AsyncImageWriter(config.writer_workers, config.writer_max_pending) as writer:
+        if config.select_enable:
+            cut_selectively(
+                        cap,
+                        config.start_time,
+                        config.end_time,
+                        config.output_number,
+                        config.extension,
+                        writer,
+                        config
+                        )
+        elif config.cut_flag:
+            cut_all(cap, config.extension, writer)
+        else:
+            cut_intervally(
+                        cap,
+                        config.start_time,
+                        config.end_time,
+                        config.output_number,
+                        config.extension,
+                        writer
+                        )
     print("DONE")
 
 if __name__ == "__main__":
-    cut_img()
+    parser = argparse.ArgumentParser()
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    with profiler.session(args.profile, args.cprofile):
+        cut_img()
@@ -4,11 +4,14 @@
 
 @author Shunsuke Hishida / created on 2021/06/04
 """
+import argparse
 import os
 
 import cv2
 
 from utils.cfg_manager import MovieCutterParameters
+from utils import ffmpeg
+from utils import profiler
 
 def setOutputFormat(movie, save_path):
     """
@@ -43,21 +46,56 @@ def cutMovie(data_path, start_time, end_time, save_path):
     movie = cv2.VideoCapture(data_path)
     new_movie = setOutputFormat(movie, save_path)
     start_frame, end_frame = setRange(movie, start_time, end_time)
-    for frame_num in range(start_frame, end_frame, 1):
-        movie.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-        ret, frame = movie.read()
+    # seekは最初の1回のみ。以降は順に読み出す（毎フレームseekするとkeyframeからのデコードが繰り返される）
+    movie.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    for _ in range(start_frame, end_frame, 1):
+        with profiler.stage("decode"):
+            ret, frame = movie.read()
         if ret:
-            new_movie.write(frame)
+            with profiler.stage("encode"):
+                new_movie.write(frame)
         else:
             break
     movie.release()
     new_movie.release()
+    profiler.add_file("encode", save_path, written=True)
+
+def copyMovie(data_path, start_time, end_time, save_path):
+    """
+    @brief 指定の時間で動画をstream copyで切り出す
+           keyframe間はデコード・再エンコードせずにコピーし、範囲の端の不完全なGOPのみ再エンコードする
+           ffmpeg が使えない、もしくは再エンコードできないcodecの場合は cutMovie で切り出す
+    """
+    if not start_time < end_time:
+        print("[ERROR]切り出し開始時間と切り出し終了時間の大小関係")
+        raise Exception
+    if ffmpeg.is_available():
+        movie = cv2.VideoCapture(data_path)
+        fps = movie.get(cv2.CAP_PROP_FPS)
+        start_frame, end_frame = setRange(movie, start_time, end_time)
+        movie.release()
+        with profiler.stage("stream_copy"):
+            copied = ffmpeg.stream_copy_cut(data_path, start_frame / fps, end_frame / fps, save_path)
+        if copied:
+            profiler.add_file("stream_copy", save_path, written=True)
+            return
+        print("[movie_cutter.py]stream copy で切り出せない（codecが非対応、もしくは連結した動画が不正な）ため、再エンコードで切り出します")
+    else:
+        print("[movie_cutter.py]ffmpeg が見つからないため、再エンコードで切り出します")
+    cutMovie(data_path, start_time, end_time, save_path)
 
 def main():
     """メイン関数"""
     rmc = MovieCutterParameters(MovieCutterParameters.get_yaml_path())
     save_path = os.path.join(rmc.output_dir, "cut_{}".format(os.path.basename(rmc.input_path)))
-    cutMovie(rmc.input_path, rmc.start_time, rmc.end_time, save_path)
+    if rmc.stream_copy:
+        copyMovie(rmc.input_path, rmc.start_time, rmc.end_time, save_path)
+    else:
+        cutMovie(rmc.input_path, rmc.start_time, rmc.end_time, save_path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    with profiler.session(args.profile, args.cprofile):
+        main()
\ No newline at end of file
@@ -0,0 +1,8 @@
+"""
+@file conftest.py
+@brief テストから utils/・inout/ をスクリプトと同じく import できるよう、リポジトリ直下を import パスに加える
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
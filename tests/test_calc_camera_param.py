@@ -0,0 +1,69 @@
+"""
+@file test_calc_camera_param.py
+@brief 縮小画像での探索 (pyramid) で、cornerSubPix を元解像度でのみ行うこと
+"""
+import os
+
+import cv2
+import numpy as np
+import pytest
+import yaml
+
+from benchmark.synthetic import CHECKER_BOARD, SyntheticBoard, SyntheticCamera, make_images
+from calc_camera_param import make_calculator
+from utils.cfg_manager import CalculationParameters
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GRID_NUM = (9, 6)
+
+
+@pytest.fixture
+def calculator(tmp_path):
+    with open(os.path.join(ROOT_DIR, "config", "calc_camera_param.yaml"), mode="r", encoding="utf-8") as f:
+        cfg_data = yaml.safe_load(f)
+    cfg_data["grid_interval"] = 25
+    cfg_data["grid_num"] = {"vertical": GRID_NUM[0], "horizontal": GRID_NUM[1]}
+    cfg_data["detection"].update(pyramid=1, pyramid_max_side=640, tracking=0, num_workers=1)
+    path = str(tmp_path / "calc_camera_param.yaml")
+    with open(path, mode="w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg_data, f)
+    return make_calculator(CHECKER_BOARD, CalculationParameters(path))
+
+
+@pytest.fixture
+def board_image():
+    camera = SyntheticCamera((1920, 1440))
+    board = SyntheticBoard(CHECKER_BOARD, GRID_NUM, 25)
+    img_list, corners_list = make_images(board, camera, 1, 600.0)
+    return img_list[0], corners_list[0].reshape(-1, 2)
+
+
+def count_subpix(monkeypatch):
+    size_list = []
+    corner_sub_pix = cv2.cornerSubPix
+
+    def counted(gray_img, *args, **kwargs):
+        size_list.append(gray_img.shape)
+        return corner_sub_pix(gray_img, *args, **kwargs)
+
+    monkeypatch.setattr(cv2, "cornerSubPix", counted)
+    return size_list
+
+
+def test_pyramid_refines_once_at_full_resolution(calculator, board_image, monkeypatch):
+    img, truth = board_image
+    size_list = count_subpix(monkeypatch)
+    ret, corners = calculator.detect_board(img)
+    assert ret
+    assert size_list == [img.shape[:2]]
+    # 検出される制御点の順序はボードの向きによるため、最も近い真値との誤差を見る
+    distance = np.linalg.norm(corners.reshape(-1, 1, 2) - truth[None], axis=2)
+    assert distance.min(axis=1).max() < 0.5
+
+
+def test_find_board_does_not_refine(calculator, board_image, monkeypatch):
+    img, _ = board_image
+    size_list = count_subpix(monkeypatch)
+    ret, _ = calculator.find_board(img)
+    assert ret
+    assert size_list == []
@@ -0,0 +1,61 @@
+"""
+@file test_calib_solver.py
+@brief CalibrationSolver が再投影誤差の大きいviewを除外し、残りのviewで元のカメラ行列を求めること
+"""
+import cv2
+import numpy as np
+
+from utils.calib_solver import CalibrationSolver, project_points
+
+GRID_NUM = (9, 6)
+IMG_SIZE = (1280, 720)
+CAMERA_MATRIX = np.array([[900.0, 0.0, 640.0], [0.0, 900.0, 360.0], [0.0, 0.0, 1.0]])
+DISTORTION = np.array([[-0.2, 0.05, 0.0, 0.0, 0.0]])
+OUTLIER = (3, 11)
+
+
+def make_views(num_views=16, seed=0):
+    """ボードを様々な姿勢で写した制御点（OUTLIER のviewのみ検出を誤ったように大きく乱す）"""
+    rng = np.random.default_rng(seed)
+    board = np.zeros((GRID_NUM[0] * GRID_NUM[1], 3), np.float32)
+    board[:, :2] = np.mgrid[0:GRID_NUM[0], 0:GRID_NUM[1]].T.reshape(-1, 2) * 30.0
+    board[:, :2] -= board[:, :2].mean(axis=0)
+    obj_coords, img_coords = [], []
+    for i in range(num_views):
+        rvec = rng.uniform(-0.5, 0.5, 3)
+        tvec = np.array([rng.uniform(-100, 100), rng.uniform(-60, 60), rng.uniform(550, 800)])
+        img_points, _ = cv2.projectPoints(board, rvec, tvec, CAMERA_MATRIX, DISTORTION)
+        img_points = img_points.reshape(-1, 1, 2) + rng.normal(0, 0.05, (len(board), 1, 2))
+        if i in OUTLIER:
+            img_points += rng.normal(0, 8.0, img_points.shape)
+        obj_coords.append(board)
+        img_coords.append(img_points.astype(np.float32))
+    return obj_coords, img_coords
+
+
+def test_project_points_matches_opencv():
+    obj_coords, _ = make_views(1)
+    rvec, tvec = np.array([0.1, -0.2, 0.05]), np.array([10.0, -5.0, 600.0])
+    expected, _ = cv2.projectPoints(obj_coords[0], rvec, tvec, CAMERA_MATRIX, DISTORTION)
+    actual = project_points(obj_coords[0][None], rvec[None], tvec[None], CAMERA_MATRIX, DISTORTION)
+    np.testing.assert_allclose(actual.reshape(-1, 2), expected.reshape(-1, 2), atol=1e-6)
+
+
+def test_prune_outlier_views():
+    obj_coords, img_coords = make_views()
+    solver = CalibrationSolver(prune_max_iter=3, min_views=8)
+    camera_matrix, _, _, _ = solver.solve(obj_coords, img_coords, IMG_SIZE, GRID_NUM)
+
+    assert solver.outlier_index == sorted(OUTLIER)
+    assert not set(OUTLIER) & set(solver.view_index.tolist())
+    assert len(solver.view_index) == len(obj_coords) - len(OUTLIER)
+    assert solver.rms < 0.2
+    np.testing.assert_allclose(camera_matrix, CAMERA_MATRIX, rtol=0.01, atol=2.0)
+
+
+def test_no_pruning_by_default():
+    obj_coords, img_coords = make_views()
+    solver = CalibrationSolver(min_views=8)
+    solver.solve(obj_coords, img_coords, IMG_SIZE, GRID_NUM)
+    assert len(solver.view_index) == len(obj_coords)
+    assert solver.rms > 1.0
@@ -0,0 +1,89 @@
+"""
+@file test_camera_registry.py
+@brief CameraRegistry のファイルとカメラIDの対応付け、解像度毎のnpzの選択、カメラ行列の解像度の変換
+"""
+import numpy as np
+import pytest
+
+from utils.camera_registry import CameraRegistry, CameraSpec
+
+CAMERA_MATRIX = np.array([[1000.0, 0.0, 959.5], [0.0, 1000.0, 539.5], [0.0, 0.0, 1.0]])
+DISTORTION = np.array([[-0.1, 0.02, 0.0, 0.0, 0.0]])
+
+
+def save_npz(path, image_size=None):
+    values = {"camera_matrix": CAMERA_MATRIX, "distortion": DISTORTION}
+    if image_size is not None:
+        values["image_size"] = np.array(image_size)
+    np.savez(path, **values)
+    return path
+
+
+def test_camera_spec_npz_path():
+    spec = CameraSpec("cam", {"1920x1080": "full.npz", "default": "other.npz"})
+    assert spec.npz_path((1920, 1080)) == "full.npz"
+    assert spec.npz_path((1280, 720)) == "other.npz"
+    assert CameraSpec("cam", {"1920x1080": "full.npz"}).npz_path((1280, 720)) == "full.npz"
+    assert CameraSpec("cam", "single.npz").npz_path((640, 480)) == "single.npz"
+
+
+def test_resolve_by_path_pattern():
+    registry = CameraRegistry(
+                            [
+                                CameraSpec("front", "front.npz", pattern="*/front/*"),
+                                CameraSpec("rear", "rear.npz", pattern="*_rear.mp4"),
+                            ],
+                            default_id="front")
+    assert registry.resolve("/data/front/0001.mp4") == "front"
+    assert registry.resolve("/data/0001_rear.mp4") == "rear"
+    # どのパターンにも一致しなければ default
+    assert registry.resolve("/data/side/0001.mp4") == "front"
+    assert CameraRegistry([CameraSpec("rear", "rear.npz", pattern="*_rear.mp4")]).resolve("a.mp4") == ""
+
+
+def test_unknown_ids():
+    with pytest.raises(Exception):
+        CameraRegistry([CameraSpec("front", "front.npz")], default_id="rear")
+    with pytest.raises(Exception):
+        CameraRegistry([CameraSpec("front", "front.npz")]).npz_path("rear", (1920, 1080))
+
+
+def test_get_same_size(tmp_path):
+    path = save_npz(str(tmp_path / "front.npz"), (1920, 1080))
+    registry = CameraRegistry([CameraSpec("front", path)])
+    calib_param = registry.get("front", (1920, 1080))
+    np.testing.assert_array_equal(calib_param.camera_matrix, CAMERA_MATRIX)
+    # 読み込んだparamは保持する
+    assert registry.get("front", (1920, 1080)) is calib_param
+
+
+def test_get_without_image_size(tmp_path):
+    path = save_npz(str(tmp_path / "front.npz"))
+    calib_param = CameraRegistry([CameraSpec("front", path)]).get("front", (1280, 720))
+    np.testing.assert_array_equal(calib_param.camera_matrix, CAMERA_MATRIX)
+    assert calib_param.image_size is None
+
+
+def test_get_scaled(tmp_path):
+    path = save_npz(str(tmp_path / "front.npz"), (1920, 1080))
+    registry = CameraRegistry([CameraSpec("front", path)])
+    calib_param = registry.get("front", (960, 540))
+    assert calib_param.image_size == (960, 540)
+    np.testing.assert_allclose(calib_param.camera_matrix[0, 0], 500.0)
+    np.testing.assert_allclose(calib_param.camera_matrix[1, 1], 500.0)
+    # 画素の端 (-0.5) を基準に縮小するため、画像の中心は中心のまま
+    np.testing.assert_allclose(calib_param.camera_matrix[0, 2], (959.5 + 0.5) * 0.5 - 0.5)
+    np.testing.assert_allclose(calib_param.camera_matrix[1, 2], (539.5 + 0.5) * 0.5 - 0.5)
+    np.testing.assert_array_equal(calib_param.distortion, DISTORTION)
+    assert registry.get("front", (960, 540)) is calib_param
+    # 元のparamは変更しない
+    np.testing.assert_array_equal(registry.get("front", (1920, 1080)).camera_matrix, CAMERA_MATRIX)
+
+
+def test_get_scaled_with_crop(tmp_path):
+    path = save_npz(str(tmp_path / "front.npz"), (1920, 1080))
+    registry = CameraRegistry([CameraSpec("front", path, crop_dict={"1280x720": [320, 180, 1280, 720]})])
+    calib_param = registry.get("front", (1280, 720))
+    np.testing.assert_allclose(calib_param.camera_matrix[0, 0], 1000.0)
+    np.testing.assert_allclose(calib_param.camera_matrix[0, 2], 959.5 - 320)
+    np.testing.assert_allclose(calib_param.camera_matrix[1, 2], 539.5 - 180)
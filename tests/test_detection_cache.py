@@ -0,0 +1,71 @@
+"""
+@file test_detection_cache.py
+@brief DetectionCache の保存・読み込み、設定変更時の無効化、上限数を超えた分の削除
+"""
+import os
+import time
+
+import numpy as np
+
+from utils.detection_cache import DetectionCache
+
+SETTINGS = {"board": "CheckerBoard", "grid_num": [9, 6]}
+
+
+def write_img(path, content):
+    with open(path, mode="wb") as f:
+        f.write(content)
+    return path
+
+
+def test_put_and_reload(tmp_path):
+    img_path = write_img(str(tmp_path / "a.png"), b"image-a")
+    cache_path = str(tmp_path / "cache.json")
+    corners = np.arange(8, dtype=np.float32).reshape(4, 1, 2)
+
+    cache = DetectionCache(cache_path, SETTINGS)
+    key = cache.make_key(img_path)
+    assert cache.get(key) is None
+    cache.put(key, True, corners, (640, 480))
+    cache.save()
+
+    cache = DetectionCache(cache_path, SETTINGS)
+    ret, cached_corners, img_size = cache.get(cache.make_key(img_path))
+    assert ret
+    np.testing.assert_array_equal(cached_corners, corners)
+    assert img_size == (640, 480)
+    assert (cache.hit_count, cache.miss_count) == (1, 0)
+
+
+def test_key_depends_on_content_and_settings(tmp_path):
+    img_path = write_img(str(tmp_path / "a.png"), b"image-a")
+    cache = DetectionCache(str(tmp_path / "cache.json"), SETTINGS)
+    key = cache.make_key(img_path)
+
+    other = DetectionCache(str(tmp_path / "cache.json"), dict(SETTINGS, grid_num=[7, 5]))
+    assert other.make_key(img_path) != key
+
+    # 内容が変わればサイズ・更新時刻が変わりhashを計算し直す
+    time.sleep(0.01)
+    write_img(img_path, b"image-a-modified")
+    assert cache.make_key(img_path) != key
+
+
+def test_lru_eviction(tmp_path):
+    cache_path = str(tmp_path / "cache.json")
+    cache = DetectionCache(cache_path, SETTINGS, max_entries=2)
+    key_list = []
+    for name in ("a", "b", "c"):
+        img_path = write_img(str(tmp_path / "{}.png".format(name)), name.encode())
+        key_list.append(cache.make_key(img_path))
+        cache.put(key_list[-1], False, None, (640, 480))
+        time.sleep(0.01)
+    # a を最後に使ったものにする -> 最も古い b が削除される
+    assert cache.get(key_list[0]) is not None
+    cache.save()
+
+    cache = DetectionCache(cache_path, SETTINGS, max_entries=2)
+    assert cache.get(key_list[0]) is not None
+    assert cache.get(key_list[1]) is None
+    assert cache.get(key_list[2]) is not None
+    assert os.path.isfile(cache_path)
@@ -0,0 +1,59 @@
+"""
+@file test_frame_selector.py
+@brief FrameSelector の選択数、鮮明度が0・四隅が重なった退化したボードの扱い
+"""
+import numpy as np
+
+from utils.frame_selector import FrameSelector
+
+GRID_NUM = (4, 3)
+IMG_SHAPE = (240, 320, 3)
+
+
+class BoardFinder(object):
+    """find_board が指定した制御点を返す（検出器の代わり）"""
+
+    def __init__(self):
+        self.corners = None
+
+    def find_board(self, img, scale=1.0):
+        return self.corners is not None, self.corners
+
+
+def make_corners(x, y, step=10.0):
+    grid = np.mgrid[0:GRID_NUM[1], 0:GRID_NUM[0]].transpose(1, 2, 0)[..., ::-1] * step
+    return (grid.reshape(-1, 1, 2) + np.array([x, y])).astype(np.float32)
+
+
+def make_selector(corners_list, textured=True):
+    finder = BoardFinder()
+    selector = FrameSelector(finder, GRID_NUM, min_sharpness_ratio=0.0)
+    rng = np.random.default_rng(0)
+    for index, corners in enumerate(corners_list):
+        finder.corners = corners
+        img = rng.integers(0, 256, IMG_SHAPE, dtype=np.uint8) if textured else np.zeros(IMG_SHAPE, np.uint8)
+        assert selector.evaluate(index, img)
+    return selector
+
+
+def test_select_count():
+    selector = make_selector([make_corners(20 + 40 * i, 30 + 20 * i) for i in range(5)])
+    assert selector.select(0) == []
+    assert selector.select(-1) == []
+    assert len(selector.select(3)) == 3
+    assert selector.select(10) == [0, 1, 2, 3, 4]
+
+
+def test_zero_sharpness():
+    selector = make_selector([make_corners(20 + 40 * i, 30) for i in range(4)], textured=False)
+    assert len(selector.select(2)) == 2
+
+
+def test_degenerate_quad():
+    # 四隅の制御点が全て重なったボード（長さ0の辺）
+    degenerate = np.full((GRID_NUM[0] * GRID_NUM[1], 1, 2), 100.0, dtype=np.float32)
+    selector = make_selector([make_corners(20, 30), degenerate, make_corners(200, 150), make_corners(120, 80)])
+    assert np.isfinite(selector._FrameSelector__feature_list).all()
+    selected = selector.select(3)
+    assert len(set(selected)) == 3
+    assert selector.select(4) == [0, 1, 2, 3]
@@ -0,0 +1,64 @@
+"""
+@file test_load.py
+@brief cli.py の --set で指定した値による、読み込んだ yaml の上書き
+"""
+import pytest
+
+from inout import load
+from inout.load import Loader, _apply_overrides, add_override
+
+
+@pytest.fixture(autouse=True)
+def clear_overrides():
+    load._override_dict.clear()
+    yield
+    load._override_dict.clear()
+
+
+def test_nested_key():
+    add_override("calibration.yaml", "undistort.interpolation", "cubic")
+    add_override("calibration.yaml", "scheduler.num_workers", "4")
+    cfg_data = {"undistort": {"interpolation": "linear", "alpha": 0}, "scheduler": {"num_workers": 1}}
+    cfg_data = _apply_overrides("calibration.yaml", cfg_data)
+    assert cfg_data == {"undistort": {"interpolation": "cubic", "alpha": 0}, "scheduler": {"num_workers": 4}}
+
+
+def test_new_keys():
+    add_override("calibration.yaml", "segment.enable", "1")
+    add_override("calibration.yaml", "top", "value")
+    cfg_data = _apply_overrides("calibration.yaml", {"segment": None})
+    assert cfg_data == {"segment": {"enable": 1}, "top": "value"}
+
+
+def test_values_are_parsed_as_yaml():
+    for key, value in [("a", "1"), ("b", "0.5"), ("c", "[1, 2]"), ("d", "{x: 1}"), ("e", "cubic"), ("f", "")]:
+        add_override("calibration.yaml", key, value)
+    cfg_data = _apply_overrides("calibration.yaml", {})
+    assert cfg_data == {"a": 1, "b": 0.5, "c": [1, 2], "d": {"x": 1}, "e": "cubic", "f": None}
+
+
+def test_only_matching_path(tmp_path):
+    add_override(str(tmp_path / "calibration.yaml"), "a", "1")
+    assert _apply_overrides(str(tmp_path / "movie_cutter.yaml"), {"a": 0}) == {"a": 0}
+    # 相対パス・絶対パスのどちらで指定しても同じファイルとみなす
+    add_override("calibration.yaml", "a", "2")
+    assert _apply_overrides("./calibration.yaml", {"a": 0}) == {"a": 2}
+
+
+def test_non_dict_intermediate():
+    add_override("calibration.yaml", "undistort.interpolation.x", "1")
+    with pytest.raises(Exception):
+        _apply_overrides("calibration.yaml", {"undistort": {"interpolation": "linear"}})
+
+
+def test_invalid_key():
+    with pytest.raises(Exception):
+        add_override("calibration.yaml", "undistort..alpha", "1")
+
+
+def test_loader(tmp_path):
+    path = str(tmp_path / "calibration.yaml")
+    with open(path, mode="w", encoding="utf-8") as f:
+        f.write("undistort:\n  alpha: 0\n")
+    add_override(path, "undistort.alpha", "1")
+    assert Loader(path).loadYaml() == {"undistort": {"alpha": 1}}
@@ -0,0 +1,66 @@
+"""
+@file test_manifest.py
+@brief JobManifest が処理済みとみなす条件（パラメータ・入力ファイル・出力ファイルの変化で無効になる）
+"""
+import os
+
+from utils.manifest import JobManifest, make_digest
+
+
+def make_files(tmp_path):
+    src_path = str(tmp_path / "src.png")
+    out_path = str(tmp_path / "out.png")
+    for path in (src_path, out_path):
+        with open(path, mode="wb") as f:
+            f.write(b"data")
+    return src_path, out_path
+
+
+def make_done_manifest(tmp_path, digest):
+    src_path, out_path = make_files(tmp_path)
+    manifest_path = str(tmp_path / "manifest.json")
+    manifest = JobManifest(manifest_path, digest)
+    assert not manifest.is_done(src_path, [out_path])
+    manifest.mark_done(src_path, [out_path])
+    manifest.save()
+    return manifest_path, src_path, out_path
+
+
+def test_done_after_reload(tmp_path):
+    digest = make_digest({"interpolation": "linear"})
+    manifest_path, src_path, out_path = make_done_manifest(tmp_path, digest)
+    manifest = JobManifest(manifest_path, digest)
+    assert manifest.is_done(src_path, [out_path])
+    assert manifest.skip_count == 1
+
+
+def test_digest_changed(tmp_path):
+    manifest_path, src_path, out_path = make_done_manifest(tmp_path, make_digest({"interpolation": "linear"}))
+    manifest = JobManifest(manifest_path, make_digest({"interpolation": "cubic"}))
+    assert not manifest.is_done(src_path, [out_path])
+    assert manifest.skip_count == 0
+
+
+def test_source_modified(tmp_path):
+    digest = make_digest(1)
+    manifest_path, src_path, out_path = make_done_manifest(tmp_path, digest)
+    stat = os.stat(src_path)
+    os.utime(src_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert not JobManifest(manifest_path, digest).is_done(src_path, [out_path])
+
+
+def test_outputs_changed_or_missing(tmp_path):
+    digest = make_digest(1)
+    manifest_path, src_path, out_path = make_done_manifest(tmp_path, digest)
+    manifest = JobManifest(manifest_path, digest)
+    assert not manifest.is_done(src_path, [out_path, str(tmp_path / "other.png")])
+    os.remove(out_path)
+    assert not manifest.is_done(src_path, [out_path])
+
+
+def test_broken_manifest_is_discarded(tmp_path):
+    src_path, out_path = make_files(tmp_path)
+    manifest_path = str(tmp_path / "manifest.json")
+    with open(manifest_path, mode="w", encoding="utf-8") as f:
+        f.write("{broken")
+    assert not JobManifest(manifest_path, make_digest(1)).is_done(src_path, [out_path])
@@ -0,0 +1,63 @@
+"""
+@file test_overlay.py
+@brief DebugOverlayWriter が渡された画像に描画し、従来の確認用の画像と同じものを書き出すこと
+"""
+import os
+
+import cv2
+import numpy as np
+
+from inout.overlay import DebugOverlayWriter, is_target, output_size
+
+GRID_NUM = (3, 2)
+
+
+def make_image():
+    img = np.full((120, 160, 3), 200, dtype=np.uint8)
+    corners = np.array([[[40 + 30 * i, 40 + 30 * j]] for j in range(2) for i in range(3)], dtype=np.float32)
+    return img, corners
+
+
+def test_is_target():
+    assert is_target("all", True) and not is_target("all", False)
+    assert is_target("failures", False) and not is_target("failures", True)
+    assert is_target("outliers", False) and is_target("outliers", True, True) and not is_target("outliers", True)
+
+
+def test_output_size():
+    assert output_size((1920, 1080)) == (1920, 1080)
+    assert output_size((1920, 1080), scale=0.5) == (960, 540)
+    assert output_size((1920, 1080), scale=0.5, contact_sheet=3, thumb_width=320) == (320, 180)
+
+
+def test_same_as_drawn_in_memory(tmp_path):
+    img, corners = make_image()
+    img_path = str(tmp_path / "src.png")
+    cv2.imwrite(img_path, img)
+    save_dir = str(tmp_path / "draw_corner")
+    with DebugOverlayWriter(save_dir, GRID_NUM) as writer:
+        # 読み込み済みの画像を渡した場合も、元画像から読み込む場合も同じ
+        writer.add(0, "not_read.png", True, corners, img=img.copy())
+        writer.add(1, img_path, True, corners)
+        writer.add(2, img_path, False, None)
+    expected = img.copy()
+    cv2.drawChessboardCorners(expected, GRID_NUM, corners, True)
+    expected_path = str(tmp_path / "expected.jpg")
+    cv2.imwrite(expected_path, expected)
+    with open(expected_path, mode="rb") as f:
+        expected_bytes = f.read()
+    for index in (0, 1):
+        with open(os.path.join(save_dir, "test_{}.jpg".format(index)), mode="rb") as f:
+            assert f.read() == expected_bytes
+    # target = all ではボードを検出できなかった画像は書き出さない
+    assert sorted(os.listdir(save_dir)) == ["test_0.jpg", "test_1.jpg"]
+
+
+def test_scaled_image(tmp_path):
+    img, corners = make_image()
+    save_dir = str(tmp_path / "draw_corner")
+    with DebugOverlayWriter(save_dir, GRID_NUM, target="failures", scale=0.5) as writer:
+        writer.add(0, "a.png", True, corners, img=img)
+        writer.add(1, "b.png", False, None, label="b.png", img=img)
+    assert os.listdir(save_dir) == ["test_1.jpg"]
+    assert cv2.imread(os.path.join(save_dir, "test_1.jpg")).shape == (60, 80, 3)
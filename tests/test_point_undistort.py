@@ -0,0 +1,58 @@
+"""
+@file test_point_undistort.py
+@brief PointUndistorter の undistort・distort が互いに逆変換であること、格子による近似の誤差
+"""
+import numpy as np
+import pytest
+
+from utils.point_undistort import PointUndistorter
+
+IMG_SIZE = (1280, 720)
+CAMERA_MATRIX = np.array([[1000.0, 0.0, 640.0], [0.0, 1000.0, 360.0], [0.0, 0.0, 1.0]])
+DISTORTION = np.array([-0.12, 0.05, 0.001, 0.001, 0.0])
+NEW_CAMERA_MATRIX = np.array([[900.0, 0.0, 630.0], [0.0, 900.0, 350.0], [0.0, 0.0, 1.0]])
+
+
+def random_points(num=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform((0, 0), (IMG_SIZE[0] - 1, IMG_SIZE[1] - 1), (num, 2))
+
+
+@pytest.mark.parametrize("new_camera_matrix", [None, NEW_CAMERA_MATRIX])
+def test_round_trip(new_camera_matrix):
+    undistorter = PointUndistorter(CAMERA_MATRIX, DISTORTION, new_camera_matrix)
+    points = random_points()
+    np.testing.assert_allclose(undistorter.distort(undistorter.undistort(points)), points, atol=1e-3)
+
+
+def test_keeps_shape():
+    undistorter = PointUndistorter(CAMERA_MATRIX, DISTORTION)
+    points = random_points(12).reshape(3, 4, 2)
+    assert undistorter.undistort(points).shape == points.shape
+    assert undistorter.distort(points).shape == points.shape
+
+
+@pytest.mark.parametrize("distortion, max_error", [(DISTORTION, 0.01), (DISTORTION, 0.1), ((-0.3, 0.1, 0.0, 0.0, 0.0), 0.01)])
+def test_undistort_approx(distortion, max_error):
+    undistorter = PointUndistorter(CAMERA_MATRIX, distortion)
+    error = undistorter.build_grid(IMG_SIZE, max_error=max_error)
+    assert error <= max_error
+    assert error == undistorter.grid_error
+
+    # 各セル内を細かく分けた点で、誤差が上限以下であることを確かめる
+    step = undistorter.grid_step
+    xs = np.arange(0, IMG_SIZE[0] - 1, step / 4)
+    ys = np.arange(0, IMG_SIZE[1] - 1, step / 4)
+    dense = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    # 格子の範囲外の点（最後の2点）は近似せずに undistort する
+    points = np.concatenate([random_points(), dense, [[-10.0, 5.0], [IMG_SIZE[0] + 10.0, 5.0]]])
+    exact = undistorter.undistort(points)
+    approx = undistorter.undistort_approx(points)
+    assert np.linalg.norm(approx - exact, axis=1).max() <= max_error
+    np.testing.assert_array_equal(approx[-2:], exact[-2:])
+
+
+def test_undistort_approx_without_grid():
+    undistorter = PointUndistorter(CAMERA_MATRIX, DISTORTION)
+    with pytest.raises(Exception):
+        undistorter.undistort_approx(random_points(1))
@@ -0,0 +1,51 @@
+"""
+@file test_scheduler.py
+@brief JobScheduler が iterator を全て取り出すのを待たずに実行を始めること、失敗したjobで全体を止めないこと
+"""
+from utils.scheduler import Job, JobScheduler
+
+
+def test_runs_list_by_cost():
+    order = []
+    jobs = [Job("a", 1, 1), Job("b", 1, 3), Job("c", 1, 2)]
+    result_list = JobScheduler(num_workers=1).run(jobs, order.append)
+    assert order == ["b", "c", "a"]
+    assert all(result.succeeded for result in result_list)
+
+
+def test_iterator_is_consumed_lazily():
+    pulled = []
+
+    def iter_jobs():
+        for i in range(100):
+            pulled.append(i)
+            yield Job(str(i), 1, 1)
+
+    pulled_at_start = []
+
+    def func(path):
+        if not pulled_at_start:
+            pulled_at_start.append(len(pulled))
+
+    result_list = JobScheduler(num_workers=1, lookahead=8).run(iter_jobs(), func)
+    assert pulled_at_start == [8]
+    assert len(result_list) == 100
+    assert sorted(result.path for result in result_list) == sorted(str(i) for i in range(100))
+
+
+def test_iterator_orders_within_lookahead():
+    order = []
+    jobs = (Job(str(cost), 1, cost) for cost in [1, 3, 2, 6, 5, 4])
+    JobScheduler(num_workers=1, lookahead=3).run(jobs, order.append)
+    # 先読みした3件の中で見積もりが大きい順
+    assert order == ["3", "6", "5", "4", "2", "1"]
+
+
+def test_failure_does_not_stop():
+    def func(path):
+        if path == "b":
+            raise ValueError(path)
+
+    result_list = JobScheduler(num_workers=1).run(iter([Job("a", 1, 1), Job("b", 1, 1), Job("c", 1, 1)]), func)
+    assert [result.path for result in result_list if not result.succeeded] == ["b"]
+    assert len(result_list) == 3
@@ -0,0 +1,87 @@
+"""
+@file test_segment.py
+@brief plan_segments の区間の分け方と、SegmentCheckpoint の処理済み区間の記録
+"""
+import os
+
+import pytest
+
+from utils.segment import SegmentCheckpoint, plan_segments
+
+
+def assert_contiguous(segment_list, frame_num):
+    """区間が隙間・重なりなく全フレームを覆う"""
+    assert segment_list[0][0] == 0
+    assert segment_list[-1][1] == frame_num
+    for (_, end), (start, _) in zip(segment_list, segment_list[1:]):
+        assert end == start
+    assert all(start < end for start, end in segment_list)
+
+
+@pytest.mark.parametrize("frame_num", [1, 100, 3600, 3601, 3700, 3800, 10000])
+def test_covers_all_frames(frame_num):
+    segment_list = plan_segments(frame_num, 30.0, 10)
+    assert_contiguous(segment_list, frame_num)
+    # 末尾以外は目安の長さ、末尾も目安の1/4以上
+    assert all(end - start == 300 for start, end in segment_list[:-1])
+    if len(segment_list) > 1:
+        assert segment_list[-1][1] - segment_list[-1][0] >= 300 // 4
+
+
+def test_merge_short_tail():
+    assert plan_segments(650, 30.0, 10) == [(0, 300), (300, 650)]
+    assert plan_segments(680, 30.0, 10) == [(0, 300), (300, 600), (600, 680)]
+
+
+def test_empty():
+    assert plan_segments(0, 30.0, 10) == []
+
+
+def test_align_to_keyframes():
+    # 4秒毎の keyframe、10秒の区間 -> 12秒, 24秒, ... で区切る
+    keyframe_list = [4.0 * i for i in range(25)]
+    segment_list = plan_segments(3000, 30.0, 10, keyframe_list)
+    assert_contiguous(segment_list, 3000)
+    keyframe_frames = {int(round(t * 30.0)) for t in keyframe_list}
+    assert all(start in keyframe_frames for start, _ in segment_list)
+    assert segment_list[:3] == [(0, 360), (360, 720), (720, 1080)]
+
+
+def test_no_keyframe_after_target():
+    # 目安の長さ以降に keyframe がなければ末尾まで1区間にする
+    assert plan_segments(3000, 30.0, 10, [0.0, 2.0]) == [(0, 3000)]
+
+
+def make_checkpoint(tmp_path, digest="a", segment_list=((0, 300), (300, 600))):
+    src_path = str(tmp_path / "src.mp4")
+    if not os.path.isfile(src_path):
+        with open(src_path, mode="wb") as f:
+            f.write(b"movie")
+    return SegmentCheckpoint(str(tmp_path / "checkpoint.json"), src_path, digest, segment_list), src_path
+
+
+def test_checkpoint_resume(tmp_path):
+    output = str(tmp_path / "segment_0.mp4")
+    with open(output, mode="wb") as f:
+        f.write(b"out")
+    checkpoint, _ = make_checkpoint(tmp_path)
+    assert not checkpoint.is_done(0, [output])
+    checkpoint.mark_done(0)
+
+    checkpoint, _ = make_checkpoint(tmp_path)
+    assert checkpoint.is_done(0, [output])
+    assert not checkpoint.is_done(1, [])
+    os.remove(output)
+    assert not checkpoint.is_done(0, [output])
+
+
+def test_checkpoint_invalidation(tmp_path):
+    checkpoint, src_path = make_checkpoint(tmp_path)
+    checkpoint.mark_done(0)
+    assert make_checkpoint(tmp_path)[0].is_done(0, [])
+
+    assert not make_checkpoint(tmp_path, digest="b")[0].is_done(0, [])
+    assert not make_checkpoint(tmp_path, segment_list=((0, 600),))[0].is_done(0, [])
+    with open(src_path, mode="ab") as f:
+        f.write(b"appended")
+    assert not make_checkpoint(tmp_path)[0].is_done(0, [])
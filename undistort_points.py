@@ -0,0 +1,50 @@
+"""
+@file undistort_points.py
+@brief アノテーションファイルの点の座標に対してcalibrationを実施する
+       （画像全体をremapせず、点の座標のみをundistortした画像の座標に変換する）
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import argparse
+import time
+
+from inout.points import load_points, save_points
+from utils.cfg_manager import CalibrationMatrix
+from utils.point_undistort import PointUndistorter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点の座標のみをcalibrationする")
+    parser.add_argument("input", help="アノテーションファイル (csv / json / npy)")
+    parser.add_argument("output", help="書き出すアノテーションファイル (csv / json / npy)")
+    parser.add_argument("--inverse", action="store_true",
+                        help="undistortした画像の座標 -> 元画像の座標に変換する")
+    parser.add_argument("--approx", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+                        help="画像サイズの範囲で格子による近似を用いる（点数が多い場合に高速）")
+    parser.add_argument("--max-error", type=float, default=0.01, help="格子による近似の許容誤差 [px]（誤差の上限がこの値以下になる間隔の格子を用いる）")
+    parser.add_argument("--x-key", default="x", help="x座標の列名（csv / json）")
+    parser.add_argument("--y-key", default="y", help="y座標の列名（csv / json）")
+    args = parser.parse_args()
+
+    calib_param = CalibrationMatrix(CalibrationMatrix.get_npz_path())
+    undistorter = PointUndistorter(calib_param.camera_matrix, calib_param.distortion)
+    points, records = load_points(args.input, args.x_key, args.y_key)
+
+    if args.approx and not args.inverse:
+        error = undistorter.build_grid(tuple(args.approx), args.max_error)
+        print("格子の間隔: {} px, 誤差の上限: {:.4f} px".format(undistorter.grid_step, error))
+
+    start = time.perf_counter()
+    if args.inverse:
+        converted = undistorter.distort(points)
+    elif args.approx:
+        converted = undistorter.undistort_approx(points)
+    else:
+        converted = undistorter.undistort(points)
+    print("{} 点を変換: {:.3f} s".format(len(points), time.perf_counter() - start))
+
+    save_points(args.output, converted, records, args.x_key, args.y_key)
+    print("DONE")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+@file calib_solver.py
+@brief 検出した制御点からカメラ行列・レンズ歪みを求める
+       前回の結果を初期値とした最適化、再投影誤差の大きいviewの除外、代表的なviewの抽出を行う
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import cv2
+import numpy as np
+
+
+def rodrigues(rvecs):
+    """
+    @brief 回転ベクトル群を回転行列群に変換（cv2.Rodrigues をまとめて行う）
+    @param rvecs (numpy.ndarray) (V, 3)
+    @return (numpy.ndarray) (V, 3, 3)
+    """
+    theta = np.linalg.norm(rvecs, axis=1)
+    axis = rvecs / np.maximum(theta, 1e-12)[:, None]
+    skew = np.zeros((len(rvecs), 3, 3))
+    skew[:, 0, 1], skew[:, 0, 2] = -axis[:, 2], axis[:, 1]
+    skew[:, 1, 0], skew[:, 1, 2] = axis[:, 2], -axis[:, 0]
+    skew[:, 2, 0], skew[:, 2, 1] = -axis[:, 1], axis[:, 0]
+    sin, cos = np.sin(theta)[:, None, None], np.cos(theta)[:, None, None]
+    return np.eye(3) + sin * skew + (1 - cos) * (skew @ skew)
+
+
+def distort_normalized(x, y, distortion):
+    """
+    @brief 正規化画像座標にレンズ歪みを加える
+    @param x, y (numpy.ndarray) 正規化画像座標（同じshape）
+    @param distortion (numpy.ndarray) (k1, k2, p1, p2[, k3[, k4, k5, k6]])
+    @return xd, yd (numpy.ndarray) レンズ歪みを加えた正規化画像座標
+    """
+    dist = np.zeros(8)
+    dist[:distortion.size] = distortion.ravel()[:8]
+    k1, k2, p1, p2, k3, k4, k5, k6 = dist
+    r2 = x * x + y * y
+    radial = (1 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (1 + r2 * (k4 + r2 * (k5 + r2 * k6)))
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+    return xd, yd
+
+
+def project_points(obj_points, rvecs, tvecs, camera_matrix, distortion):
+    """
+    @brief 全viewの制御点をまとめて画像に投影する（cv2.projectPoints をviewの数だけ呼ぶ代わり）
+    @param obj_points (numpy.ndarray) (V, N, 3)
+    @param rvecs, tvecs (numpy.ndarray) (V, 3)
+    @param distortion (numpy.ndarray) (k1, k2, p1, p2[, k3[, k4, k5, k6]])
+    @return (numpy.ndarray) (V, N, 2)
+    """
+    cam = np.einsum("vij,vnj->vni", rodrigues(rvecs), obj_points) + tvecs[:, None, :]
+    x = cam[..., 0] / cam[..., 2]
+    y = cam[..., 1] / cam[..., 2]
+    xd, yd = distort_normalized(x, y, distortion)
+    u = camera_matrix[0, 0] * xd + camera_matrix[0, 1] * yd + camera_matrix[0, 2]
+    v = camera_matrix[1, 1] * yd + camera_matrix[1, 2]
+    return np.stack([u, v], axis=-1)
+
+
+def view_errors(obj_points, img_points, rvecs, tvecs, camera_matrix, distortion):
+    """
+    @brief viewごとの再投影誤差 (RMS) [px]
+    @param obj_points (numpy.ndarray) (V, N, 3)
+    @param img_points (numpy.ndarray) (V, N, 2)
+    @return (numpy.ndarray) (V,)
+    """
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    tvecs = np.asarray(tvecs, dtype=np.float64).reshape(-1, 3)
+    if distortion.size <= 8:
+        projected = project_points(obj_points, rvecs, tvecs, camera_matrix, distortion)
+    else:
+        # thin prism・tilt のモデルは cv2.projectPoints に任せる
+        projected = np.stack([
+            cv2.projectPoints(obj, rvec, tvec, camera_matrix, distortion)[0].reshape(-1, 2)
+            for obj, rvec, tvec in zip(obj_points, rvecs, tvecs)])
+    return np.sqrt(((projected - img_points) ** 2).sum(axis=2).mean(axis=1))
+
+
+def board_features(img_points, grid_num_tuple, img_size):
+    """
+    @brief ボードの四隅の制御点の位置（画像サイズで正規化）。写り方が似たviewほど近くなる
+    @return (numpy.ndarray) (V, 8)
+    """
+    grid = img_points.reshape(len(img_points), -1, grid_num_tuple[0], 2)
+    quad = np.stack([grid[:, 0, 0], grid[:, 0, -1], grid[:, -1, -1], grid[:, -1, 0]], axis=1)
+    return (quad / np.asarray(img_size, dtype=np.float64)).reshape(len(img_points), -1)
+
+
+def farthest_point_order(features):
+    """
+    @brief 既に選んだviewから最も離れたviewを順に並べる（先頭ほど写り方のばらつきが大きい集合になる）
+    @return (numpy.ndarray) viewの番号
+    """
+    order = [int(np.argmin(np.linalg.norm(features - features.mean(axis=0), axis=1)))]
+    min_dist = np.linalg.norm(features - features[order[0]], axis=1)
+    for _ in range(len(features) - 1):
+        min_dist[order[-1]] = -1.0
+        best = int(np.argmax(min_dist))
+        order.append(best)
+        min_dist = np.minimum(min_dist, np.linalg.norm(features - features[best], axis=1))
+    return np.array(order)
+
+
+def undistort_grid(camera_matrix, distortion, rect, num=16):
+    """
+    @brief 矩形内に格子状に並べた点をundistortした座標
+           2組のカメラ行列・レンズ歪みによるundistort結果の違いの評価に用いる
+    @param rect (tuple) (x_min, y_min, x_max, y_max)
+    @return (numpy.ndarray) (num * num, 2)
+    """
+    xs = np.linspace(rect[0], rect[2], num)
+    ys = np.linspace(rect[1], rect[3], num)
+    grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 1, 2)
+    return cv2.undistortPoints(grid, camera_matrix, distortion, P=camera_matrix).reshape(-1, 2)
+
+
+class CalibrationSolver(object):
+
+    @property
+    def rms(self): return self.__rms
+
+    @property
+    def view_index(self):
+        """最終的に用いたviewの番号（calculate に渡した順での番号）"""
+        return self.__view_index
+
+    @property
+    def view_errors(self):
+        """最終的に用いたviewごとの再投影誤差 [px]"""
+        return self.__view_errors
+
+    @property
+    def outlier_index(self):
+        """再投影誤差が大きいview（除外したviewと、用いたviewのうち除外の閾値を超えるview）の番号"""
+        threshold = self.__prune_threshold(self.__view_errors)
+        outlier = set(self.__view_index[self.__view_errors > threshold].tolist()) | self.__pruned
+        return sorted(outlier)
+
+    def __init__(
+                self,
+                initial_guess=None,
+                prune_max_iter=0,
+                prune_threshold_px=1.0,
+                prune_threshold_ratio=3.0,
+                min_views=10,
+                max_views=0,
+                tolerance_px=0.1):
+        """
+        Constructor
+
+        @param initial_guess (tuple) (camera_matrix, distortion) 最適化の初期値。Noneなら初期値なしで求める
+        @param prune_max_iter (int) 再投影誤差の大きいviewを除外して解き直す最大回数。0なら除外しない
+        @param prune_threshold_px (float) 再投影誤差がこの値以下のviewは除外しない [px]
+        @param prune_threshold_ratio (float) 再投影誤差が中央値のこの倍数を超えるviewを除外する
+        @param min_views (int) 除外・抽出後に残すviewの最小数
+        @param max_views (int) 用いるviewの上限数。0なら全viewを用いる
+        @param tolerance_px (float) view数を増やしてもundistort結果の変化がこの値未満なら打ち切る [px]
+        """
+        self.__initial_guess = initial_guess
+        self.__prune_max_iter = prune_max_iter
+        self.__prune_threshold_px = prune_threshold_px
+        self.__prune_threshold_ratio = prune_threshold_ratio
+        self.__min_views = min_views
+        self.__max_views = max_views
+        self.__tolerance_px = tolerance_px
+
+    def solve(self, obj_coords, img_coords, img_size, grid_num_tuple):
+        """
+        @param obj_coords (list) viewごとの制御点のボード座標
+        @param img_coords (list) viewごとの制御点の画像座標
+        @param img_size (tuple) (width, height)
+        @param grid_num_tuple (tuple) CalculationParameters.grid_num_tuple
+        @return camera_matrix, dist, rot_vecs, trans_vecs cv2.calibrateCamera と同じ
+        """
+        obj_points = np.asarray(obj_coords, dtype=np.float32).reshape(len(obj_coords), -1, 3)
+        img_points = np.asarray(img_coords, dtype=np.float32).reshape(len(img_coords), -1, 2)
+        guess = self.__valid_guess(img_size)
+        self.__pruned = set()
+
+        if self.__max_views and len(obj_points) > self.__max_views:
+            view_index, result = self.__select_views(obj_points, img_points, img_size, grid_num_tuple, guess)
+        else:
+            view_index, result = self.__calibrate_pruned(
+                                                        obj_points, img_points,
+                                                        np.arange(len(obj_points)), img_size, guess)
+
+        camera_matrix, dist, rot_vecs, trans_vecs = result
+        self.__view_index = view_index
+        self.__view_errors = view_errors(
+                                        obj_points[view_index], img_points[view_index],
+                                        rot_vecs, trans_vecs, camera_matrix, dist)
+        self.__rms = float(np.sqrt((self.__view_errors ** 2).mean()))
+        print("[calib solver] view数: {} / {}, RMS: {:.4f} px".format(len(view_index), len(obj_points), self.__rms))
+        return camera_matrix, dist, rot_vecs, trans_vecs
+
+    def __valid_guess(self, img_size):
+        """主点が画像外にある初期値（解像度が異なる画像で求めたものなど）は用いない"""
+        if self.__initial_guess is None:
+            return None
+        camera_matrix, dist = self.__initial_guess
+        cx, cy = camera_matrix[0, 2], camera_matrix[1, 2]
+        if not (0 < cx < img_size[0] and 0 < cy < img_size[1]):
+            print("[calib solver][WARNING]初期値の主点が画像外のため、初期値なしで求めます")
+            return None
+        return camera_matrix, dist
+
+    def __calibrate(self, obj_points, img_points, view_index, img_size, guess):
+        if guess is None:
+            camera_matrix, dist, flags = None, None, 0
+        else:
+            camera_matrix = np.array(guess[0], dtype=np.float64)
+            dist = np.array(guess[1], dtype=np.float64).reshape(1, -1)
+            flags = cv2.CALIB_USE_INTRINSIC_GUESS
+        _, camera_matrix, dist, rot_vecs, trans_vecs = cv2.calibrateCamera(
+                                                                        list(obj_points[view_index]),
+                                                                        list(img_points[view_index]),
+                                                                        img_size,
+                                                                        camera_matrix,
+                                                                        dist,
+                                                                        flags=flags)
+        return camera_matrix, dist, rot_vecs, trans_vecs
+
+    def __calibrate_pruned(self, obj_points, img_points, view_index, img_size, guess):
+        """
+        @brief 再投影誤差の大きいviewを除外しながら解く
+        @return view_index (numpy.ndarray) 除外後のview
+        @return result (tuple) cv2.calibrateCamera と同じ
+        """
+        result = self.__calibrate(obj_points, img_points, view_index, img_size, guess)
+        for _ in range(self.__prune_max_iter):
+            errors = view_errors(obj_points[view_index], img_points[view_index], *result[2:], *result[:2])
+            threshold = self.__prune_threshold(errors)
+            keep = errors <= threshold
+            if keep.all() or keep.sum() < self.__min_views:
+                break
+            print("[calib solver] 再投影誤差が {:.3f} px を超える {} view を除外".format(threshold, (~keep).sum()))
+            self.__pruned.update(view_index[~keep].tolist())
+            view_index = view_index[keep]
+            result = self.__calibrate(obj_points, img_points, view_index, img_size, result[:2])
+        return view_index, result
+
+    def __select_views(self, obj_points, img_points, img_size, grid_num_tuple, guess):
+        """
+        @brief 写り方のばらつきが大きい順にviewを並べ、先頭から数を倍にしながら解く
+               制御点が写る範囲でのundistort結果の変化が tolerance_px 未満になった時点（または max_views）で打ち切る
+        @return view_index (numpy.ndarray) 選んだview（除外したviewを除く）
+        @return result (tuple) 選んだviewで解いた結果 cv2.calibrateCamera と同じ
+        """
+        order = farthest_point_order(board_features(img_points, grid_num_tuple, img_size))
+        # 制御点が写っていない範囲（画像の隅など）は外挿になり不安定なため、変化の評価に含めない
+        rect = (*img_points.reshape(-1, 2).min(axis=0), *img_points.reshape(-1, 2).max(axis=0))
+        num = min(max(self.__min_views, 2 * grid_num_tuple[0]), self.__max_views)
+        previous = None
+        while True:
+            view_index, result = self.__calibrate_pruned(
+                                                        obj_points, img_points,
+                                                        np.sort(order[:num]), img_size, guess)
+            guess = result[:2]
+            current = undistort_grid(*guess, rect)
+            if previous is not None:
+                change = float(np.linalg.norm(current - previous, axis=1).max())
+                print("[calib solver] view数: {}, undistort結果の変化: {:.3f} px".format(num, change))
+                if change < self.__tolerance_px:
+                    break
+            # 除外したviewは以降の候補から外す
+            excluded = set(order[:num].tolist()) - set(view_index.tolist())
+            order = np.array([i for i in order if i not in excluded])
+            if num >= min(self.__max_views, len(order)):
+                break
+            previous = current
+            num = min(2 * num, self.__max_views, len(order))
+        return view_index, result
+
+    def __prune_threshold(self, errors):
+        return max(self.__prune_threshold_px, self.__prune_threshold_ratio * np.median(errors))
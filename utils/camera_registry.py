@@ -0,0 +1,215 @@
+"""
+@file camera_registry.py
+@brief 複数カメラのcalibration paramを、カメラID・解像度毎に管理する
+       入力ファイルはパスのパターン、もしくは動画のメタデータからカメラIDに対応付ける
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import fnmatch
+import os
+import threading
+
+from utils import ffmpeg
+from utils.cfg_manager import CalibrationMatrix
+
+# params で解像度が一致しない場合に用いるkey
+DEFAULT_SIZE_KEY = "default"
+
+
+def size_key(size):
+    """(width, height) -> "1920x1080" """
+    return "{}x{}".format(*size)
+
+
+class CameraSpec(object):
+
+    @property
+    def camera_id(self): return self.__camera_id
+
+    @property
+    def pattern(self): return self.__pattern
+
+    @property
+    def metadata(self): return self.__metadata
+
+    @property
+    def params(self): return self.__params
+
+    @property
+    def crop_dict(self): return self.__crop_dict
+
+    def __init__(self, camera_id, params, pattern="", metadata=None, crop_dict=None):
+        """
+        Constructor
+
+        @param camera_id (str) カメラID
+        @param params (str or dict) npzのパス、もしくは {"1920x1080": npzのパス, "default": npzのパス}
+        @param pattern (str) 入力ファイルのパスに対するワイルドカード（fnmatch）。空なら用いない
+        @param metadata (dict) 動画のメタデータのタグと値。全て一致するファイルをこのカメラとみなす
+        @param crop_dict (dict) {"1280x720": [x, y, width, height]} paramを算出した解像度と異なる画像に
+                                写っている範囲（CalibrationMatrix.scaled の crop）
+        """
+        self.__camera_id = str(camera_id)
+        if isinstance(params, dict):
+            self.__params = {str(key): str(path) for key, path in params.items()}
+        else:
+            self.__params = {DEFAULT_SIZE_KEY: str(params)}
+        self.__pattern = str(pattern or "")
+        self.__metadata = {str(key): str(value) for key, value in (metadata or {}).items()}
+        self.__crop_dict = {str(key): list(value) for key, value in (crop_dict or {}).items()}
+
+    def match_path(self, file_path):
+        if not self.__pattern:
+            return False
+        return fnmatch.fnmatch(os.path.abspath(file_path), self.__pattern) or \
+            fnmatch.fnmatch(file_path, self.__pattern)
+
+    def match_metadata(self, tags):
+        if not self.__metadata:
+            return False
+        return all(tags.get(key) == value for key, value in self.__metadata.items())
+
+    def npz_path(self, size):
+        """
+        @brief 解像度に対応するnpzのパス（一致する解像度がなければ default、それもなく1つだけならそれ）
+        @return (str or None)
+        """
+        path = self.__params.get(size_key(size)) or self.__params.get(DEFAULT_SIZE_KEY)
+        if path is None and len(self.__params) == 1:
+            path = next(iter(self.__params.values()))
+        return path
+
+
+class CameraRegistry(object):
+    """
+    calibration param (npz) は初めて必要になった時点で読み込み、以降は保持する
+    複数スレッドから同時に呼び出し可能
+    """
+
+    def __init__(self, camera_list=None, default_id="", default_crop_dict=None):
+        """
+        Constructor
+
+        @param camera_list (list) CameraSpec のlist
+        @param default_id (str) どのカメラにも該当しないファイルに用いるカメラID
+                                空なら config/calibration_param.npz を用いる
+        @param default_crop_dict (dict) config/calibration_param.npz を用いる場合の CameraSpec.crop_dict
+        """
+        self.__camera_dict = {camera.camera_id: camera for camera in camera_list or []}
+        if default_id and default_id not in self.__camera_dict:
+            print("[camera_registry.py][ERROR]cameras.default に指定したカメラIDがありません: {}".format(default_id))
+            raise Exception
+        self.__default_id = default_id
+        self.__default_crop_dict = dict(default_crop_dict or {})
+        self.__use_metadata = any(camera.metadata for camera in self.__camera_dict.values()) and \
+            ffmpeg.is_available()
+        self.__param_dict = {}      # npzのパス -> CalibrationMatrix
+        self.__scaled_dict = {}     # (npzのパス, 解像度) -> 解像度を変換した CalibrationMatrix
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        @param config (CalibrationParameters)
+        """
+        camera_list = [
+                        CameraSpec(
+                                    camera["id"],
+                                    camera["params"],
+                                    camera.get("pattern", ""),
+                                    camera.get("metadata"),
+                                    camera.get("crop"))
+                        for camera in config.camera_list]
+        return cls(camera_list, config.default_camera, config.crop_dict)
+
+    def resolve(self, file_path):
+        """
+        @brief ファイルに対応するカメラIDを求める（パスのパターン -> メタデータ の順に照合）
+        @return (str) カメラID。該当しなければ default のカメラID
+        """
+        for camera in self.__camera_dict.values():
+            if camera.match_path(file_path):
+                return camera.camera_id
+        if self.__use_metadata:
+            try:
+                tags = ffmpeg.probe_tags(file_path)
+            except Exception as e:
+                print("[camera_registry.py][WARNING]メタデータを読み込めませんでした: {}".format(file_path))
+                print(e)
+                tags = {}
+            for camera in self.__camera_dict.values():
+                if camera.match_metadata(tags):
+                    return camera.camera_id
+        return self.__default_id
+
+    def npz_path(self, camera_id, size):
+        """カメラID・解像度に対応するnpzのパス"""
+        if not camera_id:
+            return CalibrationMatrix.get_npz_path()
+        camera = self.__camera_dict.get(camera_id)
+        if camera is None:
+            print("[camera_registry.py][ERROR]登録されていないカメラIDです: {}".format(camera_id))
+            raise Exception
+        path = camera.npz_path(size)
+        if path is None:
+            print("[camera_registry.py][ERROR]カメラ {} に解像度 {} のparamがありません".format(camera_id, size_key(size)))
+            raise Exception
+        return path
+
+    def get(self, camera_id, size):
+        """
+        @brief カメラID・解像度に対応するcalibration param
+               npz に記録された解像度と異なる場合は、カメラ行列を size に合わせて変換する
+        @param camera_id (str) resolve で求めたカメラID（空なら config/calibration_param.npz）
+        @param size (tuple) (width, height)
+        @return (CalibrationMatrix)
+        """
+        path = self.npz_path(camera_id, size)
+        calib_param = self.__param_dict.get(path)
+        if calib_param is None:
+            with self.__lock:
+                calib_param = self.__param_dict.get(path)
+                if calib_param is None:
+                    calib_param = CalibrationMatrix(path)
+                    self.__param_dict[path] = calib_param
+        # 解像度が記録されていない npz は従来通りそのまま用いる
+        if calib_param.image_size is None or calib_param.image_size == tuple(size):
+            return calib_param
+        scaled = self.__scaled_dict.get((path, tuple(size)))
+        if scaled is not None:
+            return scaled
+        with self.__lock:
+            scaled = self.__scaled_dict.get((path, tuple(size)))
+            if scaled is None:
+                crop = self.__crop(camera_id, size)
+                scaled = calib_param.scaled(size, crop)
+                print("[camera_registry.py]{}x{} のparamを {}x{} に変換して用いる{}".format(
+                    *calib_param.image_size, *size, "" if crop is None else " (crop: {})".format(crop)))
+                self.__scaled_dict[(path, tuple(size))] = scaled
+        return scaled
+
+    def __crop(self, camera_id, size):
+        crop_dict = self.__camera_dict[camera_id].crop_dict if camera_id else self.__default_crop_dict
+        return crop_dict.get(size_key(size))
+
+    def describe(self):
+        """
+        @brief 登録内容と各npzのサイズ・更新時刻（npzを読み込まずに、paramの変更を検知するのに用いる）
+        @return (list) JSONに変換できる値
+        """
+        description = [
+                        self.__default_id,
+                        self.__stat(CalibrationMatrix.get_npz_path()),
+                        self.__default_crop_dict]
+        for camera in self.__camera_dict.values():
+            params = {key: [path, self.__stat(path)] for key, path in sorted(camera.params.items())}
+            description.append([camera.camera_id, camera.pattern, camera.metadata, params, camera.crop_dict])
+        return description
+
+    @staticmethod
+    def __stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
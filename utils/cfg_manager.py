@@ -4,12 +4,14 @@
 
 @author Shunsuke Hishida / created on 2021/05/26
 """
+import copy
 from enum import IntEnum
 import os
 
 import numpy as np
 
 from inout.load import Loader
+from utils.path import config_dir
 
 class GridPattern(IntEnum):
     CHECKER_BOARD = 0
@@ -17,12 +19,90 @@ class GridPattern(IntEnum):
     ASYMMETRIC_CIRCLES_GRID = 2
 
 
-class Movie2ImgParameters(object):
-    PATH = os.path.join(os.getcwd(), "config", "movie2img.yaml")
+class YamlConfig(object):
+    """
+    config ディレクトリ内の yaml (FILE_NAME) から読み込むparam
+    パスは import 時ではなく get_yaml_path の呼び出し時に決める（cli.py の --config-dir・--config を反映する）
+    """
+    FILE_NAME = ""
+    PATH = ""       # set_yaml_path で指定した場合のみ
 
     @classmethod
     def get_yaml_path(cls):
-        return cls.PATH
+        return cls.PATH or os.path.join(config_dir(), cls.FILE_NAME)
+
+    @classmethod
+    def set_yaml_path(cls, path):
+        """@brief config ディレクトリ以外の yaml を用いる"""
+        cls.PATH = path
+
+
+class PreviewParameters(object):
+    """
+    並べた動画を確認用に縮小して書き出す設定（movie_concatenater.yaml, calibration.yaml の preview）
+    """
+
+    @property
+    def enable(self):
+        return self.__enable
+
+    @property
+    def width(self):
+        """出力の幅の上限 [px]"""
+        return self.__width
+
+    @property
+    def height(self):
+        """出力の高さの上限 [px]"""
+        return self.__height
+
+    @property
+    def frame_step(self):
+        """N フレーム毎に1フレームを書き出す"""
+        return self.__frame_step
+
+    @property
+    def codec(self):
+        """ffmpeg の encoder。空文字の場合は OpenCV で書き出す"""
+        return self.__codec
+
+    @property
+    def bitrate(self):
+        """ffmpeg で書き出す場合のビットレートの上限 (例: "2M")。空文字の場合は encoder の既定値"""
+        return self.__bitrate
+
+    @property
+    def fourcc(self):
+        """OpenCV で書き出す場合の fourcc。空文字の場合は元動画と同じ"""
+        return self.__fourcc
+
+    def __init__(self, section):
+        """
+        @param section (dict) yaml の preview 以下
+        """
+        section = section or {}
+        self.__enable = bool(int(section.get("enable", 0)))
+        self.__width = int(section.get("width", 1280))
+        self.__height = int(section.get("height", 720))
+        self.__frame_step = max(1, int(section.get("frame_step", 1)))
+        self.__codec = str(section.get("codec") or "")
+        self.__bitrate = str(section.get("bitrate") or "")
+        self.__fourcc = str(section.get("fourcc") or "")
+
+    def tile_size(self, src_size, grid):
+        """
+        @brief grid に並べた出力が width x height に収まる1動画あたりの大きさ（拡大はしない）
+        @param src_size (tuple) (width, height) 元動画の解像度
+        @param grid (tuple) (rows, cols)
+        @return (tuple) (width, height) yuv420p で書き出せるよう偶数にする
+        """
+        rows, cols = grid
+        scale = min(1.0, self.__width / (src_size[0] * cols), self.__height / (src_size[1] * rows))
+        return (max(2, int(src_size[0] * scale) // 2 * 2), max(2, int(src_size[1] * scale) // 2 * 2))
+
+
+class Movie2ImgParameters(YamlConfig):
+    FILE_NAME = "movie2img.yaml"
 
     @property
     def start_time(self):
@@ -48,6 +128,34 @@ class Movie2ImgParameters(object):
     def input_path(self):
         return self.__input_path
 
+    @property
+    def select_enable(self):
+        return self.__select_enable
+
+    @property
+    def select_pattern(self):
+        return self.__select_pattern
+
+    @property
+    def select_step(self):
+        return self.__select_step
+
+    @property
+    def select_detect_max_side(self):
+        return self.__select_detect_max_side
+
+    @property
+    def select_min_sharpness_ratio(self):
+        return self.__select_min_sharpness_ratio
+
+    @property
+    def writer_workers(self):
+        return self.__writer_workers
+
+    @property
+    def writer_max_pending(self):
+        return self.__writer_max_pending
+
     def __init__(self, path):
         """constructor"""
         self.__load = Loader(path)
@@ -62,14 +170,19 @@ class Movie2ImgParameters(object):
         self.__cut_flag = bool(int(self.__yaml_data["cut_flag"]))
         self.__extension = str(self.__yaml_data["extension"])
         self.__input_path = str(self.__yaml_data["input_path"])
+        select = self.__yaml_data.get("select") or {}
+        self.__select_enable = bool(int(select.get("enable", 0)))
+        self.__select_pattern = int(select.get("pattern", GridPattern.CHECKER_BOARD))
+        self.__select_step = max(1, int(select.get("sample_step", 1)))
+        self.__select_detect_max_side = int(select.get("detect_max_side", 960))
+        self.__select_min_sharpness_ratio = float(select.get("min_sharpness_ratio", 0.3))
+        writer = self.__yaml_data.get("writer") or {}
+        self.__writer_workers = int(writer.get("num_workers", 4))
+        self.__writer_max_pending = int(writer.get("max_pending", 32))
 
 
-class CalculationParameters(object):
-    PATH = os.path.join(os.getcwd(), "config", "calc_camera_param.yaml")
-
-    @classmethod
-    def get_yaml_path(cls):
-        return cls.PATH
+class CalculationParameters(YamlConfig):
+    FILE_NAME = "calc_camera_param.yaml"
 
     @property
     def grid_interval(self):
@@ -104,6 +217,129 @@ class CalculationParameters(object):
     def circle_radius(self):
         return float(self.__yaml_data["circle_radius"])
 
+    @property
+    def num_workers(self):
+        """0: CPU数, 1: 並列化しない"""
+        return self.__num_workers
+
+    @property
+    def pyramid(self):
+        return self.__pyramid
+
+    @property
+    def pyramid_max_side(self):
+        return self.__pyramid_max_side
+
+    @property
+    def subpix_window(self):
+        """0: 制御点間隔に合わせて自動で決める"""
+        return self.__subpix_window
+
+    @property
+    def subpix_max_iter(self):
+        return self.__subpix_max_iter
+
+    @property
+    def blob_area_ratio(self):
+        """(min, max) circle_radius から求めた円の面積に対する、BLOB検出の面積の範囲"""
+        return self.__blob_area_ratio
+
+    @property
+    def tracking(self):
+        """True: 前のフレームで検出したボードの周辺のみを探す"""
+        return self.__tracking
+
+    @property
+    def tracking_margin(self):
+        return self.__tracking_margin
+
+    @property
+    def clustering(self):
+        """True: findCirclesGrid で CALIB_CB_CLUSTERING を用いる"""
+        return self.__clustering
+
+    @property
+    def incremental(self):
+        """1: 前回の算出結果を初期値として最適化する"""
+        return self.__incremental
+
+    @property
+    def min_views(self):
+        return self.__min_views
+
+    @property
+    def max_views(self):
+        """0: 全viewを用いる"""
+        return self.__max_views
+
+    @property
+    def tolerance_px(self):
+        return self.__tolerance_px
+
+    @property
+    def prune_max_iter(self):
+        """0: viewを除外しない"""
+        return self.__prune_max_iter
+
+    @property
+    def prune_threshold_px(self):
+        return self.__prune_threshold_px
+
+    @property
+    def prune_threshold_ratio(self):
+        return self.__prune_threshold_ratio
+
+    @property
+    def draw_enable(self):
+        return self.__draw_enable
+
+    @property
+    def draw_target(self):
+        """all / failures / outliers"""
+        return self.__draw_target
+
+    @property
+    def draw_every(self):
+        return self.__draw_every
+
+    @property
+    def draw_scale(self):
+        return self.__draw_scale
+
+    @property
+    def draw_contact_sheet(self):
+        """0: 1枚ずつ書き出す, N: N x N 枚を並べた画像にまとめる"""
+        return self.__draw_contact_sheet
+
+    @property
+    def draw_thumb_width(self):
+        return self.__draw_thumb_width
+
+    @property
+    def draw_num_workers(self):
+        return self.__draw_num_workers
+
+    @property
+    def draw_max_pending(self):
+        return self.__draw_max_pending
+
+    @property
+    def cache_enable(self):
+        return self.__cache_enable
+
+    @property
+    def cache_path(self):
+        """空文字の場合は config ディレクトリの detection_cache.json を用いる"""
+        return self.__cache_path
+
+    @property
+    def cache_max_entries(self):
+        return self.__cache_max_entries
+
+    @property
+    def cache_reset(self):
+        return self.__cache_reset
+
     def __init__(self, path):
         """Constructor"""
         self.__load = Loader(path)
@@ -120,14 +356,43 @@ class CalculationParameters(object):
         self.__img_dir = str(self.__yaml_data["img"]["input_dir"])
         self.__img_ext = str(self.__yaml_data["img"]["extension"])
         self.__file_name = str(self.__yaml_data["output"]["file_name"])
-
-
-class CalibrationParameters(object):
-    PATH = os.path.join(os.getcwd(), "config", "calibration.yaml")
-
-    @classmethod
-    def get_yaml_path(cls):
-        return cls.PATH
+        detection = self.__yaml_data.get("detection") or {}
+        self.__num_workers = int(detection.get("num_workers", 1))
+        self.__pyramid = bool(int(detection.get("pyramid", 0)))
+        self.__pyramid_max_side = int(detection.get("pyramid_max_side", 1280))
+        self.__subpix_window = int(detection.get("subpix_window", 11))
+        self.__subpix_max_iter = int(detection.get("subpix_max_iter", 100))
+        self.__clustering = bool(int(detection.get("clustering", 0)))
+        self.__tracking = bool(int(detection.get("tracking", 0)))
+        self.__tracking_margin = float(detection.get("tracking_margin", 0.25))
+        self.__blob_area_ratio = tuple(float(v) for v in detection.get("blob_area_ratio", (0.5, 1.5)))
+        solver = self.__yaml_data.get("solver") or {}
+        self.__incremental = bool(int(solver.get("incremental", 0)))
+        self.__min_views = int(solver.get("min_views", 10))
+        self.__max_views = int(solver.get("max_views", 0))
+        self.__tolerance_px = float(solver.get("tolerance_px", 0.1))
+        prune = solver.get("prune") or {}
+        self.__prune_max_iter = int(prune.get("max_iter", 0))
+        self.__prune_threshold_px = float(prune.get("threshold_px", 1.0))
+        self.__prune_threshold_ratio = float(prune.get("threshold_ratio", 3.0))
+        draw = self.__yaml_data.get("draw_corner") or {}
+        self.__draw_enable = bool(int(draw.get("enable", 1)))
+        self.__draw_target = str(draw.get("target", "all"))
+        self.__draw_every = max(1, int(draw.get("every", 1)))
+        self.__draw_scale = float(draw.get("scale", 1.0))
+        self.__draw_contact_sheet = int(draw.get("contact_sheet", 0))
+        self.__draw_thumb_width = int(draw.get("thumb_width", 320))
+        self.__draw_num_workers = int(draw.get("num_workers", 2))
+        self.__draw_max_pending = int(draw.get("max_pending", 8))
+        cache = self.__yaml_data.get("cache") or {}
+        self.__cache_enable = bool(int(cache.get("enable", 0)))
+        self.__cache_path = str(cache.get("path") or "")
+        self.__cache_max_entries = int(cache.get("max_entries", 10000))
+        self.__cache_reset = bool(int(cache.get("reset", 0)))
+
+
+class CalibrationParameters(YamlConfig):
+    FILE_NAME = "calibration.yaml"
 
     @property
     def input_dir(self):
@@ -137,6 +402,19 @@ class CalibrationParameters(object):
     def extension(self):
         return self.__ext
 
+    @property
+    def recursive(self):
+        return self.__recursive
+
+    @property
+    def manifest_enable(self):
+        return self.__manifest_enable
+
+    @property
+    def manifest_path(self):
+        """空文字の場合は after/.calibration_manifest.json"""
+        return self.__manifest_path
+
     @property
     def movie_mode(self):
         return self.__movie_mode
@@ -149,6 +427,83 @@ class CalibrationParameters(object):
     def left_title(self):
         return self.__left_title
 
+    @property
+    def fused(self):
+        return self.__fused
+
+    @property
+    def preview(self):
+        """(PreviewParameters) movie_mode で元動画と並べた動画の書き出し設定"""
+        return self.__preview
+
+    @property
+    def interpolation(self):
+        return self.__interpolation
+
+    @property
+    def save_map(self):
+        return self.__save_map
+
+    @property
+    def map_cache_mb(self):
+        """0: 上限なし"""
+        return self.__map_cache_mb
+
+    @property
+    def crop_dict(self):
+        """undistort.crop（変換先の解像度 "WxH" -> [x, y, width, height]）"""
+        return self.__crop_dict
+
+    @property
+    def camera_list(self):
+        """cameras.list（id, params, pattern, metadata を持つdictのlist）"""
+        return self.__camera_list
+
+    @property
+    def default_camera(self):
+        """空文字の場合は config/calibration_param.npz"""
+        return self.__default_camera
+
+    @property
+    def pipeline(self):
+        return self.__pipeline
+
+    @property
+    def num_workers(self):
+        """0: CPU数, 1: 並列化しない"""
+        return self.__num_workers
+
+    @property
+    def memory_budget_mb(self):
+        return self.__memory_budget_mb
+
+    @property
+    def segment_enable(self):
+        return self.__segment_enable
+
+    @property
+    def segment_min_sec(self):
+        """これより長い動画のみ区間に分ける [sec]"""
+        return self.__segment_min_sec
+
+    @property
+    def segment_sec(self):
+        """1区間の長さの目安 [sec]"""
+        return self.__segment_sec
+
+    @property
+    def segment_workers(self):
+        """0: CPU数"""
+        return self.__segment_workers
+
+    @property
+    def pipeline_workers(self):
+        return self.__pipeline_workers
+
+    @property
+    def pipeline_queue_size(self):
+        return self.__pipeline_queue_size
+
     def __init__(self, path):
         self.__load = Loader(path)
         self.__yaml_data = self.__load.loadYaml()
@@ -157,17 +512,43 @@ class CalibrationParameters(object):
     def __deserialize(self):
         self.__input_dir = str(self.__yaml_data["before_calib"]["input_dir"])
         self.__ext = self.__yaml_data["before_calib"]["ext"]
+        self.__recursive = bool(int(self.__yaml_data["before_calib"].get("recursive", 0)))
         self.__movie_mode = bool(int(self.__yaml_data["after_calib"]["movie_mode"]))
         self.__left_title = str(self.__yaml_data["after_calib"]["title_left"])
         self.__right_title = str(self.__yaml_data["after_calib"]["title_right"])
+        self.__fused = bool(int(self.__yaml_data["after_calib"].get("fused", 0)))
+        self.__preview = PreviewParameters(self.__yaml_data.get("preview"))
+        undistort = self.__yaml_data.get("undistort") or {}
+        self.__interpolation = str(undistort.get("interpolation", "linear"))
+        self.__save_map = bool(int(undistort.get("save_map", 0)))
+        self.__map_cache_mb = int(undistort.get("map_cache_mb", 0))
+        self.__crop_dict = {str(key): list(value) for key, value in (undistort.get("crop") or {}).items()}
+        cameras = self.__yaml_data.get("cameras") or {}
+        self.__camera_list = list(cameras.get("list") or [])
+        self.__default_camera = str(cameras.get("default") or "")
+        pipeline = self.__yaml_data.get("pipeline") or {}
+        self.__pipeline = bool(int(pipeline.get("enable", 0)))
+        self.__pipeline_workers = int(pipeline.get("num_workers", 2))
+        self.__pipeline_queue_size = int(pipeline.get("queue_size", 16))
+        segment = self.__yaml_data.get("segment") or {}
+        self.__segment_enable = bool(int(segment.get("enable", 0)))
+        self.__segment_min_sec = float(segment.get("min_duration_sec", 600))
+        self.__segment_sec = float(segment.get("segment_sec", 120))
+        self.__segment_workers = int(segment.get("num_workers", 0))
+        scheduler = self.__yaml_data.get("scheduler") or {}
+        self.__num_workers = int(scheduler.get("num_workers", 1))
+        self.__memory_budget_mb = int(scheduler.get("memory_budget_mb", 4096))
+        manifest = self.__yaml_data.get("manifest") or {}
+        self.__manifest_enable = bool(int(manifest.get("enable", 0)))
+        self.__manifest_path = str(manifest.get("path") or "")
 
 
 class CalibrationMatrix(object):
-    PATH = os.path.join(os.getcwd(), "config", "calibration_param.npz")
+    FILE_NAME = "calibration_param.npz"
 
     @classmethod
     def get_npz_path(cls):
-        return cls.PATH
+        return os.path.join(config_dir(), cls.FILE_NAME)
 
     @property
     def camera_matrix(self):
@@ -177,6 +558,11 @@ class CalibrationMatrix(object):
     def distortion(self):
         return self.__distortion
 
+    @property
+    def image_size(self):
+        """(width, height) paramを算出した画像の解像度。記録されていないnpzではNone"""
+        return self.__image_size
+
     def __init__(self, path):
         """Constructor"""
         calib_param = np.load(path)
@@ -185,14 +571,46 @@ class CalibrationMatrix(object):
     def __deserialize(self, calib_param):
         self.__camera_matrix = calib_param["camera_matrix"]
         self.__distortion = calib_param["distortion"]
-
-
-class MovieCutterParameters(object):
-    PATH = os.path.join(os.getcwd(), "config", "movie_cutter.yaml")
-
-    @classmethod
-    def get_yaml_path(cls):
-        return cls.PATH
+        self.__image_size = tuple(int(v) for v in calib_param["image_size"]) \
+            if "image_size" in calib_param.files else None
+
+    def scaled(self, size, crop=None):
+        """
+        @brief 別の解像度の画像（縮小したproxy、センサーの別モードなど）に合わせたparam
+               paramを算出した画像の crop の範囲を size に拡大・縮小した画像とみなしてカメラ行列を変換する
+               （レンズ歪みは正規化画像座標で定義されるため変わらない）
+        @param size (tuple) (width, height) 変換先の解像度
+        @param crop (tuple) (x, y, width, height) 変換先の画像に写る範囲（paramを算出した画像の座標）
+                            Noneなら画像全体。縦横比が異なる場合は中央を変換先の縦横比で切り出した範囲
+        @return (CalibrationMatrix) image_size が size のparam
+        """
+        if self.__image_size is None:
+            print("[cfg_manager.py][ERROR]npz に image_size が記録されていないため解像度を変換できません")
+            raise Exception
+        calib_width, calib_height = self.__image_size
+        width, height = size
+        if crop is None:
+            crop_width = min(calib_width, calib_height * width / height)
+            crop_height = min(calib_height, calib_width * height / width)
+            crop = ((calib_width - crop_width) / 2, (calib_height - crop_height) / 2, crop_width, crop_height)
+        x0, y0, crop_width, crop_height = crop
+        sx = width / crop_width
+        sy = height / crop_height
+        # 画素の中心を整数座標とするため、拡大・縮小は画素の端 (-0.5) を基準に行う
+        camera_matrix = np.array(self.__camera_matrix, dtype=np.float64)
+        camera_matrix[0, 0] *= sx
+        camera_matrix[0, 1] *= sx
+        camera_matrix[1, 1] *= sy
+        camera_matrix[0, 2] = (camera_matrix[0, 2] - x0 + 0.5) * sx - 0.5
+        camera_matrix[1, 2] = (camera_matrix[1, 2] - y0 + 0.5) * sy - 0.5
+        scaled = copy.copy(self)
+        scaled.__camera_matrix = camera_matrix
+        scaled.__image_size = (int(width), int(height))
+        return scaled
+
+
+class MovieCutterParameters(YamlConfig):
+    FILE_NAME = "movie_cutter.yaml"
 
     @property
     def start_time(self):
@@ -210,6 +628,10 @@ class MovieCutterParameters(object):
     def output_dir(self):
         return self.__output_dir
 
+    @property
+    def stream_copy(self):
+        return self.__stream_copy
+
     def __init__(self, path):
         """Constructor"""
         self.__load = Loader(path)
@@ -221,14 +643,11 @@ class MovieCutterParameters(object):
         self.__end_time = int(self.__yaml_data["end_time"]) - 1
         self.__input_path = str(self.__yaml_data["input_path"])
         self.__output_dir = str(self.__yaml_data["output_dir"])
+        self.__stream_copy = bool(int(self.__yaml_data.get("stream_copy", 0)))
 
 
-class MovieConcatenaterParameters(object):
-    PATH = os.path.join(os.getcwd(), "config", "movie_concatenater.yaml")
-
-    @classmethod
-    def get_yaml_path(cls):
-        return cls.PATH
+class MovieConcatenaterParameters(YamlConfig):
+    FILE_NAME = "movie_concatenater.yaml"
 
     @property
     def concate_type(self):
@@ -282,6 +701,33 @@ class MovieConcatenaterParameters(object):
     def title4(self):
         return self.__title_4
 
+    @property
+    def mosaic_grid(self):
+        """(rows, cols)"""
+        return self.__mosaic_grid
+
+    @property
+    def mosaic_path_list(self):
+        """空の場合は concate_type・arrangement・path_1 ~ path_4 を用いる"""
+        return self.__mosaic_path_list
+
+    @property
+    def mosaic_title_list(self):
+        return self.__mosaic_title_list
+
+    @property
+    def mosaic_column_major(self):
+        return self.__mosaic_column_major
+
+    @property
+    def num_canvases(self):
+        return self.__num_canvases
+
+    @property
+    def preview(self):
+        """(PreviewParameters)"""
+        return self.__preview
+
     def __init__(self, path):
         """Constructor"""
         self.__load = Loader(path)
@@ -311,4 +757,83 @@ class MovieConcatenaterParameters(object):
         self.__title_2 = self.__yaml_data["output"]["title_2"]
         self.__title_3 = self.__yaml_data["output"]["title_3"]
         self.__title_4 = self.__yaml_data["output"]["title_4"]
-        self.__check_path()
+        mosaic = self.__yaml_data.get("mosaic") or {}
+        self.__mosaic_grid = (int(mosaic.get("rows", 1)), int(mosaic.get("cols", 1)))
+        self.__mosaic_path_list = [path or None for path in mosaic.get("path_list") or []]
+        self.__mosaic_title_list = [title or "" for title in mosaic.get("title_list") or []]
+        self.__mosaic_column_major = bool(int(mosaic.get("column_major", 0)))
+        self.__num_canvases = int(mosaic.get("num_canvases", 3))
+        self.__preview = PreviewParameters(self.__yaml_data.get("preview"))
+        if not self.__mosaic_path_list:
+            self.__check_path()
+
+
+class LiveCalibrationParameters(YamlConfig):
+    FILE_NAME = "live_calibration.yaml"
+
+    @property
+    def source(self):
+        """カメラ番号 (int) or 動画ファイルのパス・URL (str)"""
+        return self.__source
+
+    @property
+    def pattern(self):
+        return self.__pattern
+
+    @property
+    def sample_step(self):
+        return self.__sample_step
+
+    @property
+    def drop_frames(self):
+        return self.__drop_frames
+
+    @property
+    def min_distance(self):
+        return self.__min_distance
+
+    @property
+    def recalib_every(self):
+        return self.__recalib_every
+
+    @property
+    def min_views(self):
+        return self.__min_views
+
+    @property
+    def max_views(self):
+        return self.__max_views
+
+    @property
+    def save(self):
+        return self.__save
+
+    @property
+    def file_name(self):
+        return self.__file_name
+
+    @property
+    def preview(self):
+        return self.__preview
+
+    def __init__(self, path):
+        self.__load = Loader(path)
+        self.__yaml_data = self.__load.loadYaml()
+        self.__deserialize()
+
+    def __deserialize(self):
+        source = self.__yaml_data["source"]
+        self.__source = int(source) if str(source).isdigit() else str(source)
+        self.__pattern = int(self.__yaml_data.get("pattern", GridPattern.CHECKER_BOARD))
+        self.__sample_step = max(1, int(self.__yaml_data.get("sample_step", 1)))
+        self.__drop_frames = bool(int(self.__yaml_data.get("drop_frames", 1)))
+        accept = self.__yaml_data.get("accept") or {}
+        self.__min_distance = float(accept.get("min_distance", 0.05))
+        recalibrate = self.__yaml_data.get("recalibrate") or {}
+        self.__recalib_every = max(1, int(recalibrate.get("every", 10)))
+        self.__min_views = int(recalibrate.get("min_views", 10))
+        self.__max_views = int(recalibrate.get("max_views", 200))
+        output = self.__yaml_data.get("output") or {}
+        self.__save = bool(int(output.get("save", 0)))
+        self.__file_name = str(output.get("file_name", "live_calibration_param"))
+        self.__preview = bool(int(self.__yaml_data.get("preview", 0)))
@@ -0,0 +1,135 @@
+"""
+@file detection_cache.py
+@brief 画像毎の制御点検出結果をファイルにキャッシュする
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+class DetectionCache(object):
+    """
+    index (json) の構成
+    {
+        "version": int,
+        "entries": {key: {"ret": bool, "img_size": [w, h], "corners": list or None, "last_used": float}},
+        "files": {img_path: {"size": int, "mtime_ns": int, "digest": str}},
+    }
+    key は 画像内容のhash と 検出設定 から算出する
+    files は画像内容のhash計算を省略するための情報（サイズと更新時刻が同じなら同じ内容とみなす）
+    """
+    VERSION = 1
+
+    @property
+    def hit_count(self): return self.__hit_count
+
+    @property
+    def miss_count(self): return self.__miss_count
+
+    def __init__(self, path, settings, max_entries=10000):
+        """
+        Constructor
+
+        @param path (str) indexファイルのパス
+        @param settings (dict) ボードの種類、grid数、grid間隔、検出器の設定など
+        @param max_entries (int) 保持する検出結果の上限数。超えた分は最後に使われた時刻が古いものから削除する
+        """
+        self.__path = path
+        self.__settings_digest = hashlib.sha1(
+            json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+        self.__max_entries = max_entries
+        self.__hit_count = 0
+        self.__miss_count = 0
+        self.__load()
+
+    def __load(self):
+        self.__entries = {}
+        self.__files = {}
+        if not os.path.isfile(self.__path):
+            return
+        try:
+            with open(self.__path, mode="r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print("[DetectionCache]キャッシュを読み込めなかったため破棄します")
+            print(e)
+            return
+        if index.get("version") != self.VERSION:
+            return
+        self.__entries = index["entries"]
+        self.__files = index["files"]
+
+    def _digest(self, img_path):
+        """画像ファイルの内容のhash。サイズと更新時刻が前回と同じならhashを再計算しない"""
+        stat = os.stat(img_path)
+        info = self.__files.get(img_path)
+        if info is not None and info["size"] == stat.st_size and info["mtime_ns"] == stat.st_mtime_ns:
+            return info["digest"]
+        sha = hashlib.sha1()
+        with open(img_path, mode="rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self.__files[img_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest}
+        return digest
+
+    def make_key(self, img_path):
+        return "{}_{}".format(self._digest(img_path), self.__settings_digest)
+
+    def get(self, key):
+        """
+        @return (tuple or None) (ret, corners, img_size)。キャッシュにない場合はNone
+        """
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__miss_count += 1
+            return None
+        self.__hit_count += 1
+        entry["last_used"] = time.time()
+        corners = entry["corners"]
+        if corners is not None:
+            corners = np.array(corners, dtype=np.float32)
+        return entry["ret"], corners, tuple(entry["img_size"])
+
+    def put(self, key, ret, corners, img_size):
+        self.__entries[key] = {
+            "ret": bool(ret),
+            "img_size": [int(v) for v in img_size],
+            "corners": None if corners is None else np.asarray(corners, dtype=np.float32).tolist(),
+            "last_used": time.time(),
+        }
+
+    def invalidate(self, img_path=None):
+        """
+        @brief キャッシュを破棄する
+        @param img_path (str) 指定した場合はその画像の検出結果のみ破棄する
+        """
+        if img_path is None:
+            self.__entries.clear()
+            self.__files.clear()
+            return
+        info = self.__files.pop(img_path, None)
+        if info is None:
+            return
+        for key in [k for k in self.__entries if k.startswith(info["digest"])]:
+            del self.__entries[key]
+
+    def save(self):
+        """上限数を超えた分を削除してからindexを書き出す"""
+        if len(self.__entries) > self.__max_entries:
+            keys = sorted(self.__entries, key=lambda k: self.__entries[k]["last_used"])
+            for key in keys[:len(self.__entries) - self.__max_entries]:
+                del self.__entries[key]
+        digests = {key.split("_")[0] for key in self.__entries}
+        self.__files = {p: info for p, info in self.__files.items() if info["digest"] in digests}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.__path)), exist_ok=True)
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "entries": self.__entries, "files": self.__files}, f)
+        os.replace(tmp_path, self.__path)
@@ -0,0 +1,266 @@
+"""
+@file ffmpeg.py
+@brief ffmpeg / ffprobe を用いた動画のstream copy処理
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+# ffprobe の codec_name と 再エンコードに用いる encoder の対応
+ENCODER_DICT = {
+    "h264": "libx264",
+    "hevc": "libx265",
+    "mpeg4": "mpeg4",
+    "mjpeg": "mjpeg",
+    "vp9": "libvpx-vp9",
+}
+
+
+def is_available():
+    """ffmpeg と ffprobe がPATH上にあるか"""
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def _run(cmd):
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _probe(path, *args):
+    result = subprocess.run(
+                            ["ffprobe", "-v", "error", "-select_streams", "v:0", *args, path],
+                            check=True,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    return result.stdout
+
+
+def probe_codec(path):
+    """映像streamの codec_name"""
+    return _probe(path, "-show_entries", "stream=codec_name", "-of", "csv=p=0").strip()
+
+
+def probe_stream(path):
+    """
+    @brief 映像streamの codec・profile・level・pix_fmt・time_base・fps
+    @return (dict) ffprobe の stream のエントリ
+    """
+    output = _probe(
+                    path,
+                    "-show_entries", "stream=codec_name,profile,level,pix_fmt,time_base,r_frame_rate",
+                    "-of", "json")
+    stream_list = json.loads(output or "{}").get("streams", [])
+    return stream_list[0] if stream_list else {}
+
+
+def probe_frame_count(path):
+    """@return (int) 実際にデコードしたフレーム数"""
+    output = _probe(path, "-count_frames", "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0")
+    return int(output.strip().rstrip(","))
+
+
+def probe_tags(path):
+    """
+    @brief コンテナ・映像streamのメタデータのタグ（streamのタグが優先）
+    @return (dict) タグ名 -> 値
+    """
+    output = _probe(path, "-show_entries", "format_tags:stream_tags", "-of", "json")
+    data = json.loads(output or "{}")
+    tags = dict(data.get("format", {}).get("tags", {}))
+    for stream in data.get("streams", []):
+        tags.update(stream.get("tags", {}))
+    return tags
+
+
+def probe_keyframes(path):
+    """
+    @brief keyframe の時刻を取得
+    @return (list) keyframe の時刻 [sec] の昇順リスト
+    """
+    output = _probe(
+                    path,
+                    "-skip_frame", "nokey",
+                    "-show_entries", "frame=best_effort_timestamp_time",
+                    "-of", "csv=p=0")
+    keyframes = []
+    for line in output.splitlines():
+        line = line.strip().rstrip(",")
+        if line and line != "N/A":
+            keyframes.append(float(line))
+    return sorted(keyframes)
+
+
+def _copy(src, start, end, dst):
+    _run([
+        "ffmpeg", "-y", "-v", "error",
+        "-ss", "{:.6f}".format(start), "-i", src, "-t", "{:.6f}".format(end - start),
+        "-map", "0:v:0", "-an", "-c", "copy", "-avoid_negative_ts", "make_zero",
+        dst])
+
+
+def _encoder_args(stream, ext):
+    """
+    @brief 元動画の映像streamと同じ設定で再エンコードするための引数
+           （stream copy した区間と連結するため、profile・level・pix_fmt・timebase を揃える）
+    @param stream (dict) probe_stream の戻り値
+    @param ext (str) 出力の拡張子
+    @return (list) codecが再エンコードに対応していない場合はNone
+    """
+    codec = stream.get("codec_name")
+    encoder = ENCODER_DICT.get(codec)
+    if encoder is None:
+        return None
+    args = ["-c:v", encoder]
+    if stream.get("pix_fmt"):
+        args += ["-pix_fmt", stream["pix_fmt"]]
+    profile = str(stream.get("profile", "")).lower()
+    level = stream.get("level")
+    if codec == "h264":
+        # ffprobe の "Constrained Baseline" などを x264 の profile 名に変換
+        profile = {"constrained baseline": "baseline"}.get(profile, profile)
+        if profile in ("baseline", "main", "high", "high10", "high422", "high444"):
+            args += ["-profile:v", profile]
+        if isinstance(level, int) and level > 0:
+            args += ["-level:v", "{:.1f}".format(level / 10)]
+        # 連結後も各区間の先頭でデコードできるよう、SPS/PPS を keyframe 毎に出力する
+        args += ["-x264-params", "repeat-headers=1"]
+    elif codec == "hevc":
+        if profile in ("main", "main 10"):
+            args += ["-profile:v", profile.replace(" ", "")]
+        args += ["-x265-params", "repeat-headers=1"]
+    if stream.get("r_frame_rate"):
+        args += ["-r", stream["r_frame_rate"]]
+    time_base = str(stream.get("time_base", ""))
+    if "/" in time_base and ext.lower() in (".mp4", ".mov", ".m4v"):
+        args += ["-video_track_timescale", time_base.split("/")[1]]
+    return args
+
+
+def _encode(src, start, end, dst, encoder_args):
+    _run([
+        "ffmpeg", "-y", "-v", "error",
+        "-ss", "{:.6f}".format(start), "-i", src, "-t", "{:.6f}".format(end - start),
+        "-map", "0:v:0", "-an", *encoder_args,
+        dst])
+
+
+def _verify(path, expected_frames, tolerance=1):
+    """
+    @brief 最後までエラーなくデコードでき、フレーム数が想定通りか
+    """
+    try:
+        subprocess.run(
+                    ["ffmpeg", "-v", "error", "-xerror", "-i", path, "-map", "0:v:0", "-f", "null", "-"],
+                    check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return abs(probe_frame_count(path) - expected_frames) <= tolerance
+    except (subprocess.CalledProcessError, ValueError):
+        return False
+
+
+def concat(segment_list, dst):
+    """
+    @brief 同じcodec・解像度の動画群を再エンコードせずに連結する
+    @param segment_list (list) 連結する動画のパス（連結する順）
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        for segment in segment_list:
+            f.write("file '{}'\n".format(os.path.abspath(segment).replace("'", r"'\''")))
+        list_path = f.name
+    try:
+        _run([
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", dst])
+    finally:
+        os.remove(list_path)
+
+
+def stream_copy_cut(src, start, end, dst, eps=1e-3):
+    """
+    @brief 指定の時間範囲の動画を、できるだけデコードせずに切り出す
+           最初のkeyframe以降はstream copyし、切り出し開始がGOPの途中の場合はその区間のみ
+           元動画と同じ設定で再エンコードして連結する
+           連結した動画は最後までデコードして確認し、不正な場合は削除してFalseを返す
+    @param start (float) 切り出し開始時間 [sec]
+    @param end (float) 切り出し終了時間 [sec]
+    @return (bool) 切り出せたか。Falseの場合は呼び出し元でデコード・再エンコードして切り出す
+    """
+    keyframes = probe_keyframes(src)
+    head_end = next((t for t in keyframes if t >= start - eps), None)
+
+    # 切り出し開始がkeyframe -> 全体をstream copy（終了側はkeyframeでなくてもcopyできる）
+    if head_end is not None and abs(head_end - start) <= eps:
+        _copy(src, start, end, dst)
+        return True
+
+    stream = probe_stream(src)
+    ext = os.path.splitext(dst)[1]
+    encoder_args = _encoder_args(stream, ext)
+    if encoder_args is None:
+        return False
+    num, _, den = str(stream.get("r_frame_rate", "0/1")).partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if head_end is None or head_end >= end - eps:
+            # 切り出し範囲にkeyframeがない -> 全体を再エンコード
+            _encode(src, start, end, dst, encoder_args)
+        else:
+            head = os.path.join(tmp_dir, "head" + ext)
+            body = os.path.join(tmp_dir, "body" + ext)
+            _encode(src, start, head_end, head, encoder_args)
+            _copy(src, head_end, end, body)
+            concat([head, body], dst)
+        if fps > 0 and not _verify(dst, int(round((end - start) * fps))):
+            os.remove(dst)
+            return False
+    return True
+
+
+class PipeWriter(object):
+    """
+    BGR のフレームを ffmpeg の標準入力に渡してエンコードする（cv2.VideoWriter と同じ write / release を持つ）
+    OpenCV の VideoWriter では指定できない encoder・ビットレートで書き出す場合に用いる
+    """
+
+    def __init__(self, dst, fps, size, encoder="libx264", bitrate=""):
+        """
+        @param fps (float) 書き出す動画のfps
+        @param size (tuple) (width, height) yuv420p で書き出すため偶数であること
+        @param bitrate (str) ビットレートの上限 (例: "2M")。空文字なら encoder の既定値
+        """
+        self.__size = tuple(size)
+        cmd = [
+                "ffmpeg", "-y", "-v", "error",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", "{}x{}".format(*size),
+                "-r", "{:.6f}".format(fps), "-i", "-",
+                "-an", "-c:v", encoder, "-pix_fmt", "yuv420p"]
+        if bitrate:
+            cmd += ["-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate]
+        self.__process = subprocess.Popen(cmd + [dst], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def isOpened(self):
+        return self.__process.poll() is None
+
+    def write(self, img):
+        if img.shape[1::-1] != self.__size:
+            print("[ffmpeg.py][ERROR]フレームの解像度が異なります: {} (書き出し: {})".format(img.shape[1::-1], self.__size))
+            raise Exception
+        self.__process.stdin.write(memoryview(np.ascontiguousarray(img)))
+
+    def release(self):
+        """標準入力を閉じ、エンコードの終了を待つ"""
+        if self.__process.stdin.closed:
+            return
+        self.__process.stdin.close()
+        stderr = self.__process.stderr.read()
+        if self.__process.wait() != 0:
+            print("[ffmpeg.py][ERROR]ffmpeg でのエンコードに失敗しました")
+            print(stderr.decode("utf-8", errors="replace"))
+            raise subprocess.CalledProcessError(self.__process.returncode, "ffmpeg")
@@ -4,21 +4,46 @@
 
 @author Shunsuke Hishida / created on 2021/06/04
 """
-import glob
 import os
 
 class FilePathGetter(object):
 
     @property
-    def file_list(self): return self.__file_list
+    def file_list(self):
+        if self.__file_list is None:
+            self.__file_list = list(self)
+        return self.__file_list
 
-    def __init__(self, dir_path, ext_list):
+    def __init__(self, dir_path, ext_list, recursive=False):
         """
         @param dir_path (str) 取得したいファイルが入ったディレクトリパス
         @param ext_list (list) 取得したいファイルの拡張子を入れたリスト
+        @param recursive (bool) サブディレクトリ内のファイルも取得するか
         """
-        self.__file_list = []
-        for ext in ext_list:
-            file_list = glob.glob(os.path.join(dir_path, "*.{}".format(ext)))
-            self.__file_list.extend(file_list)
-            
+        self.__dir_path = dir_path
+        self.__suffix_tuple = tuple(".{}".format(ext) for ext in ext_list)
+        self.__recursive = recursive
+        self.__file_list = None
+
+    def __iter__(self):
+        """
+        @brief ディレクトリを走査しながらファイルパスを1つずつ返す
+               （全ファイルの一覧を作らないため、大量のファイルがあっても走査しながら処理を始められる）
+        """
+        dir_stack = [self.__dir_path]
+        while dir_stack:
+            try:
+                entry_list = sorted(os.scandir(dir_stack.pop()), key=lambda entry: entry.name)
+            except OSError as e:
+                print("[file_manager.py][WARNING]ディレクトリを読み込めませんでした")
+                print(e)
+                continue
+            sub_dir_list = []
+            for entry in entry_list:
+                if entry.is_dir():
+                    if self.__recursive:
+                        sub_dir_list.append(entry.path)
+                elif entry.name.endswith(self.__suffix_tuple):
+                    yield entry.path
+            # 名前順に辿るため逆順に積む
+            dir_stack.extend(reversed(sub_dir_list))
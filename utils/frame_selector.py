@@ -0,0 +1,123 @@
+"""
+@file frame_selector.py
+@brief calibrationに有効なフレームを、画質とボードの位置・大きさ・傾きのばらつきから選ぶ
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import cv2
+import numpy as np
+
+
+class FrameSelector(object):
+
+    @property
+    def candidate_num(self): return len(self.__index_list)
+
+    def __init__(self, calculator, grid_num_tuple, detect_max_side=960, min_sharpness_ratio=0.3):
+        """
+        Constructor
+
+        @param calculator (CameraParamCalculator) ボードの検出に用いる
+        @param grid_num_tuple (tuple) ボードの制御点の数 CalculationParameters.grid_num_tuple
+        @param detect_max_side (int) 評価時に縮小する画像の長辺 [px]
+        @param min_sharpness_ratio (float) 鮮明度が候補の中央値のこの割合未満のフレームは選ばない
+        """
+        self.__calculator = calculator
+        self.__grid_num_tuple = grid_num_tuple
+        self.__detect_max_side = detect_max_side
+        self.__min_sharpness_ratio = min_sharpness_ratio
+        self.__index_list = []
+        self.__sharpness_list = []
+        self.__feature_list = []
+
+    def evaluate(self, index, img):
+        """
+        @brief フレームを評価し、ボード全体が写っていれば候補に加える
+        @param index (int) フレーム番号
+        @param img (numpy.ndarray) BGR画像
+        @return (bool) 候補に加えたか
+        """
+        scale = min(1.0, self.__detect_max_side / max(img.shape[:2]))
+        if scale < 1.0:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ret, corners = self.__calculator.find_board(img, scale)
+        if not ret:
+            return False
+        corners = corners.reshape(-1, 2)
+        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        self.__index_list.append(index)
+        self.__sharpness_list.append(self.__sharpness(gray_img, corners))
+        self.__feature_list.append(self.__pose_feature(corners, gray_img.shape))
+        return True
+
+    def __sharpness(self, gray_img, corners):
+        """ボード領域の Laplacian の分散（ブレ・ボケが大きいほど小さい）"""
+        x, y, w, h = cv2.boundingRect(corners.astype(np.float32))
+        roi = gray_img[y:y + h, x:x + w]
+        return float(cv2.Laplacian(roi, cv2.CV_64F).var())
+
+    def __pose_feature(self, corners, shape):
+        """
+        @brief ボードの 位置(x, y)・大きさ・傾き(横, 縦) を表す特徴量
+        @return (numpy.ndarray) 各要素がおおよそ 0 ~ 1 の範囲になるよう正規化した5次元ベクトル
+        """
+        height, width = shape
+        grid = corners.reshape(-1, self.__grid_num_tuple[0], 2)
+        top_left, top_right = grid[0, 0], grid[0, -1]
+        bottom_left, bottom_right = grid[-1, 0], grid[-1, -1]
+        quad = np.array([top_left, top_right, bottom_right, bottom_left], dtype=np.float32)
+        center = corners.mean(axis=0)
+        size = np.sqrt(abs(cv2.contourArea(quad)) / (width * height))
+        # 向かい合う辺の長さの比 -> 透視による傾き
+        tilt_x = self.__log_ratio(np.linalg.norm(top_left - bottom_left), np.linalg.norm(top_right - bottom_right))
+        tilt_y = self.__log_ratio(np.linalg.norm(top_left - top_right), np.linalg.norm(bottom_left - bottom_right))
+        return np.array([
+            center[0] / width,
+            center[1] / height,
+            size,
+            np.clip(tilt_x, -0.5, 0.5) + 0.5,
+            np.clip(tilt_y, -0.5, 0.5) + 0.5,
+        ])
+
+    @staticmethod
+    def __log_ratio(length_a, length_b):
+        """向かい合う辺の長さの比の対数。長さ0の辺がある（四隅が重なった）場合は傾きなし (0) とする"""
+        if length_a < 1e-6 or length_b < 1e-6:
+            return 0.0
+        return float(np.log(length_a / length_b))
+
+    def select(self, target_num):
+        """
+        @brief 候補から target_num 枚を選ぶ
+               選択済みのフレームから特徴量が最も離れたフレームを、鮮明度で重み付けしながら順に選ぶ
+               (似た位置・姿勢のフレームは選ばれにくくなる)
+        @return (list) 選んだフレーム番号の昇順リスト
+        """
+        if target_num <= 0 or not self.__index_list:
+            return []
+        sharpness = np.array(self.__sharpness_list)
+        features = np.array(self.__feature_list)
+        index_array = np.array(self.__index_list)
+
+        # 特徴量が NaN の候補は距離の比較を壊すため選ばない
+        valid = np.isfinite(features).all(axis=1) & np.isfinite(sharpness)
+        sharpness, features, index_array = sharpness[valid], features[valid], index_array[valid]
+        if not len(index_array):
+            return []
+        valid = sharpness >= self.__min_sharpness_ratio * np.median(sharpness)
+        sharpness, features, index_array = sharpness[valid], features[valid], index_array[valid]
+        if sharpness.max() > 0:
+            quality = sharpness / sharpness.max()
+        else:
+            # 全候補の鮮明度が0（真っ黒・全体がぼけたフレームなど）の場合は重み付けしない
+            quality = np.ones_like(sharpness)
+
+        selected = [int(np.argmax(quality))]
+        min_dist = np.linalg.norm(features - features[selected[0]], axis=1)
+        while len(selected) < min(target_num, len(index_array)):
+            score = min_dist * (0.5 + 0.5 * quality)
+            score[selected] = -1.0
+            best = int(np.argmax(score))
+            selected.append(best)
+            min_dist = np.minimum(min_dist, np.linalg.norm(features - features[best], axis=1))
+        return sorted(int(i) for i in index_array[selected])
@@ -0,0 +1,110 @@
+"""
+@file manifest.py
+@brief 処理済みファイルの記録（中断したバッチ処理の再開・処理済みファイルのスキップに用いる）
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import hashlib
+import json
+import os
+import time
+
+
+def make_digest(*values):
+    """
+    @brief 処理結果に影響するパラメータのhash
+    @param values JSONに変換できる値 or numpy.ndarray
+    """
+    sha = hashlib.sha1()
+    for value in values:
+        if hasattr(value, "tobytes"):
+            sha.update(value.tobytes())
+        else:
+            sha.update(json.dumps(value, sort_keys=True).encode("utf-8"))
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+class JobManifest(object):
+    """
+    manifest (json) の構成
+    {
+        "version": int,
+        "files": {src_path: {"size": int, "mtime_ns": int, "digest": str, "outputs": [str]}},
+    }
+    入力ファイルのサイズ・更新時刻、パラメータのhash が同じで出力ファイルが全て存在する場合、処理済みとみなす
+    """
+    VERSION = 1
+
+    @property
+    def skip_count(self): return self.__skip_count
+
+    def __init__(self, path, digest, save_interval=10.0):
+        """
+        Constructor
+
+        @param path (str) manifestファイルのパス
+        @param digest (str) 処理結果に影響するパラメータのhash make_digest()
+        @param save_interval (float) 処理済みの記録をファイルに書き出す間隔 [sec]
+        """
+        self.__path = path
+        self.__digest = digest
+        self.__save_interval = save_interval
+        self.__last_save = time.time()
+        self.__skip_count = 0
+        self.__load()
+
+    def __load(self):
+        self.__files = {}
+        if not os.path.isfile(self.__path):
+            return
+        try:
+            with open(self.__path, mode="r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print("[JobManifest]manifestを読み込めなかったため破棄します")
+            print(e)
+            return
+        if manifest.get("version") != self.VERSION:
+            return
+        self.__files = manifest["files"]
+
+    def is_done(self, src_path, output_list):
+        """
+        @param output_list (list) src_path を処理した場合の出力ファイルのパス
+        @return (bool) 処理済みで出力が最新か
+        """
+        record = self.__files.get(src_path)
+        if record is None or record["digest"] != self.__digest:
+            return False
+        stat = os.stat(src_path)
+        if record["size"] != stat.st_size or record["mtime_ns"] != stat.st_mtime_ns:
+            return False
+        if sorted(record["outputs"]) != sorted(output_list):
+            return False
+        if not all(os.path.isfile(output) for output in output_list):
+            return False
+        self.__skip_count += 1
+        return True
+
+    def mark_done(self, src_path, output_list):
+        """
+        @brief 処理済みとして記録する。前回の書き出しから save_interval 以上経過していればファイルに書き出す
+        """
+        stat = os.stat(src_path)
+        self.__files[src_path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": self.__digest,
+            "outputs": list(output_list),
+        }
+        if time.time() - self.__last_save >= self.__save_interval:
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.__path)), exist_ok=True)
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "files": self.__files}, f)
+        os.replace(tmp_path, self.__path)
+        self.__last_save = time.time()
@@ -0,0 +1,285 @@
+"""
+@file mosaic.py
+@brief 複数の動画を N x M に並べた動画を生成する
+       各動画は別スレッドでデコードし、使い回す出力画像（canvas）の該当領域へ直接書き込む
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from utils import ffmpeg
+from utils import profiler
+
+
+def open_writer(save_path, movie, size, preview=None):
+    """
+    @brief 並べた動画の書き出し先
+           preview で codec を指定し ffmpeg がある場合は ffmpeg で、それ以外は OpenCV で書き出す
+    @param movie (cv2.VideoCapture) fps・fourcc を引き継ぐ元動画
+    @param size (tuple) (width, height)
+    @param preview (PreviewParameters) Noneなら元動画と同じ fps・fourcc
+    @return (cv2.VideoWriter or ffmpeg.PipeWriter)
+    """
+    fourcc = int(movie.get(cv2.CAP_PROP_FOURCC))
+    fps = int(movie.get(cv2.CAP_PROP_FPS))
+    if preview is None:
+        return cv2.VideoWriter(save_path, fourcc, fps, size)
+    fps = movie.get(cv2.CAP_PROP_FPS) / preview.frame_step
+    if preview.codec and ffmpeg.is_available():
+        return ffmpeg.PipeWriter(save_path, fps, size, preview.codec, preview.bitrate)
+    if preview.fourcc:
+        fourcc = cv2.VideoWriter_fourcc(*preview.fourcc)
+    return cv2.VideoWriter(save_path, fourcc, fps, size)
+
+
+class TitleOverlay(object):
+    """
+    putText の結果を一度だけ描画し、以降のフレームには文字の領域のみ合成する
+    （毎フレーム putText でラスタライズするのを避ける）
+    """
+
+    def __init__(self, title, color=(255, 0, 0), org=(10, 30), font=cv2.FONT_HERSHEY_PLAIN,
+                 font_scale=1.5, thickness=2):
+        """
+        @param title (str) 描画する文字列
+        @param color (tuple) BGR
+        @param org (tuple) cv2.putText の org（文字列の左下）
+        """
+        (text_width, text_height), baseline = cv2.getTextSize(title, font, font_scale, thickness)
+        pad = thickness + 1
+        self.__x0 = max(0, org[0] - pad)
+        self.__y0 = max(0, org[1] - text_height - pad)
+        width = org[0] + text_width + pad - self.__x0
+        height = org[1] + baseline + pad - self.__y0
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.putText(mask, title, (org[0] - self.__x0, org[1] - self.__y0), font, font_scale, 255, thickness,
+                    cv2.LINE_AA)
+        alpha = mask.astype(np.float32)[..., None] / 255
+        self.__inv_alpha = 1 - alpha
+        self.__premultiplied = alpha * np.array(color, dtype=np.float32)
+
+    def apply(self, img):
+        """@brief img（のview）に文字列を合成する"""
+        roi = img[self.__y0:self.__y0 + self.__inv_alpha.shape[0], self.__x0:self.__x0 + self.__inv_alpha.shape[1]]
+        if roi.size == 0:
+            return
+        h, w = roi.shape[:2]
+        blended = roi * self.__inv_alpha[:h, :w] + self.__premultiplied[:h, :w]
+        np.copyto(roi, blended + 0.5, casting="unsafe")
+
+
+class MosaicCanvas(object):
+    """
+    1つの canvas を使い回し、与えた画像を tile の大きさに縮小して並べる（1スレッドから呼び出すこと）
+    """
+
+    def __init__(self, grid, tile_size, title_list=None, color=(255, 0, 0)):
+        """
+        @param grid (tuple) (rows, cols) 画像は左から右、上から下の順に並べる
+        @param tile_size (tuple) (width, height)
+        @param title_list (list) 各画像に描画する文字列
+        """
+        rows, cols = grid
+        tile_width, tile_height = tile_size
+        self.__canvas = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+        self.__view_list = [
+                            self.__canvas[r * tile_height:(r + 1) * tile_height, c * tile_width:(c + 1) * tile_width]
+                            for r in range(rows) for c in range(cols)]
+        self.__overlay_list = [TitleOverlay(str(title), color) if title else None for title in title_list or []]
+
+    def compose(self, img_list):
+        """
+        @return (numpy.ndarray) 並べた画像（次の compose で上書きされる）
+        """
+        for index, (img, view) in enumerate(zip(img_list, self.__view_list)):
+            resize_into(img, view)
+            if index < len(self.__overlay_list) and self.__overlay_list[index] is not None:
+                self.__overlay_list[index].apply(view)
+        return self.__canvas
+
+
+def resize_into(img, view):
+    """@brief img を view の大きさに拡大・縮小して書き込む（縮小は INTER_AREA）"""
+    tile_height, tile_width = view.shape[:2]
+    if img.shape[:2] == view.shape[:2]:
+        np.copyto(view, img)
+        return
+    interpolation = cv2.INTER_AREA if img.shape[1] > tile_width else cv2.INTER_LINEAR
+    cv2.resize(img, (tile_width, tile_height), dst=view, interpolation=interpolation)
+
+
+class MosaicEngine(object):
+    """
+    canvas を num_canvases 枚用意し、フレーム番号順に使い回す
+    各動画のデコードスレッドは、書き出し済みの canvas にのみ次のフレームを書き込む
+    """
+
+    @property
+    def frame_count(self): return self.__frame_count
+
+    def __init__(
+                self,
+                path_list,
+                grid,
+                save_path,
+                title_list=None,
+                tile_size=None,
+                column_major=False,
+                color=(255, 0, 0),
+                num_canvases=3,
+                preview=None):
+        """
+        Constructor
+
+        @param path_list (list) 動画のパス（並べる順）。None の位置は黒のまま
+        @param grid (tuple) (rows, cols)
+        @param save_path (str) 書き出す動画のパス
+        @param title_list (list) 各動画に描画する文字列（None・空文字なら描画しない）
+        @param tile_size (tuple) (width, height) 1動画あたりの大きさ。Noneなら1つ目の動画の解像度
+                                 解像度が異なる動画は tile_size に拡大・縮小する
+        @param column_major (bool) True -> 上から下に並べてから次の列へ、False -> 左から右に並べてから次の行へ
+        @param color (tuple) 文字列の色 (BGR)
+        @param num_canvases (int) 使い回す canvas の枚数（デコードを書き出しより何フレーム先行できるか）
+        @param preview (PreviewParameters) 有効な場合、出力を preview.width x preview.height に収まるよう縮小し、
+                                           preview.frame_step フレーム毎に書き出す（tile_size より優先）
+        """
+        rows, cols = grid
+        if len(path_list) > rows * cols:
+            print("[mosaic.py][ERROR]動画の数 ({}) が grid ({}x{}) に収まりません".format(len(path_list), rows, cols))
+            raise Exception
+        self.__path_list = list(path_list)
+        self.__title_list = list(title_list or [])
+        self.__grid = (rows, cols)
+        self.__save_path = save_path
+        self.__tile_size = tile_size
+        self.__column_major = column_major
+        self.__color = color
+        self.__num_canvases = max(2, num_canvases)
+        self.__preview = preview if preview is not None and preview.enable else None
+        self.__frame_step = self.__preview.frame_step if self.__preview is not None else 1
+        self.__frame_count = 0
+
+    def __tile_origin(self, index, tile_width, tile_height):
+        rows, cols = self.__grid
+        row, col = (index % rows, index // rows) if self.__column_major else divmod(index, cols)
+        return col * tile_width, row * tile_height
+
+    def run(self):
+        """
+        @brief いずれかの動画が終わるまで並べて書き出す
+        @return (int) 書き出したフレーム数
+        """
+        movie_list = [cv2.VideoCapture(path) if path else None for path in self.__path_list]
+        for path, movie in zip(self.__path_list, movie_list):
+            if movie is not None and not movie.isOpened():
+                print("[mosaic.py][ERROR]動画を開けませんでした: {}".format(path))
+                raise Exception
+        first = next(movie for movie in movie_list if movie is not None)
+        rows, cols = self.__grid
+        tile_width, tile_height = self.__tile_size or (
+            int(first.get(cv2.CAP_PROP_FRAME_WIDTH)), int(first.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        if self.__preview is not None:
+            # 並べてから縮小せず、各動画を縮小してから並べる
+            tile_width, tile_height = self.__preview.tile_size((tile_width, tile_height), self.__grid)
+        canvas_list = [np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+                       for _ in range(self.__num_canvases)]
+        writer = open_writer(self.__save_path, first, (cols * tile_width, rows * tile_height), self.__preview)
+
+        self.__condition = threading.Condition()
+        self.__written = 0                                  # 書き出し済みのフレーム数
+        self.__decoded = [0] * len(movie_list)              # 動画毎のデコード済みのフレーム数
+        self.__limit = float("inf")                         # 最も短い動画のフレーム数（終わるまでは不明）
+        self.__errors = [None] * len(movie_list)            # 動画毎のデコードスレッドで発生した例外
+        thread_list = []
+        for index, movie in enumerate(movie_list):
+            if movie is None:
+                continue
+            x, y = self.__tile_origin(index, tile_width, tile_height)
+            view_list = [canvas[y:y + tile_height, x:x + tile_width] for canvas in canvas_list]
+            title = self.__title_list[index] if index < len(self.__title_list) else None
+            overlay = TitleOverlay(str(title), self.__color) if title else None
+            thread = threading.Thread(target=self.__decode, args=(index, movie, view_list, overlay), daemon=True)
+            thread.start()
+            thread_list.append(thread)
+
+        active = [index for index, movie in enumerate(movie_list) if movie is not None]
+        try:
+            while True:
+                with self.__condition:
+                    while self.__written < self.__limit and min(self.__decoded[i] for i in active) <= self.__written:
+                        self.__condition.wait()
+                    if self.__written >= self.__limit:
+                        break
+                with profiler.stage("encode"):
+                    writer.write(canvas_list[self.__written % self.__num_canvases])
+                with self.__condition:
+                    self.__written += 1
+                    self.__condition.notify_all()
+        finally:
+            with self.__condition:
+                self.__limit = min(self.__limit, self.__written)
+                self.__condition.notify_all()
+            for thread in thread_list:
+                thread.join()
+            writer.release()
+            for movie in movie_list:
+                if movie is not None:
+                    movie.release()
+        for path, error in zip(self.__path_list, self.__errors):
+            if error is not None:
+                # 途中までの動画を正常に書き出したものとして扱わない
+                print("[mosaic.py][ERROR]デコード中に例外が発生しました: {}".format(path))
+                raise error
+        for path in self.__path_list:
+            if path:
+                profiler.add_file("decode", path)
+        profiler.add_file("encode", self.__save_path, written=True)
+        self.__frame_count = self.__written
+        return self.__frame_count
+
+    def __decode(self, index, movie, view_list, overlay):
+        """
+        @brief 1動画をデコードし、フレーム番号に対応する canvas の view に書き込む
+        """
+        tile_width, tile_height = view_list[0].shape[1], view_list[0].shape[0]
+        same_size = int(movie.get(cv2.CAP_PROP_FRAME_WIDTH)) == tile_width and \
+            int(movie.get(cv2.CAP_PROP_FRAME_HEIGHT)) == tile_height
+        frame_index = 0
+        try:
+            while True:
+                with self.__condition:
+                    # num_canvases フレーム前の canvas が書き出されるまで待つ
+                    while frame_index < self.__limit and frame_index - self.__written >= self.__num_canvases:
+                        self.__condition.wait()
+                    if frame_index >= self.__limit:
+                        return
+                view = view_list[frame_index % self.__num_canvases]
+                # 0, frame_step, 2 * frame_step, ... 番目のフレームを書き出す
+                # 書き出さないフレームは grab のみ行い、BGRへの変換を省く
+                with profiler.stage("decode"):
+                    if frame_index and not all(movie.grab() for _ in range(self.__frame_step - 1)):
+                        return
+                    # 解像度が同じ場合は canvas の view に直接デコードする
+                    ret, img = movie.read(view) if same_size else movie.read()
+                if not ret:
+                    return
+                if img is not view:
+                    with profiler.stage("resize"):
+                        resize_into(img, view)
+                if overlay is not None:
+                    with profiler.stage("overlay"):
+                        overlay.apply(view)
+                frame_index += 1
+                with self.__condition:
+                    self.__decoded[index] = frame_index
+                    self.__condition.notify_all()
+        except Exception as e:
+            self.__errors[index] = e
+        finally:
+            # 動画の終わり（もしくは例外）以降のフレームは書き出さない
+            with self.__condition:
+                self.__limit = min(self.__limit, frame_index)
+                self.__condition.notify_all()
@@ -6,6 +6,15 @@
 """
 import os
 
+# config ディレクトリを指定する環境変数（子プロセスにも引き継がれる）
+CONFIG_DIR_ENV = "CAMERA_CALIBRATION_CONFIG_DIR"
+
+def config_dir():
+    """
+    @return (str) config ディレクトリ。環境変数 CAMERA_CALIBRATION_CONFIG_DIR がなければ実行時のカレントディレクトリの config/
+    """
+    return os.environ.get(CONFIG_DIR_ENV) or os.path.join(os.getcwd(), "config")
+
 class ConfigPathMaker(object):
 
     @property
@@ -13,7 +22,7 @@ class ConfigPathMaker(object):
 
     def __init__(self, file_name, ext):
         """Constructor"""
-        dir_path = os.path.join(os.getcwd(), "config")
+        dir_path = config_dir()
         os.makedirs(dir_path, exist_ok=True)
         self.__path = os.path.join(dir_path, "{}.{}".format(file_name, ext))
 
@@ -25,10 +34,14 @@ class CalibedPathMaker(object):
     @property
     def path(self): return self.__path
 
-    def __init__(self, path, initial="calibrated"):
-        """Constructor"""
+    def __init__(self, path, initial="calibrated", sub_dir=""):
+        """
+        Constructor
+
+        @param sub_dir (str) after/ 内の保存先ディレクトリ（入力ディレクトリの構成を保つ場合）
+        """
         file_name, self.__ext = os.path.splitext(os.path.basename(path))
-        dir_path = os.path.join(os.getcwd(), "after")
+        dir_path = os.path.join(os.getcwd(), "after", sub_dir)
         os.makedirs(dir_path, exist_ok=True)
         self.__path = os.path.join(dir_path, "{}_{}{}".format(initial, file_name, self.__ext))
 
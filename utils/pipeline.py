@@ -0,0 +1,195 @@
+"""
+@file pipeline.py
+@brief 動画の デコード -> フレーム処理 -> エンコード をスレッドで並行に実行する
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import queue
+import threading
+import time
+
+from utils import profiler
+
+# 各stageの終了をqueueで伝えるための目印
+_END = object()
+
+
+class StageStats(object):
+
+    @property
+    def name(self): return self.__name
+
+    @property
+    def count(self): return self.__count
+
+    @property
+    def busy_time(self): return self.__busy_time
+
+    def __init__(self, name, num_threads=1):
+        """
+        Constructor
+
+        @param name (str) stage名
+        @param num_threads (int) stageを担当するスレッド数
+        """
+        self.__name = name
+        self.__num_threads = num_threads
+        self.__count = 0
+        self.__busy_time = 0.0
+        self.__lock = threading.Lock()
+
+    def add(self, elapsed):
+        with self.__lock:
+            self.__count += 1
+            self.__busy_time += elapsed
+
+    def occupancy(self, wall_time):
+        """
+        @brief stageが処理を行っていた時間の割合 (0.0 ~ 1.0)
+               1.0 に近いstageがボトルネック
+        """
+        if wall_time <= 0:
+            return 0.0
+        return self.__busy_time / (wall_time * self.__num_threads)
+
+
+class FramePipeline(object):
+
+    @property
+    def stats(self): return self.__stats
+
+    @property
+    def wall_time(self): return self.__wall_time
+
+    def __init__(self, process, num_workers=2, queue_size=16):
+        """
+        Constructor
+
+        @param process (function) フレームを受け取り処理結果を返す関数。複数スレッドから同時に呼ばれる
+        @param num_workers (int) フレーム処理を行うスレッド数
+        @param queue_size (int) stage間のqueueの上限。メモリ使用量はおおよそ queue_size * 2 フレーム分
+        """
+        self.__process = process
+        self.__num_workers = max(1, num_workers)
+        self.__queue_size = max(1, queue_size)
+        self.__stats = []
+        self.__wall_time = 0.0
+
+    def __put(self, q, item, stop_event):
+        """stop_event が立った場合は諦める（他のstageで例外が発生したとき）"""
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __decode(self, cap, in_queue, stats, stop_event, errors, max_frames):
+        try:
+            index = 0
+            while not stop_event.is_set() and (max_frames is None or index < max_frames):
+                start = time.perf_counter()
+                with profiler.stage("decode"):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                stats.add(time.perf_counter() - start)
+                if not self.__put(in_queue, (index, frame), stop_event):
+                    return
+                index += 1
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            for _ in range(self.__num_workers):
+                self.__put(in_queue, _END, stop_event)
+
+    def __work(self, in_queue, out_queue, stats, stop_event, errors):
+        try:
+            while not stop_event.is_set():
+                try:
+                    item = in_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                index, frame = item
+                start = time.perf_counter()
+                result = self.__process(frame)
+                stats.add(time.perf_counter() - start)
+                if not self.__put(out_queue, (index, result), stop_event):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            self.__put(out_queue, _END, stop_event)
+
+    def run(self, cap, write, max_frames=None):
+        """
+        @brief capから全フレームを読み出し、process を適用した結果をフレーム順に write へ渡す
+        @param cap (cv2.VideoCapture)
+        @param write (function) 処理結果を受け取る関数。呼び出し元のスレッドでフレーム順に呼ばれる
+        @param max_frames (int) 読み出すフレーム数の上限。Noneなら最後まで
+        @return (int) 書き出したフレーム数
+        """
+        decode_stats = StageStats("decode")
+        process_stats = StageStats("process", self.__num_workers)
+        write_stats = StageStats("write")
+        self.__stats = [decode_stats, process_stats, write_stats]
+
+        in_queue = queue.Queue(maxsize=self.__queue_size)
+        out_queue = queue.Queue(maxsize=self.__queue_size)
+        stop_event = threading.Event()
+        errors = []
+        threads = [threading.Thread(
+                                    target=self.__decode,
+                                    args=(cap, in_queue, decode_stats, stop_event, errors, max_frames),
+                                    daemon=True)]
+        for _ in range(self.__num_workers):
+            threads.append(threading.Thread(
+                                    target=self.__work,
+                                    args=(in_queue, out_queue, process_stats, stop_event, errors),
+                                    daemon=True))
+
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        # 処理の終わったフレームを一旦溜め、フレーム順に書き出す
+        pending = {}
+        next_index = 0
+        finished_workers = 0
+        try:
+            while finished_workers < self.__num_workers and not stop_event.is_set():
+                try:
+                    item = out_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    finished_workers += 1
+                    continue
+                index, result = item
+                pending[index] = result
+                while next_index in pending:
+                    start = time.perf_counter()
+                    write(pending.pop(next_index))
+                    write_stats.add(time.perf_counter() - start)
+                    next_index += 1
+        except BaseException:
+            stop_event.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            self.__wall_time = time.perf_counter() - start_time
+        if errors:
+            raise errors[0]
+        return next_index
+
+    def report(self):
+        """各stageの処理時間と占有率を表示"""
+        for stats in self.__stats:
+            print("[pipeline] {:<8} frames: {:>7}  busy: {:8.2f}s  occupancy: {:6.1%}".format(
+                stats.name, stats.count, stats.busy_time, stats.occupancy(self.__wall_time)))
@@ -0,0 +1,194 @@
+"""
+@file point_undistort.py
+@brief 画像全体ではなく、点群の座標のみをundistort・distortする
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import cv2
+import numpy as np
+
+from utils.calib_solver import distort_normalized
+
+# 反復によるundistortの終了条件
+UNDISTORT_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 20, 1e-9)
+# 格子点の2階差分から求めた2階微分の最大値に掛ける安全率（セル内での2階微分の変化の分）
+GRID_BOUND_SAFETY = 2.0
+
+
+class PointUndistorter(object):
+
+    @property
+    def grid_step(self):
+        """近似に用いる格子の間隔 [px]。格子を生成していなければNone"""
+        return self.__grid_step
+
+    @property
+    def grid_error(self):
+        """格子による近似の誤差の上限 [px]。格子を生成していなければNone"""
+        return self.__grid_error
+
+    def __init__(self, camera_matrix, distortion, new_camera_matrix=None):
+        """
+        Constructor
+
+        @param camera_matrix (numpy.ndarray) CalibrationMatrix.camera_matrix
+        @param distortion (numpy.ndarray) CalibrationMatrix.distortion
+        @param new_camera_matrix (numpy.ndarray) undistort後のカメラ行列。Noneなら元のカメラ行列
+                                                 Calibration で undistort した画像と同じ座標系になる
+        """
+        self.__camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.__distortion = np.asarray(distortion, dtype=np.float64).reshape(1, -1)
+        if new_camera_matrix is None:
+            new_camera_matrix = self.__camera_matrix
+        self.__new_camera_matrix = np.asarray(new_camera_matrix, dtype=np.float64)
+        self.__grid = None
+        self.__grid_step = None
+        self.__grid_error = None
+
+    def undistort(self, points):
+        """
+        @brief レンズ歪みのある画像上の座標 -> undistortした画像上の座標
+        @param points (numpy.ndarray) (..., 2)
+        @return (numpy.ndarray) points と同じshape
+        """
+        points = np.asarray(points, dtype=np.float64)
+        src = points.reshape(-1, 1, 2)
+        if hasattr(cv2, "undistortPointsIter"):
+            dst = cv2.undistortPointsIter(
+                                        src, self.__camera_matrix, self.__distortion,
+                                        None, self.__new_camera_matrix, UNDISTORT_CRITERIA)
+        else:
+            # OpenCV 5 以降は undistortPoints が criteria を受け取る
+            dst = cv2.undistortPoints(
+                                    src, self.__camera_matrix, self.__distortion,
+                                    R=None, P=self.__new_camera_matrix, criteria=UNDISTORT_CRITERIA)
+        return dst.reshape(points.shape)
+
+    def distort(self, points):
+        """
+        @brief undistortした画像上の座標 -> レンズ歪みのある画像上の座標（undistort の逆変換）
+        @param points (numpy.ndarray) (..., 2)
+        @return (numpy.ndarray) points と同じshape
+        """
+        points = np.asarray(points, dtype=np.float64)
+        flat = points.reshape(-1, 2)
+        new_cm = self.__new_camera_matrix
+        y = (flat[:, 1] - new_cm[1, 2]) / new_cm[1, 1]
+        x = (flat[:, 0] - new_cm[0, 2] - new_cm[0, 1] * y) / new_cm[0, 0]
+        xd, yd = distort_normalized(x, y, self.__distortion)
+        cm = self.__camera_matrix
+        dst = np.stack([cm[0, 0] * xd + cm[0, 1] * yd + cm[0, 2], cm[1, 1] * yd + cm[1, 2]], axis=-1)
+        return dst.reshape(points.shape)
+
+    def build_grid(self, img_size, max_error=0.01, max_step=64):
+        """
+        @brief undistort を近似するための格子を生成する
+               格子点でのみ undistort を計算し、格子点間は双線形補間する
+               誤差の上限が max_error 以下になるまで格子の間隔を半分にする
+               双線形補間の誤差の上限は 間隔^2 / 8 * (max|f_xx| + max|f_yy|) であり、
+               2階微分は格子点の2階差分に安全率 GRID_BOUND_SAFETY を掛けて求める
+        @param img_size (tuple) (width, height) 近似する範囲（範囲外の点は近似せずに undistort する）
+        @param max_error (float) 許容する誤差 [px]
+        @param max_step (int) 格子の間隔の初期値 [px]
+        @return (float) 近似の誤差の上限 [px]
+        """
+        step = max_step
+        while True:
+            self.__make_grid(img_size, step)
+            error = self.__grid_error_bound()
+            if error <= max_error or step <= 1:
+                break
+            step //= 2
+        if error > max_error:
+            print("[PointUndistorter][WARNING]格子の間隔を1pxにしても誤差の上限が {:.4f} px あります".format(error))
+        self.__grid_error = error
+        return error
+
+    def __make_grid(self, img_size, step):
+        width, height = img_size
+        # 画像の右端・下端を含むよう、格子点を1つ余分に置く
+        xs = np.arange(0, width - 1 + step, step, dtype=np.float64)
+        ys = np.arange(0, height - 1 + step, step, dtype=np.float64)
+        nodes = np.stack(np.meshgrid(xs, ys), axis=-1)
+        grid = self.undistort(nodes)
+        # セル毎の双線形補間の係数 c0 + tx * cx + ty * (cy + tx * cxy) を x, y 別に1次元で持つ
+        c0 = grid[:-1, :-1]
+        cx = grid[:-1, 1:] - c0
+        cy = grid[1:, :-1] - c0
+        cxy = grid[1:, 1:] - grid[1:, :-1] - cx
+        self.__coef = [[np.ascontiguousarray(c[..., axis]).ravel() for c in (c0, cx, cy, cxy)] for axis in range(2)]
+        self.__grid = grid
+        self.__grid_step = step
+        self.__grid_size = (width, height)
+
+    def __grid_error_bound(self):
+        """
+        @brief 双線形補間の誤差の上限
+               x, y 方向の2階差分の最大値 (= 間隔^2 * 2階微分) から成分毎に上限を求める
+               各セルの中心・各辺の中点で実測した誤差がそれを超える場合は実測値を用いる
+        """
+        grid = self.__grid
+        rows, cols = grid.shape[:2]
+        if rows < 3 or cols < 3:
+            # 2階差分を求められない（画像が格子の間隔に対して小さい）
+            return float("inf")
+        d2x = np.abs(grid[:, 2:] - 2 * grid[:, 1:-1] + grid[:, :-2]).max(axis=(0, 1))
+        d2y = np.abs(grid[2:] - 2 * grid[1:-1] + grid[:-2]).max(axis=(0, 1))
+        bound = float(np.linalg.norm(GRID_BOUND_SAFETY * (d2x + d2y) / 8))
+        return max(bound, self.__measure_grid_error())
+
+    def __measure_grid_error(self):
+        """
+        @brief 双線形補間の誤差が大きくなる、格子の各セルの中心と各辺の中点で実測した最大誤差
+               (undistort は滑らかなため、補間誤差はセル内でこれらの点の付近が最大となる)
+        """
+        rows, cols = self.__grid.shape[:2]
+        step = self.__grid_step
+        xs, ys = np.arange(cols) * step, np.arange(rows) * step
+        check_list = [
+            np.stack(np.meshgrid(xs[:-1] + step / 2, ys[:-1] + step / 2), axis=-1),    # セルの中心
+            np.stack(np.meshgrid(xs[:-1] + step / 2, ys), axis=-1),                    # 横の辺の中点
+            np.stack(np.meshgrid(xs, ys[:-1] + step / 2), axis=-1),                    # 縦の辺の中点
+        ]
+        points = np.concatenate([check.reshape(-1, 2) for check in check_list])
+        error = np.linalg.norm(self.__interpolate(points) - self.undistort(points), axis=1)
+        return float(error.max())
+
+    def __interpolate(self, points):
+        """格子の双線形補間（points は格子の範囲内であること）"""
+        rows, cols = self.__grid.shape[:2]
+        fx = points[:, 0] * (1.0 / self.__grid_step)
+        fy = points[:, 1] * (1.0 / self.__grid_step)
+        # 範囲内の点は非負のため、切り捨てで floor と等しくなる
+        ix = np.minimum(fx.astype(np.intp), cols - 2)
+        iy = np.minimum(fy.astype(np.intp), rows - 2)
+        tx = fx - ix
+        ty = fy - iy
+        cell = iy * (cols - 1) + ix
+        dst = np.empty((len(points), 2))
+        # 2次元の fancy indexing より1次元の take の方が大幅に速い
+        for axis in range(2):
+            c0, cx, cy, cxy = (coef.take(cell) for coef in self.__coef[axis])
+            dst[:, axis] = c0 + tx * cx + ty * (cy + tx * cxy)
+        return dst
+
+    def undistort_approx(self, points):
+        """
+        @brief build_grid で生成した格子による undistort の近似（誤差は grid_error 以下）
+               格子の範囲外の点は undistort で求める
+        @param points (numpy.ndarray) (..., 2)
+        @return (numpy.ndarray) points と同じshape
+        """
+        if self.__grid is None:
+            print("[PointUndistorter][ERROR]先に build_grid を呼んでください")
+            raise Exception
+        points = np.asarray(points, dtype=np.float64)
+        flat = points.reshape(-1, 2)
+        width, height = self.__grid_size
+        inside = (flat[:, 0] >= 0) & (flat[:, 0] <= width - 1) & (flat[:, 1] >= 0) & (flat[:, 1] <= height - 1)
+        if inside.all():
+            return self.__interpolate(flat).reshape(points.shape)
+        dst = np.empty_like(flat)
+        dst[inside] = self.__interpolate(flat[inside])
+        dst[~inside] = self.undistort(flat[~inside])
+        return dst.reshape(points.shape)
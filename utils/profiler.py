@@ -0,0 +1,315 @@
+"""
+@file profiler.py
+@brief 処理の stage（デコード・制御点検出・undistort・エンコード など）毎に
+       実時間・CPU時間・回数・読み書きしたバイト数・ピークメモリを計測し、json に書き出す
+       session を開始していない場合、stage などは何もしない（各スクリプトの --profile で開始する）
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+from contextlib import contextmanager, nullcontext
+import cProfile
+import datetime
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import util as mp_util
+
+try:
+    import resource
+except ImportError:     # Windows では ピークメモリ・子プロセスのCPU時間 を計測しない
+    resource = None
+
+VERSION = 1
+
+_NULL_STAGE = nullcontext()
+_state = {
+    "enabled": False,
+    "pid": None,            # session を開始したプロセス
+    "worker_dir": None,     # 子プロセスが計測結果を書き出すディレクトリ
+}
+
+
+class StageRecord(object):
+
+    @property
+    def count(self): return self.__count
+
+    @property
+    def wall_time(self): return self.__wall_time
+
+    @property
+    def cpu_time(self): return self.__cpu_time
+
+    def __init__(self):
+        """Constructor"""
+        self.__count = 0
+        self.__wall_time = 0.0
+        self.__cpu_time = 0.0
+        self.__bytes_read = 0
+        self.__bytes_written = 0
+        self.__peak_rss = 0
+
+    def add(self, wall_time=0.0, cpu_time=0.0, count=1, bytes_read=0, bytes_written=0, peak_rss=0):
+        self.__count += count
+        self.__wall_time += wall_time
+        self.__cpu_time += cpu_time
+        self.__bytes_read += bytes_read
+        self.__bytes_written += bytes_written
+        self.__peak_rss = max(self.__peak_rss, peak_rss)
+
+    def merge(self, record_dict):
+        """@param record_dict (dict) to_dict の戻り値（子プロセスの計測結果）"""
+        self.add(
+                record_dict["wall_time"],
+                record_dict["cpu_time"],
+                record_dict["count"],
+                record_dict["bytes_read"],
+                record_dict["bytes_written"],
+                int(record_dict["peak_rss_mb"] * 1024 * 1024))
+
+    def to_dict(self):
+        return {
+            "count": self.__count,
+            "wall_time": self.__wall_time,
+            "cpu_time": self.__cpu_time,
+            "bytes_read": self.__bytes_read,
+            "bytes_written": self.__bytes_written,
+            "peak_rss_mb": self.__peak_rss / 1024 / 1024,
+        }
+
+
+_record_dict = {}       # stage名 -> StageRecord
+_lock = threading.Lock()
+
+
+def _peak_rss(who=None):
+    """@return (int) ピークメモリ [byte]（resource がない場合は 0）"""
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # Linux は KB、macOS は byte
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _cpu_time(who=None):
+    if resource is None:
+        times = os.times()
+        return times.user + times.system
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def is_enabled():
+    return _state["enabled"]
+
+
+def add(name, wall_time=0.0, cpu_time=0.0, count=1, bytes_read=0, bytes_written=0):
+    """@brief stage の計測結果を加える（計測していない場合は何もしない）"""
+    if not _state["enabled"]:
+        return
+    peak_rss = _peak_rss()
+    with _lock:
+        record = _record_dict.get(name)
+        if record is None:
+            record = _record_dict[name] = StageRecord()
+        record.add(wall_time, cpu_time, count, bytes_read, bytes_written, peak_rss)
+
+
+def add_file(name, path, written=False):
+    """
+    @brief ファイルのサイズを stage の 読み込んだ（written=True なら書き出した）バイト数に加える
+    """
+    if not _state["enabled"]:
+        return
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    add(name, count=0, bytes_read=0 if written else size, bytes_written=size if written else 0)
+
+
+class _Stage(object):
+
+    def __init__(self, name, count, bytes_read, bytes_written):
+        self.__name = name
+        self.__count = count
+        self.__bytes_read = bytes_read
+        self.__bytes_written = bytes_written
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        self.__start_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        add(
+            self.__name,
+            time.perf_counter() - self.__start,
+            time.thread_time() - self.__start_cpu,
+            self.__count,
+            self.__bytes_read,
+            self.__bytes_written)
+        return False
+
+
+def stage(name, count=1, bytes_read=0, bytes_written=0):
+    """
+    @brief with で囲んだ処理を stage の1回として計測する
+           CPU時間は呼び出したスレッドのもの（複数スレッドで同じ stage を実行した場合は合計される）
+    @param count (int) 処理した数（フレーム数など）
+    """
+    if not _state["enabled"]:
+        return _NULL_STAGE
+    return _Stage(name, count, bytes_read, bytes_written)
+
+
+def _snapshot():
+    with _lock:
+        return {name: record.to_dict() for name, record in _record_dict.items()}
+
+
+def worker_state():
+    """
+    @brief 子プロセスで計測するために init_worker に渡す値（プロセスプールの initargs に加える）
+    @return (str or None) session を開始していない場合は None
+    """
+    return _state["worker_dir"] if _state["enabled"] else None
+
+
+def init_worker(state):
+    """
+    @brief プロセスプールの initializer から呼ぶ
+           子プロセスの計測結果は、プロセスの終了時に session のディレクトリへ書き出す
+    @param state (str or None) worker_state の戻り値
+    """
+    if state is None or os.getpid() == _state["pid"]:
+        # 計測しない、もしくは session を開始したプロセス自身で実行される場合
+        return
+    # fork で引き継いだ親プロセスの計測結果は破棄する
+    with _lock:
+        _record_dict.clear()
+    _state["enabled"] = True
+    _state["worker_dir"] = state
+    mp_util.Finalize(None, _flush_worker, exitpriority=100)
+
+
+def _flush_worker():
+    worker = {
+        "pid": os.getpid(),
+        "cpu_time": _cpu_time(),
+        "peak_rss_mb": _peak_rss() / 1024 / 1024,
+        "stages": _snapshot(),
+    }
+    path = os.path.join(_state["worker_dir"], "worker_{}.json".format(os.getpid()))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        json.dump(worker, f)
+    os.replace(tmp_path, path)
+
+
+def _collect_workers(worker_dir):
+    worker_list = []
+    for path in sorted(glob.glob(os.path.join(worker_dir, "worker_*.json"))):
+        try:
+            with open(path, mode="r", encoding="utf-8") as f:
+                worker_list.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print("[profiler.py][WARNING]子プロセスの計測結果を読み込めませんでした: {}".format(path))
+            print(e)
+    return worker_list
+
+
+def add_arguments(parser):
+    """@brief --profile / --cprofile を argparse に追加する"""
+    parser.add_argument("--profile", metavar="JSON", default="",
+                        help="stage 毎の実時間・CPU時間・回数・読み書きしたバイト数・ピークメモリを json に書き出す")
+    parser.add_argument("--cprofile", metavar="PROF", default="",
+                        help="cProfile の結果を書き出す（pstats / snakeviz で確認する。計測するのは起動したプロセスのみ）")
+
+
+@contextmanager
+def session(report_path="", cprofile_path="", name=""):
+    """
+    @brief with で囲んだ処理を計測し、終了時に report_path へ json を書き出す
+           report_path・cprofile_path のどちらも空の場合は何もしない
+    @param report_path (str) 計測結果の json のパス
+    @param cprofile_path (str) cProfile の結果のパス
+    @param name (str) 計測したスクリプト名
+    """
+    if not report_path and not cprofile_path:
+        yield
+        return
+    worker_dir = tempfile.mkdtemp(prefix="profile_")
+    with _lock:
+        _record_dict.clear()
+    _state.update(enabled=bool(report_path), pid=os.getpid(), worker_dir=worker_dir)
+    started_at = datetime.datetime.now().isoformat(timespec="seconds")
+    start = time.perf_counter()
+    start_cpu = _cpu_time()
+    profile = cProfile.Profile() if cprofile_path else None
+    if profile is not None:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(cprofile_path)
+            print("[profiler.py]cProfile の結果を保存: {}".format(cprofile_path))
+        wall_time = time.perf_counter() - start
+        _state["enabled"] = False
+        if report_path:
+            _write_report(report_path, name, started_at, wall_time, _cpu_time() - start_cpu, worker_dir)
+        shutil.rmtree(worker_dir, ignore_errors=True)
+        _state.update(pid=None, worker_dir=None)
+
+
+def _write_report(report_path, name, started_at, wall_time, cpu_time, worker_dir):
+    stage_dict = {}
+    for stage_name, record_dict in _snapshot().items():
+        stage_dict.setdefault(stage_name, StageRecord()).merge(record_dict)
+    worker_list = _collect_workers(worker_dir)
+    for worker in worker_list:
+        for stage_name, record_dict in worker["stages"].items():
+            stage_dict.setdefault(stage_name, StageRecord()).merge(record_dict)
+    children = resource.RUSAGE_CHILDREN if resource is not None else None
+    report = {
+        "version": VERSION,
+        "script": name or os.path.basename(sys.argv[0]),
+        "argv": sys.argv[1:],
+        "started_at": started_at,
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "children_cpu_time": _cpu_time(children) if children is not None else None,
+        "peak_rss_mb": _peak_rss() / 1024 / 1024,
+        "children_peak_rss_mb": _peak_rss(children) / 1024 / 1024 if children is not None else None,
+        "stages": {stage_name: record.to_dict() for stage_name, record in stage_dict.items()},
+        "workers": [{key: worker[key] for key in ("pid", "cpu_time", "peak_rss_mb")} for worker in worker_list],
+    }
+    save_dir = os.path.dirname(report_path)
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    with open(report_path, mode="w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_report(report)
+    print("[profiler.py]計測結果を保存: {}".format(report_path))
+
+
+def print_report(report):
+    """@brief 計測結果を 実時間の長い stage から順に表示する"""
+    print("[profiler] wall: {:.2f}s  cpu: {:.2f}s  peak rss: {:.0f}MB  workers: {}".format(
+        report["wall_time"], report["cpu_time"], report["peak_rss_mb"], len(report["workers"])))
+    stage_list = sorted(report["stages"].items(), key=lambda item: item[1]["wall_time"], reverse=True)
+    for stage_name, record in stage_list:
+        print("[profiler] {:<24} count: {:>8}  wall: {:>9.2f}s  cpu: {:>9.2f}s  read: {:>8.1f}MB  write: {:>8.1f}MB".format(
+            stage_name,
+            record["count"],
+            record["wall_time"],
+            record["cpu_time"],
+            record["bytes_read"] / 1024 / 1024,
+            record["bytes_written"] / 1024 / 1024))
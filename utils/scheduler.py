@@ -0,0 +1,171 @@
+"""
+@file scheduler.py
+@brief 複数ファイルの処理をプロセスプールで並行に実行する
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import itertools
+import os
+import traceback
+
+from tqdm import tqdm
+
+
+class Job(object):
+
+    @property
+    def path(self): return self.__path
+
+    @property
+    def memory(self): return self.__memory
+
+    @property
+    def cost(self): return self.__cost
+
+    def __init__(self, path, memory, cost):
+        """
+        Constructor
+
+        @param path (str) 処理するファイルのパス
+        @param memory (int) 処理に必要なメモリの見積もり [byte]
+        @param cost (float) 処理時間の見積もり（相対値）。大きいものから先に実行する
+        """
+        self.__path = path
+        self.__memory = memory
+        self.__cost = cost
+
+
+class JobResult(object):
+
+    @property
+    def path(self): return self.__path
+
+    @property
+    def error(self): return self.__error
+
+    @property
+    def succeeded(self): return self.__error is None
+
+    def __init__(self, path, error=None):
+        """
+        @param error (str) 失敗した場合のエラー内容
+        """
+        self.__path = path
+        self.__error = error
+
+
+def _run_job(func, path):
+    """例外を送出せずに JobResult として返す（1つの失敗で全体を止めないため）"""
+    try:
+        func(path)
+        return JobResult(path)
+    except Exception:
+        return JobResult(path, traceback.format_exc())
+
+
+class JobScheduler(object):
+
+    def __init__(self, num_workers=0, memory_budget_mb=4096, initializer=None, initargs=(), lookahead=0):
+        """
+        Constructor
+
+        @param num_workers (int) 同時に実行するプロセス数 0: CPU数, 1: 呼び出し元のプロセスで順に実行
+        @param memory_budget_mb (int) 同時に実行するjobの見積もりメモリの合計の上限 [MB]
+        @param initializer (function) 各プロセスの開始時に1回呼ばれる関数
+        @param initargs (tuple) initializer の引数
+        @param lookahead (int) run に iterator を渡した場合に先読みするjob数 0: 同時に実行するプロセス数の4倍（16以上）
+        """
+        self.__num_workers = num_workers or os.cpu_count()
+        self.__memory_budget = memory_budget_mb * 1024 * 1024
+        self.__initializer = initializer
+        self.__initargs = initargs
+        self.__lookahead = lookahead or max(16, 4 * self.__num_workers)
+
+    def run(self, jobs, func, callback=None):
+        """
+        @brief 処理時間の見積もりが大きいjobから順に実行する
+               実行中のjobの見積もりメモリの合計が上限を超える場合は、他のjobの終了を待ってから開始する
+        @param jobs (list or iterator) Job のリスト、もしくは Job を順に返す iterator
+                    iterator の場合は全て取り出すのを待たずに実行を始め、先読みした lookahead 件の中で見積もりが大きい順に実行する
+                    （ディレクトリを走査しながら、見つけたファイルから処理する）
+        @param func (function) ファイルパスを受け取り処理する関数（pickle可能であること）
+        @param callback (function) jobの終了毎に JobResult を引数として呼び出し元のプロセスで呼ばれる関数
+        @return (list) JobResult のリスト（終了した順）
+        """
+        if isinstance(jobs, (list, tuple)):
+            pending = sorted(jobs, key=lambda job: job.cost, reverse=True)
+            job_iter = iter(())
+            progress = tqdm(total=len(pending))
+        else:
+            pending = []
+            job_iter = iter(jobs)
+            progress = tqdm()
+        result_list = []
+        if self.__num_workers <= 1:
+            if self.__initializer is not None:
+                self.__initializer(*self.__initargs)
+            while self.__fill(pending, job_iter) or pending:
+                job = pending.pop(0)
+                self.__add_result(result_list, _run_job(func, job.path), progress, callback)
+            progress.close()
+            self.report(result_list)
+            return result_list
+
+        with ProcessPoolExecutor(
+                                max_workers=self.__num_workers,
+                                initializer=self.__initializer,
+                                initargs=self.__initargs) as executor:
+            running = {}    # future -> Job
+            while self.__fill(pending, job_iter) or pending or running:
+                # メモリの上限と同時実行数の範囲で開始できるjobを開始する
+                used_memory = sum(job.memory for job in running.values())
+                while pending and len(running) < self.__num_workers:
+                    job = next((job for job in pending if used_memory + job.memory <= self.__memory_budget), None)
+                    if job is None:
+                        if running:
+                            break
+                        # 単独でも上限を超えるjobは、他に実行中のjobがないときに実行する
+                        job = pending[0]
+                    pending.remove(job)
+                    running[executor.submit(_run_job, func, job.path)] = job
+                    used_memory += job.memory
+                    self.__fill(pending, job_iter)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        # workerプロセスが異常終了した場合など
+                        result = JobResult(job.path, traceback.format_exc())
+                    self.__add_result(result_list, result, progress, callback)
+        progress.close()
+        self.report(result_list)
+        return result_list
+
+    def __fill(self, pending, job_iter):
+        """
+        @brief pending が lookahead 件になるまで job_iter から取り出し、見積もりが大きい順に並べ直す
+        @return (bool) 取り出したjobがあるか
+        """
+        added = list(itertools.islice(job_iter, max(0, self.__lookahead - len(pending))))
+        if added:
+            pending.extend(added)
+            pending.sort(key=lambda job: job.cost, reverse=True)
+        return bool(added)
+
+    def __add_result(self, result_list, result, progress, callback):
+        result_list.append(result)
+        if callback is not None:
+            callback(result)
+        progress.update(1)
+        if not result.succeeded:
+            progress.write("[ERROR]{}\n{}".format(result.path, result.error))
+        progress.set_postfix(error=sum(not r.succeeded for r in result_list))
+
+    def report(self, result_list):
+        error_list = [result for result in result_list if not result.succeeded]
+        print("処理完了: {}件, 失敗: {}件".format(len(result_list) - len(error_list), len(error_list)))
+        for result in error_list:
+            print("  [ERROR]{}".format(result.path))
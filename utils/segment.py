@@ -0,0 +1,115 @@
+"""
+@file segment.py
+@brief 長い動画を区間（フレーム範囲）に分けて処理するための区間の決定と、処理済み区間の記録
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+import json
+import os
+
+from utils import ffmpeg
+
+
+def plan_segments(frame_num, fps, segment_sec, keyframe_list=None):
+    """
+    @brief 動画を segment_sec 程度の区間に分ける
+           keyframe の時刻が分かる場合は、区間の先頭が keyframe になるよう区間を伸ばす（シークでデコードし直す量を減らす）
+    @param frame_num (int) 動画の総フレーム数
+    @param fps (float)
+    @param segment_sec (float) 1区間の長さの目安 [sec]
+    @param keyframe_list (list) keyframe の時刻 [sec]
+    @return (list) (開始フレーム, 終了フレーム) のリスト（終了フレームは含まない）
+    """
+    target = max(1, int(round(segment_sec * fps)))
+    keyframe_frames = sorted({int(round(t * fps)) for t in keyframe_list or []})
+    segment_list = []
+    start = 0
+    while start < frame_num:
+        end = start + target
+        if keyframe_frames:
+            end = next((frame for frame in keyframe_frames if frame >= end), frame_num)
+        end = min(end, frame_num)
+        # 末尾に短い区間が残る場合は直前の区間に含める
+        if frame_num - end < target // 4:
+            end = frame_num
+        segment_list.append((start, end))
+        start = end
+    return segment_list
+
+
+def probe_keyframe_list(path):
+    """
+    @return (list) keyframe の時刻 [sec]。ffprobe がない・失敗した場合は空のリスト
+    """
+    if not ffmpeg.is_available():
+        return []
+    try:
+        return ffmpeg.probe_keyframes(path)
+    except Exception as e:
+        print("[segment.py][WARNING]keyframe を取得できませんでした: {}".format(path))
+        print(e)
+        return []
+
+
+class SegmentCheckpoint(object):
+    """
+    区間毎の処理済みの記録 (json)
+    {
+        "version": int,
+        "source": {"size": int, "mtime_ns": int},
+        "digest": str,
+        "segments": [[start, end], ...],
+        "done": [区間の番号, ...],
+    }
+    元動画・パラメータ・区間の分け方のいずれかが変わった場合は記録を破棄する
+    """
+    VERSION = 1
+
+    def __init__(self, path, src_path, digest, segment_list):
+        """
+        Constructor
+
+        @param path (str) 記録ファイルのパス
+        @param src_path (str) 元動画のパス
+        @param digest (str) 処理結果に影響するパラメータのhash
+        @param segment_list (list) plan_segments の戻り値
+        """
+        self.__path = path
+        stat = os.stat(src_path)
+        self.__record = {
+            "version": self.VERSION,
+            "source": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "digest": digest,
+            "segments": [list(segment) for segment in segment_list],
+            "done": [],
+        }
+        self.__load()
+
+    def __load(self):
+        if not os.path.isfile(self.__path):
+            return
+        try:
+            with open(self.__path, mode="r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            print("[SegmentCheckpoint]記録を読み込めなかったため破棄します")
+            print(e)
+            return
+        if all(record.get(key) == self.__record[key] for key in ("version", "source", "digest", "segments")):
+            self.__record["done"] = sorted(set(record.get("done", [])))
+
+    def is_done(self, index, output_list):
+        """
+        @param output_list (list) 区間の出力ファイルのパス
+        @return (bool) 処理済みで出力が存在するか
+        """
+        return index in self.__record["done"] and all(os.path.isfile(output) for output in output_list)
+
+    def mark_done(self, index):
+        """@brief 処理済みとして記録し、すぐにファイルへ書き出す（中断しても次回はこの区間から再開しない）"""
+        if index not in self.__record["done"]:
+            self.__record["done"].append(index)
+        tmp_path = self.__path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump(self.__record, f)
+        os.replace(tmp_path, self.__path)
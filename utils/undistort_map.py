@@ -0,0 +1,185 @@
+"""
+@file undistort_map.py
+@brief undistort用のremapテーブルを生成・保持する
+
+@author Shunsuke Hishida / created on 2026/10/18
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import zipfile
+
+import cv2
+import numpy as np
+
+# yamlで指定する補間方法とOpenCVのフラグの対応
+INTERPOLATION_DICT = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "lanczos4": cv2.INTER_LANCZOS4,
+}
+
+
+def make_map_key(size, camera_matrix, distortion, new_camera_matrix):
+    """
+    @brief remapテーブルを一意に識別するkeyを生成
+    @param size (tuple) (width, height)
+    @return key (str) 解像度とcalibration paramから算出したhash
+    """
+    sha = hashlib.sha1()
+    sha.update("{}x{}".format(*size).encode("utf-8"))
+    for array in (camera_matrix, distortion, new_camera_matrix):
+        sha.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+class UndistortMap(object):
+
+    @property
+    def key(self): return self.__key
+
+    @property
+    def size(self): return self.__size
+
+    @property
+    def map1(self): return self.__map1
+
+    @property
+    def map2(self): return self.__map2
+
+    @property
+    def nbytes(self): return self.__map1.nbytes + self.__map2.nbytes
+
+    def __init__(self, key, size, map1, map2):
+        """
+        Constructor
+
+        @param key (str) make_map_keyで算出したkey
+        @param size (tuple) (width, height)
+        @param map1 (numpy.ndarray) CV_16SC2 の固定小数点map
+        @param map2 (numpy.ndarray) CV_16UC1 の補間テーブルindex
+        """
+        self.__key = key
+        self.__size = tuple(size)
+        self.__map1 = map1
+        self.__map2 = map2
+
+    @classmethod
+    def build(cls, size, camera_matrix, distortion, new_camera_matrix):
+        """initUndistortRectifyMap で固定小数点のmapを生成"""
+        map1, map2 = cv2.initUndistortRectifyMap(
+                                                camera_matrix,
+                                                distortion,
+                                                None,
+                                                new_camera_matrix,
+                                                size,
+                                                cv2.CV_16SC2)
+        key = make_map_key(size, camera_matrix, distortion, new_camera_matrix)
+        return cls(key, size, map1, map2)
+
+    @classmethod
+    def load(cls, path, key):
+        """
+        @brief 保存済みのmapを読み込む
+        @return (UndistortMap or None) keyが一致しない場合はNone
+        """
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if str(data["key"]) != key:
+                    return None
+                return cls(key, tuple(data["size"]), data["map1"], data["map2"])
+        except (OSError, ValueError, zipfile.BadZipFile, KeyError) as e:
+            print("[undistort_map.py][WARNING]保存済みのmapを読み込めなかったため生成し直します: {}".format(path))
+            print(e)
+            return None
+
+    def save(self, path):
+        """
+        一時ファイルに書き出してから置き換える
+        （複数プロセスが同じmapを同時に書き出しても、書きかけのファイルを読まないようにする）
+        """
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, mode="wb") as f:
+            np.savez(
+                f,
+                key=self.__key,
+                size=np.array(self.__size),
+                map1=self.__map1,
+                map2=self.__map2,
+                )
+        os.replace(tmp_path, path)
+
+    def remap(self, img, interpolation=cv2.INTER_LINEAR):
+        return cv2.remap(img, self.__map1, self.__map2, interpolation)
+
+
+class UndistortMapCache(object):
+    """
+    remapテーブルを key（解像度・calibration param）毎に保持する
+    保持するテーブルの合計が max_bytes を超えた場合は、最も長く使われていないものから破棄する
+    """
+
+    @property
+    def nbytes(self): return self.__nbytes
+
+    def __init__(self, save_dir=None, max_bytes=0):
+        """
+        Constructor
+
+        @param save_dir (str) mapを書き出すディレクトリ。Noneならファイルには保存しない
+        @param max_bytes (int) 保持するremapテーブルの合計サイズの上限 [byte]。0なら上限なし
+        """
+        self.__save_dir = save_dir
+        self.__max_bytes = max_bytes
+        self.__maps = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = threading.Lock()
+
+    def _map_path(self, size, key):
+        # 同じ解像度の別カメラのmapで上書きし合わないよう、keyの先頭をファイル名に含める
+        return os.path.join(self.__save_dir, "calibration_map_{}x{}_{}.npz".format(*size, key[:12]))
+
+    def get(self, size, camera_matrix, distortion, new_camera_matrix=None):
+        """
+        @brief 解像度とcalibration paramに対応するremapテーブルを取得する
+               キャッシュになければ生成（save_dirがあればファイルから読み込み）する
+        @param size (tuple) (width, height)
+        @return (UndistortMap)
+        """
+        if new_camera_matrix is None:
+            new_camera_matrix = camera_matrix
+        key = make_map_key(size, camera_matrix, distortion, new_camera_matrix)
+        # 複数スレッドから同時に呼ばれても生成は一度だけにする
+        with self.__lock:
+            undistort_map = self.__maps.get(key)
+            if undistort_map is not None:
+                self.__maps.move_to_end(key)
+                return undistort_map
+            if self.__save_dir is not None:
+                undistort_map = UndistortMap.load(self._map_path(size, key), key)
+            if undistort_map is None:
+                undistort_map = UndistortMap.build(size, camera_matrix, distortion, new_camera_matrix)
+                if self.__save_dir is not None:
+                    os.makedirs(self.__save_dir, exist_ok=True)
+                    undistort_map.save(self._map_path(size, key))
+            self.__maps[key] = undistort_map
+            self.__nbytes += undistort_map.nbytes
+            self.__evict()
+        return undistort_map
+
+    def __evict(self):
+        """上限を超えた分を古いものから破棄する（直前に追加したものは残す）"""
+        if not self.__max_bytes:
+            return
+        while self.__nbytes > self.__max_bytes and len(self.__maps) > 1:
+            _, undistort_map = self.__maps.popitem(last=False)
+            self.__nbytes -= undistort_map.nbytes
+
+    def clear(self):
+        with self.__lock:
+            self.__maps.clear()
+            self.__nbytes = 0